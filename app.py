@@ -1,13 +1,27 @@
+import os
+import time
+from functools import wraps
 import streamlit as st
 import pandas as pd
 from datetime import datetime
 from binance_client_web import BinanceClient
 from technical_analyzer_web import TechnicalAnalyzer
-
-# Configuración idéntica a tu config.py
+from metrics_web import METRICS, start_metrics_server, register_route
+from order_book_web import DepthAnalyzer
+from market_universe_web import screen_tickers
+from signal_journal_web import get_journal, build_entry
+from shared_cache_web import get_shared_cache, candle_close_expiry, next_candle_close, CLOSE_GRACE
+from candle_integrity_web import start_integrity_audit, MISSING
+from risk_simulation_web import simulate_levels, warm_up as warm_up_simulation
+from regime_web import detect_regime, cached_regime, describe_regime, PRIORITY, RANGING, UNKNOWN
+from arrow_export_web import (ARROW_AVAILABLE, IPC_CONTENT_TYPE, ohlcv_table, indicator_table, from_ipc_stream,
+                              scan_table, to_ipc_stream, export_analysis, write_scan, register_arrow_routes,
+                              EXPORT_DIR)
+
+# Lista de respaldo si no se puede cargar el universo desde Binance
 CRYPTO_SYMBOLS = [
     "BTC/USDT", "ETH/USDT", "BNB/USDT", "ADA/USDT", "XRP/USDT",
-    "SOL/USDT", "DOT/USDT", "DOGE/USDT", "AVAX/USDT", "MATIC/USDT",
+    "SOL/USDT", "DOT/USDT", "DOGE/USDT", "AVAX/USDT", "POL/USDT",
     "LTC/USDT", "LINK/USDT", "GALA/USDT", "ATOM/USDT", "UNI/USDT",
     "XLM/USDT", "ALGO/USDT", "VET/USDT", "FIL/USDT", "ETC/USDT"
 ]
@@ -21,20 +35,52 @@ TIMEFRAMES = {
     "1 mes": "1M"
 }
 
+# Segundos entre refrescos del ticker de precio de la página de análisis
+TICKER_REFRESH = int(os.environ.get('TICKER_REFRESH', 10))
+
+# Vida máxima del análisis memorizado en la sesión: en 1d/1w/1M la vela tarda días en cerrar
+ANALYSIS_MAX_AGE = float(os.environ.get('ANALYSIS_MAX_AGE', 300))
+
+
+def fragment(run_every=None):
+    """st.fragment re-ejecuta solo la función decorada (interacciones o run_every);
+    en versiones de Streamlit sin fragments la función se ejecuta con la página.
+    Cada re-ejecución del fragment es su propia traza (en la página completa, un span)"""
+    decorator = getattr(st, 'fragment', None) or getattr(st, 'experimental_fragment', None)
+
+    def wrap(func):
+        @wraps(func)
+        def traced(*args, **kwargs):
+            with METRICS.trace('fragment', fragment=func.__name__):
+                return func(*args, **kwargs)
+        return decorator(run_every=run_every)(traced) if decorator is not None else traced
+    return wrap
+
 
 def main():
     st.title("📊 Analizador de Criptomonedas - Binance")
+    start_metrics_server()
+    register_arrow_routes(register_route)
+    start_integrity_audit(EXPORT_DIR)
+    if 'simulation_ready' not in st.session_state:
+        warm_up_simulation()
+        st.session_state.simulation_ready = True
 
     if 'binance' not in st.session_state:
         st.session_state.binance = BinanceClient()
     if 'current_page' not in st.session_state:
         st.session_state.current_page = "analysis"
+    if 'symbols' not in st.session_state:
+        st.session_state.symbols = st.session_state.binance.get_usdt_symbols() or CRYPTO_SYMBOLS
+    symbols = st.session_state.symbols
 
     # Sidebar
     with st.sidebar:
         st.header("Configuración de Análisis")
-        selected_crypto = st.selectbox("Criptomoneda:", CRYPTO_SYMBOLS)
+        default_index = symbols.index("BTC/USDT") if "BTC/USDT" in symbols else 0
+        selected_crypto = st.selectbox("Criptomoneda:", symbols, index=default_index)
         selected_timeframe = st.selectbox("Timeframe:", list(TIMEFRAMES.keys()))
+        order_size = st.number_input("Tamaño de orden (USDT):", min_value=10.0, value=1000.0, step=100.0)
 
         col1, col2 = st.columns(2)
         with col1:
@@ -42,56 +88,397 @@ def main():
         with col2:
             entry_btn = st.button("📈 Entrada", use_container_width=True)
 
-    # Navegación entre páginas
+        top_n = st.slider("Candidatos del escáner:", min_value=5, max_value=50, value=15, step=5)
+        skip_ranging = st.checkbox("Omitir mercados laterales", value=True)
+        scan_btn = st.button("🔎 Escanear mercado", use_container_width=True)
+        journal_btn = st.button("📚 Diario de señales", use_container_width=True)
+
+    # Navegación entre páginas: los botones solo cambian de página, cada página se pinta una vez
     if analyze_btn:
         st.session_state.current_page = "analysis"
-        perform_analysis(selected_crypto, selected_timeframe)
+        st.session_state.analysis_request = (selected_crypto, selected_timeframe, order_size)
+        # Pulsar Analizar fuerza datos nuevos aunque la vela en curso no haya cerrado: ni el memo
+        # de la sesión ni las velas y el análisis de la caché compartida
+        refresh_key = (selected_crypto, TIMEFRAMES[selected_timeframe])
+        st.session_state.setdefault('analysis_memo', {}).pop(refresh_key, None)
+        st.session_state.analysis_refresh = refresh_key
+
+    if scan_btn:
+        st.session_state.current_page = "scanner"
+        with METRICS.trace('scanner', timeframe=selected_timeframe):
+            with METRICS.timer('page_render_seconds', page='scanner'):
+                st.session_state.scan_results = perform_market_scan(symbols, selected_timeframe, top_n, skip_ranging)
 
     if entry_btn:
         st.session_state.current_page = "entry"
-        show_entry_management()
-
-    # Mostrar página actual
-    if st.session_state.current_page == "entry":
-        show_entry_management()
 
+    if journal_btn:
+        st.session_state.current_page = "journal"
 
-def perform_analysis(symbol, timeframe):
-    st.header(f"Análisis de {symbol} - {timeframe}")
+    # Mostrar página actual
+    page = st.session_state.current_page
+    if page == "analysis" and st.session_state.get('analysis_request'):
+        symbol, timeframe, size = st.session_state.analysis_request
+        with METRICS.trace('analysis', symbol=symbol, timeframe=timeframe):
+            with METRICS.timer('page_render_seconds', page='analysis'):
+                perform_analysis(symbol, timeframe, size)
+    elif page == "scanner" and st.session_state.get('scan_results'):
+        show_scan_results(st.session_state.scan_results)
+    elif page == "entry":
+        render_entry_page()
+    elif page == "journal":
+        show_signal_journal()
+
+
+def render_entry_page():
+    with METRICS.trace('entry'):
+        with METRICS.timer('page_render_seconds', page='entry'):
+            show_entry_management()
+
+
+def _indicators_key(df, symbol, binance_timeframe):
+    return f"indicators:{symbol}:{binance_timeframe}:{len(df)}:{df['timestamp'].iloc[-1].value}"
+
+
+def _compute_analysis(df, symbol, binance_timeframe, expires_at, export=False):
+    """full_analysis; con export deja también en la caché el stream Arrow IPC de las series
+    de indicadores calculadas (tabla sobre los arrays, sin pasar por pandas), para que la
+    exportación no tenga que repetir el análisis"""
+    analyzer = TechnicalAnalyzer(df, symbol)
+    analysis = analyzer.full_analysis()
+    if export and ARROW_AVAILABLE:
+        get_shared_cache().set(_indicators_key(df, symbol, binance_timeframe),
+                               to_ipc_stream(indicator_table(analyzer)), expires_at)
+    return analysis
+
+
+def get_analysis(df, symbol, binance_timeframe, export=False, refresh=False):
+    """full_analysis compartido entre réplicas mientras no cambie la última vela.
+    export=True (página de análisis) guarda además las series para la exportación;
+    refresh=True recalcula aunque la última vela sea la misma (su precio puede haber cambiado)"""
+    last_ts = df['timestamp'].iloc[-1]
+    cache = get_shared_cache()
+    key = f"analysis:{symbol}:{binance_timeframe}:{len(df)}"
+    expires_at = candle_close_expiry(binance_timeframe)
+    cached_ts, analysis = cache.get_or_compute(
+        key, lambda: (last_ts, _compute_analysis(df, symbol, binance_timeframe, expires_at, export)),
+        expires_at, cache='analysis', refresh=refresh)
+    if cached_ts != last_ts:
+        analysis = _compute_analysis(df, symbol, binance_timeframe, expires_at, export)
+        cache.set(key, (last_ts, analysis), expires_at)
+    return analysis
+
+
+def get_indicator_series(df, symbol, binance_timeframe):
+    """Stream IPC de las series de indicadores del último get_analysis(export=True); solo si
+    no está en la caché (caducado, o el análisis lo calculó el escáner) se repite el análisis"""
+    key = _indicators_key(df, symbol, binance_timeframe)
+    data = get_shared_cache().get(key)
+    if data is None:
+        _compute_analysis(df, symbol, binance_timeframe, candle_close_expiry(binance_timeframe), export=True)
+        data = get_shared_cache().get(key)
+    return data
+
+
+def load_analysis(symbol, binance_timeframe):
+    """Análisis memorizado en la sesión hasta que cierra la vela en curso (como mucho ANALYSIS_MAX_AGE)"""
+    memo = st.session_state.setdefault('analysis_memo', {})
+    key = (symbol, binance_timeframe)
+    entry = memo.get(key)
+    refresh = st.session_state.pop('analysis_refresh', None) == key
+    if entry is not None and time.time() < entry['expires_at'] and not refresh:
+        return entry
 
     with st.spinner("Obteniendo datos de Binance..."):
-        binance_timeframe = TIMEFRAMES[timeframe]
-        df = st.session_state.binance.get_ohlcv_data(symbol, binance_timeframe, limit=100)
+        df = st.session_state.binance.get_ohlcv_data(symbol, binance_timeframe, limit=100, refresh=refresh)
 
     if df is None or df.empty:
         st.error("❌ No se pudieron obtener datos de Binance")
-        return
+        return None
 
     if len(df) < 20:
         st.error(f"❌ Datos insuficientes ({len(df)} registros)")
+        return None
+
+    regime = detect_regime(symbol, binance_timeframe, df)
+
+    missing = int((df['quality'] == MISSING).sum()) if 'quality' in df.columns else 0
+    if missing:
+        st.warning(f"⚠️ {missing} velas ausentes sin reparar (rellenadas con el cierre anterior)")
+
+    analysis = get_analysis(df, symbol, binance_timeframe, export=True, refresh=refresh)
+
+    with st.spinner("Obteniendo libro de órdenes..."):
+        book = st.session_state.binance.get_order_book(symbol)
+
+    entry = memo[key] = {
+        'df': df,
+        'analysis': analysis,
+        'depth': DepthAnalyzer(book) if book is not None else None,
+        'regime': regime,
+        'updated_at': datetime.now(),
+        'candle_close': next_candle_close(binance_timeframe),
+        'expires_at': min(next_candle_close(binance_timeframe) + CLOSE_GRACE, time.time() + ANALYSIS_MAX_AGE),
+        'journaled': False
+    }
+    return entry
+
+
+def perform_analysis(symbol, timeframe, order_size=1000.0):
+    st.header(f"Análisis de {symbol} - {timeframe}")
+
+    binance_timeframe = TIMEFRAMES[timeframe]
+    entry = load_analysis(symbol, binance_timeframe)
+    if entry is None:
         return
 
-    analyzer = TechnicalAnalyzer(df, symbol)
-    analysis = analyzer.full_analysis()
+    st.caption(f"Régimen de mercado: {describe_regime(entry['regime'])}")
+    show_price_ticker(symbol, binance_timeframe)
 
     # DISEÑO DE DOS COLUMNAS IDÉNTICO A TU PROGRAMA
     col1, col2 = st.columns(2)
 
     with col1:
-        show_personal_recommendation(analysis, symbol, timeframe)
+        show_recommendation_panel(symbol, timeframe, order_size)
+
+    with col2:
+        show_indicator_panel(symbol, timeframe)
+
+    show_analysis_export(symbol, binance_timeframe)
+
+    # Diario de señales (escritura en segundo plano), una vez por vela
+    if not entry['journaled']:
+        analysis, df = entry['analysis'], entry['df']
+        journal = get_journal()
+        signal, buy_score, sell_score = calculate_signal_scores(analysis)
+        journal.record(build_entry(analysis, symbol, binance_timeframe, df['timestamp'].iloc[-1],
+                                   signal, buy_score, sell_score, entry.get('trade_levels')))
+        journal.resolve_outcomes(symbol, binance_timeframe, df)
+        entry['journaled'] = True
+
+
+@fragment(run_every=TICKER_REFRESH)
+def show_price_ticker(symbol, binance_timeframe):
+    """Precio en vivo; al cerrar la vela (o caducar el análisis) relanza la página para recalcular"""
+    entry = st.session_state.analysis_memo.get((symbol, binance_timeframe))
+    if entry is None:
+        return
+    if time.time() >= entry['expires_at']:
+        st.rerun()
+
+    price = st.session_state.binance.get_current_price(symbol)
+    analysis_price = entry['analysis']['current_price']
+    col1, col2 = st.columns(2)
+    with col1:
+        if price is None:
+            st.metric("Precio en vivo", "—")
+        else:
+            price_fmt = f"${price:,.0f}" if price >= 1000 else f"${price:.2f}" if price >= 1 else f"${price:.6f}"
+            change = (price - analysis_price) / analysis_price * 100 if analysis_price else 0.0
+            st.metric("Precio en vivo", price_fmt, f"{change:+.2f}% desde el análisis")
+    with col2:
+        remaining = int(max(0, entry['candle_close'] - time.time()))
+        hours, rest = divmod(remaining, 3600)
+        st.metric("Próxima vela", f"{hours}h {rest // 60:02d}m" if hours else f"{rest // 60}m {rest % 60:02d}s")
+
+
+@fragment()
+def show_recommendation_panel(symbol, timeframe, order_size):
+    entry = st.session_state.analysis_memo[(symbol, TIMEFRAMES[timeframe])]
+    entry['trade_levels'] = show_personal_recommendation(entry['analysis'], symbol, timeframe,
+                                                         entry['depth'], order_size)
+    if entry['trade_levels']:
+        show_risk_simulation(entry, symbol, TIMEFRAMES[timeframe])
+
+
+def show_risk_simulation(entry, symbol, binance_timeframe):
+    """Probabilidades Monte Carlo de los niveles sugeridos, una vez por vela y juego de niveles"""
+    levels = entry['trade_levels']
+    key = tuple(levels.get(k) for k in ('action', 'entry', 'stop', 'target_1', 'target_2'))
+    if entry.get('risk_key') != key:
+        # Más historia que el análisis para que el bootstrap y el walk-forward tengan muestra
+        history = st.session_state.binance.get_ohlcv_data(symbol, binance_timeframe, limit=1000)
+        if history is None:
+            history = entry['df']
+        if 'quality' in history.columns:
+            # Las velas planas de relleno sesgarían los retornos hacia cero
+            history = history[history['quality'] != MISSING]
+        with st.spinner("Simulando niveles..."):
+            entry['risk'] = simulate_levels(history, levels, binance_timeframe,
+                                            price=entry['analysis'].get('current_price'))
+        entry['risk_key'] = key
+    risk = entry['risk']
+    if risk is None:
+        return
 
+    st.subheader("🎲 Simulación de Niveles")
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Entrada ejecutada", f"{risk['p_fill'] * 100:.0f}%")
     with col2:
-        display_analysis_exact(analysis, symbol, timeframe)
+        st.metric("Target 1 antes que Stop", f"{risk['p_target_1'] * 100:.0f}%")
+    with col3:
+        st.metric("Stop primero", f"{risk['p_stop'] * 100:.0f}%")
+    with col4:
+        if risk['p_target_2'] is not None:
+            st.metric("Target 2 antes que Stop", f"{risk['p_target_2'] * 100:.0f}%")
+        else:
+            st.metric("Sin resolver", f"{risk['p_open'] * 100:.0f}%")
+
+    details = (f"Desde el precio actual: si la entrada no se ejecuta en {risk['horizon']} velas la operación no "
+               f"cuenta como target ni stop · {risk['paths']:,} trayectorias de {risk['horizon']} velas")
+    if risk['mean_exit_bars'] is not None:
+        details += f" · salida media en {risk['mean_exit_bars']:.1f} velas"
+    if risk['mean_target_bars'] is not None:
+        details += f" · Target 1 en {risk['mean_target_bars']:.1f} velas"
+    wf = risk['walk_forward']
+    if wf:
+        details += (f" · walk-forward ({wf['windows']} ventanas): Target 1 previsto {wf['predicted'] * 100:.0f}%"
+                    f", real {wf['realized'] * 100:.0f}%")
+    st.caption(details)
+
+
+@fragment()
+def show_indicator_panel(symbol, timeframe):
+    entry = st.session_state.analysis_memo[(symbol, TIMEFRAMES[timeframe])]
+    display_analysis_exact(entry['analysis'], symbol, timeframe, entry['updated_at'])
+
+
+def perform_market_scan(symbols, timeframe, top_n, skip_ranging=True):
+    """Escáner en dos etapas: filtro barato por tickers de 24h y análisis completo del top N.
+    El régimen de mercado ordena los candidatos y, con skip_ranging, descarta los laterales
+    (si la etiqueta ya está en la caché compartida, sin descargar sus velas).
+    Devuelve los resultados para conservarlos entre reruns"""
+    with st.spinner("Obteniendo tickers de 24h..."):
+        tickers = st.session_state.binance.get_tickers()
+
+    if not tickers:
+        st.error("❌ No se pudieron obtener los tickers de Binance")
+        return None
+
+    universe = set(symbols)
+    tickers = {symbol: ticker for symbol, ticker in tickers.items() if symbol in universe}
+    candidates = screen_tickers(tickers, top_n=top_n)
+
+    if candidates.empty:
+        st.warning("Ningún par supera el filtro de volumen")
+        return None
+
+    binance_timeframe = TIMEFRAMES[timeframe]
+    # Tendencia primero; el orden del filtro de tickers se mantiene dentro de cada régimen
+    known = [cached_regime(symbol, binance_timeframe) for symbol in candidates['symbol']]
+    candidates = candidates.assign(regime=[r['regime'] if r else UNKNOWN for r in known])
+    candidates = candidates.iloc[candidates['regime'].map(PRIORITY).argsort(kind='stable')]
+
+    journal = get_journal()
+    rows = []
+    skipped = 0
+    progress = st.progress(0.0)
+    for i, candidate in enumerate(candidates.itertuples()):
+        progress.progress((i + 1) / len(candidates))
+        if skip_ranging and candidate.regime == RANGING:
+            skipped += 1
+            continue
+        df = st.session_state.binance.get_ohlcv_data(candidate.symbol, binance_timeframe, limit=100)
+        if df is None or len(df) < 20:
+            continue
+        regime = detect_regime(candidate.symbol, binance_timeframe, df)
+        if skip_ranging and regime and regime['regime'] == RANGING:
+            skipped += 1
+            continue
+        analysis = get_analysis(df, candidate.symbol, binance_timeframe)
+        signal, buy_score, sell_score = calculate_signal_scores(analysis)
+        journal.record(build_entry(analysis, candidate.symbol, binance_timeframe, df['timestamp'].iloc[-1],
+                                   signal, buy_score, sell_score))
+        journal.resolve_outcomes(candidate.symbol, binance_timeframe, df)
+        rows.append({
+            'Par': candidate.symbol,
+            'Precio': analysis['current_price'],
+            'Volumen 24h (USDT)': candidate.quote_volume,
+            'Rango 24h %': candidate.volatility_percent,
+            'Señal': signal,
+            'Compra %': buy_score,
+            'Venta %': sell_score,
+            'RSI': analysis['rsi'],
+            'ADX': analysis['adx']['adx'],
+            'Tendencia': analysis['trend'],
+            'Régimen': regime['regime'] if regime else UNKNOWN
+        })
+    progress.empty()
+    if skipped:
+        METRICS.inc('regime_skipped_total', skipped, timeframe=binance_timeframe)
+
+    if not rows:
+        if skipped:
+            st.warning(f"⚠️ Los {skipped} candidatos analizables están en mercado lateral")
+        else:
+            st.error("❌ No se pudieron analizar los candidatos")
+        return None
+
+    results = pd.DataFrame(rows).sort_values(['Compra %', 'Volumen 24h (USDT)'], ascending=False)
+    export = None
+    if ARROW_AVAILABLE:
+        table = scan_table(results)
+        if EXPORT_DIR:
+            write_scan(table, binance_timeframe)
+        export = to_ipc_stream(table)
+    return {
+        'timeframe': timeframe, 'binance_timeframe': binance_timeframe,
+        'universe': len(universe), 'candidates': len(candidates), 'skipped': skipped,
+        'results': results, 'export': export
+    }
+
+
+def show_scan_results(scan):
+    st.header(f"Escáner de mercado - {scan['timeframe']}")
+    st.write(f"Universo: {scan['universe']} pares USDT → {scan['candidates']} candidatos")
+    if scan['skipped']:
+        st.caption(f"{scan['skipped']} candidatos omitidos por mercado lateral")
+    st.dataframe(scan['results'], use_container_width=True, hide_index=True)
+    if scan['export'] is not None:
+        st.download_button("📦 Descargar escaneo (Arrow IPC)", scan['export'],
+                           file_name=f"scan_{scan['binance_timeframe']}.arrow", mime=IPC_CONTENT_TYPE)
+
+
+@fragment()
+def show_analysis_export(symbol, binance_timeframe):
+    """Velas y series completas de indicadores en Arrow IPC; con EXPORT_DIR también a Parquet particionado"""
+    if not ARROW_AVAILABLE:
+        return
+    entry = st.session_state.analysis_memo[(symbol, binance_timeframe)]
+    if 'export' not in entry:
+        df = entry['df']
+        indicators = get_indicator_series(df, symbol, binance_timeframe)
+        if indicators is None:
+            return
+        candles = ohlcv_table(df)
+        # Escritura a disco en segundo plano sobre los mismos buffers; la descarga usa los bytes IPC
+        export_analysis(candles, from_ipc_stream(indicators), symbol, binance_timeframe)
+        entry['export'] = (to_ipc_stream(candles), indicators)
+    candles, indicators = entry['export']
+
+    name = f"{symbol.replace('/', '')}_{binance_timeframe}"
+    with st.expander("📦 Exportar datos"):
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Velas (Arrow IPC)", candles,
+                               file_name=f"{name}_ohlcv.arrow", mime=IPC_CONTENT_TYPE, use_container_width=True)
+        with col2:
+            st.download_button("Indicadores (Arrow IPC)", indicators,
+                               file_name=f"{name}_indicators.arrow", mime=IPC_CONTENT_TYPE, use_container_width=True)
+        if EXPORT_DIR:
+            st.caption(f"Parquet particionado en {EXPORT_DIR} (symbol/timeframe/date)")
 
 
-def display_analysis_exact(analysis, symbol, timeframe):
+def display_analysis_exact(analysis, symbol, timeframe, updated_at=None):
     """RÉPLICA EXACTA de tu función display_analysis"""
+    updated_at = updated_at or datetime.now()
 
     # ENCABEZADO
     st.write("=" * 60)
     st.write(f"**ANÁLISIS {symbol}**")
     st.write(f"**Timeframe: {timeframe}**")
-    st.write(f"**Actualizado: {datetime.now().strftime('%H:%M:%S')}**")
+    st.write(f"**Actualizado: {updated_at.strftime('%H:%M:%S')}**")
     st.write("=" * 60)
     st.write("")
 
@@ -172,15 +559,30 @@ def display_analysis_exact(analysis, symbol, timeframe):
         st.write("• NIVEL: NEUTRO")
     st.write("")
 
+    # INDICADORES COMPLEMENTARIOS
+    st.write("**INDICADORES COMPLEMENTARIOS**")
+    st.write("-" * 40)
+    macd = analysis['macd']
+    bollinger = analysis['bollinger']
+    atr = analysis['atr']
+    stoch_rsi = analysis['stoch_rsi']
+    st.write(f"• MACD: {macd['macd_trend']} (histograma {macd['histogram']:.4f})")
+    st.write(f"• BOLLINGER: %B {bollinger['percent_b']:.2f} - ancho {bollinger['bandwidth']:.1f}% ({bollinger['position']})")
+    st.write(f"• ATR: {atr['atr_percent']:.2f}% - stop LONG ${atr['long_stop']:.4f}")
+    vwap = analysis['vwap']
+    anchor = " - anclado a la ventana analizada" if vwap.get('anchor') == 'VENTANA' else ""
+    st.write(f"• VWAP: {vwap['position']} ({vwap['price_vs_vwap_percent']:+.2f}%){anchor}")
+    st.write(f"• ICHIMOKU: {analysis['ichimoku']['cloud_position']}")
+    st.write(f"• OBV: {analysis['obv']['obv_trend']}")
+    st.write(f"• STOCH RSI: K {stoch_rsi['k']:.1f} / D {stoch_rsi['d']:.1f} ({stoch_rsi['level']})")
+    st.write("")
+
     # RECOMENDACIÓN
     show_single_recommendation_exact(analysis)
 
 
-def show_single_recommendation_exact(analysis):
-    """RÉPLICA EXACTA de tu generate_single_recommendation"""
-    st.write("**RECOMENDACIÓN**")
-    st.write("=" * 50)
-
+def calculate_signal_scores(analysis):
+    """Puntuaciones de compra/venta y señal resultante de generate_single_recommendation"""
     mas = analysis['moving_averages']
     squeeze = analysis['squeeze_momentum']
     adx = analysis['adx']
@@ -218,8 +620,30 @@ def show_single_recommendation_exact(analysis):
     buy_score = (buy_signals / total_buy_criteria) * 100
     sell_score = (sell_signals / total_sell_criteria) * 100
 
-    # LÓGICA IDÉNTICA
     if buy_score >= 70 and buy_score > sell_score + 15 and mas['ema_cross_status'] == "CRUCE_ALCISTA":
+        signal = "SEÑAL LONG FUERTE"
+    elif sell_score >= 70 and sell_score > buy_score + 15 and mas['ema_cross_status'] == "CRUCE_BAJISTA":
+        signal = "SEÑAL SHORT FUERTE"
+    else:
+        signal = "MERCADO EN EQUILIBRIO"
+
+    return signal, buy_score, sell_score
+
+
+def show_single_recommendation_exact(analysis):
+    """RÉPLICA EXACTA de tu generate_single_recommendation"""
+    st.write("**RECOMENDACIÓN**")
+    st.write("=" * 50)
+
+    mas = analysis['moving_averages']
+    squeeze = analysis['squeeze_momentum']
+    adx = analysis['adx']
+    rsi = analysis['rsi']
+
+    signal, buy_score, sell_score = calculate_signal_scores(analysis)
+
+    # LÓGICA IDÉNTICA
+    if signal == "SEÑAL LONG FUERTE":
         st.success("**SEÑAL LONG FUERTE**")
         st.write("")
         st.write("**CRITERIOS CUMPLIDOS:**")
@@ -236,7 +660,7 @@ def show_single_recommendation_exact(analysis):
         st.write("")
         st.write(f"**PUNTUACIÓN: {buy_score:.0f}%**")
 
-    elif sell_score >= 70 and sell_score > buy_score + 15 and mas['ema_cross_status'] == "CRUCE_BAJISTA":
+    elif signal == "SEÑAL SHORT FUERTE":
         st.error("**SEÑAL SHORT FUERTE**")
         st.write("")
         st.write("**CRITERIOS CUMPLIDOS:**")
@@ -268,7 +692,7 @@ def show_single_recommendation_exact(analysis):
             st.write(f"(Sesgo bajista: {sell_score:.0f}%)")
 
 
-def show_personal_recommendation(analysis, symbol, timeframe):
+def show_personal_recommendation(analysis, symbol, timeframe, depth=None, order_size=1000.0):
     """RÉPLICA EXACTA de tu generate_personal_recommendation"""
 
     mas = analysis['moving_averages']
@@ -277,6 +701,8 @@ def show_personal_recommendation(analysis, symbol, timeframe):
     adx = analysis['adx']
     current_price = analysis['current_price']
 
+    trade_levels = {}
+
     recommendation = "Hola Sebastián,\n\n"
     recommendation += f"Análisis {symbol}:\n\n"
 
@@ -393,6 +819,13 @@ def show_personal_recommendation(analysis, symbol, timeframe):
             else:
                 recommendation += f"Relación: Arriesgas MÁS de lo que ganas\n"
 
+        trade_levels = {'action': 'LONG', 'entry': mejor_entrada, 'stop': stop_loss,
+                        'target_1': target_1, 'target_2': target_2}
+
+        if depth is not None:
+            levels = {'Entrada': mejor_entrada, 'Stop': stop_loss, 'Target 1': target_1, 'Target 2': target_2}
+            recommendation += describe_liquidity(depth, levels, 'buy', order_size)
+
     elif mas['ema_cross_status'] == "CRUCE_BAJISTA" and "BAJISTA" in squeeze['momentum_trend'] and rsi > 70:
         recommendation += "Considerar SHORT\n"
         recommendation += f"Entrada: ${current_price:.0f}\n"
@@ -413,6 +846,13 @@ def show_personal_recommendation(analysis, symbol, timeframe):
         else:
             recommendation += f"Relación: Arriesgas MÁS de lo que ganas\n"
 
+        trade_levels = {'action': 'SHORT', 'entry': current_price, 'stop': current_price * 1.02,
+                        'target_1': current_price * 0.96, 'target_2': None}
+
+        if depth is not None:
+            levels = {'Entrada': current_price, 'Stop': current_price * 1.02, 'Target': current_price * 0.96}
+            recommendation += describe_liquidity(depth, levels, 'sell', order_size)
+
     else:
         recommendation += "Esperar mejor señal\n"
         if mas['ema_cross_status'] != "CRUCE_ALCISTA":
@@ -455,7 +895,75 @@ def show_personal_recommendation(analysis, symbol, timeframe):
     st.subheader("🎯 RECOMENDACIÓN PERSONAL")
     st.text(recommendation)
 
+    return trade_levels
+
+
+@fragment()
+def show_signal_journal():
+    """Consulta del histórico de señales guardado en el diario"""
+    st.header("📚 Diario de Señales")
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        signal = st.selectbox("Señal:", ["Todas", "SEÑAL LONG FUERTE", "SEÑAL SHORT FUERTE", "MERCADO EN EQUILIBRIO"])
+    with col2:
+        timeframe = st.selectbox("Timeframe:", ["Todos"] + list(TIMEFRAMES.keys()), key="journal_timeframe")
+    with col3:
+        days = st.number_input("Últimos días:", min_value=1, value=90, step=1)
+
+    history = get_journal().query(
+        timeframe=TIMEFRAMES.get(timeframe),
+        signal=None if signal == "Todas" else signal,
+        since_days=days
+    )
+
+    if history.empty:
+        st.info("No hay señales registradas con esos filtros")
+        return
+
+    resolved = history['outcome'].notna()
+    if resolved.any():
+        hit_rate = (history.loc[resolved, 'outcome'] == 'TARGET_1').mean() * 100
+        st.write(f"**{len(history)} señales - {resolved.sum()} resueltas - {hit_rate:.0f}% alcanzaron Target 1**")
+    else:
+        st.write(f"**{len(history)} señales - ninguna resuelta todavía**")
+    st.dataframe(history.drop(columns=['id']), use_container_width=True, hide_index=True)
+
+
+def describe_liquidity(depth, levels, side, order_size):
+    """Liquidez del libro de órdenes alrededor de los niveles sugeridos"""
+    text = "\nLIQUIDEZ (libro de órdenes):\n"
+
+    spread = depth.spread_percent()
+    if spread is not None:
+        text += f"Spread: {spread:.3f}%\n"
+
+    fill = depth.slippage(side, order_size, in_quote=True)
+    if fill['avg_price'] is not None:
+        text += f"Orden de ${order_size:,.0f}: precio medio ${fill['avg_price']:.4f} (deslizamiento {fill['slippage_percent']:.3f}%)\n"
+        if not fill['complete']:
+            text += f"⚠️ El libro solo cubre el {fill['filled_percent']:.0f}% de la orden\n"
+
+    for name, level in depth.level_report(levels).items():
+        imbalance = level['imbalance']
+        if imbalance > 0.3:
+            pressure = "presión compradora"
+        elif imbalance < -0.3:
+            pressure = "presión vendedora"
+        else:
+            pressure = "equilibrado"
+        total = level['bid_notional'] + level['ask_notional']
+        text += f"{name}: ${total:,.0f} en ±0.5% ({pressure})\n"
+
+    for wall_side, label in (('bid', 'Muro de compra'), ('ask', 'Muro de venta')):
+        walls = depth.liquidity_walls(wall_side, max_walls=1)
+        if walls:
+            text += f"{label}: ${walls[0]['price']:.4f} (${walls[0]['notional']:,.0f})\n"
+
+    return text
+
 
+@fragment()
 def show_entry_management():
     """Gestión de operaciones activas - RÉPLICA de tu open_entry_analysis()"""
     st.header("📈 Gestión de Operación Activa")
@@ -464,7 +972,7 @@ def show_entry_management():
         col1, col2 = st.columns(2)
 
         with col1:
-            symbol = st.selectbox("Moneda:", CRYPTO_SYMBOLS, key="entry_symbol")
+            symbol = st.selectbox("Moneda:", st.session_state.symbols, key="entry_symbol")
             timeframe = st.selectbox("Timeframe de entrada:", list(TIMEFRAMES.keys()), key="entry_timeframe")
             entry_price = st.text_input("Precio de entrada:", placeholder="Ej: 110816 para BTC o 0.0114 para GALA")
 
@@ -524,8 +1032,7 @@ def analyze_active_operation(symbol, timeframe, entry_price_str, operation_type)
     df = st.session_state.binance.get_ohlcv_data(symbol, binance_timeframe, limit=100)
 
     if df is not None and len(df) >= 20:
-        analyzer = TechnicalAnalyzer(df, symbol)
-        analysis = analyzer.full_analysis()
+        analysis = get_analysis(df, symbol, binance_timeframe)
         show_operation_recommendation(analysis, entry_price, current_price, operation_type, pnl, pnl_percent, timeframe)
     else:
         st.warning("No se pudo obtener análisis técnico para recomendación")
@@ -0,0 +1,300 @@
+import os
+import io
+import time
+import queue
+import threading
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as ipc
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+    ARROW_AVAILABLE = True
+except ImportError:
+    pa = ipc = pq = ds = None
+    ARROW_AVAILABLE = False
+
+# Directorio raíz de los datasets; sin él no se escribe nada a disco
+EXPORT_DIR = os.environ.get('EXPORT_DIR', '')
+
+IPC_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+
+DATASETS = ('ohlcv', 'indicators', 'scans')
+
+
+def _column(values):
+    # pa.array sobre un ndarray numérico contiguo reutiliza su buffer (sin copia);
+    # los NaN del calentamiento de los indicadores se mantienen como NaN
+    return pa.array(np.ascontiguousarray(values))
+
+
+def _flatten_indicators(ctx):
+    """('macd', 12, 26, 9) -> macd_12_26_9_signal, ...; solo series alineadas con las velas"""
+    n = len(ctx.close)
+    columns = {}
+    for key in sorted(ctx.computed(), key=lambda k: tuple(str(p) for p in k)):
+        name = '_'.join(str(p) for p in key)
+        value = ctx.get(*key)
+        items = value.items() if isinstance(value, dict) else [(None, value)]
+        for field, series in items:
+            if isinstance(series, np.ndarray) and series.ndim == 1 and len(series) == n:
+                columns[f"{name}_{field}" if field else name] = series
+    return columns
+
+
+def ohlcv_table(df):
+    """Velas como tabla Arrow construida directamente sobre los arrays del DataFrame.
+    Incluye la calidad de cada vela (ok, resampled, refetched, missing) tras la reparación"""
+    names = ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    arrays = [_column(df[name].to_numpy()) for name in names]
+    if 'quality' in df.columns:
+        arrays.append(pa.array(df['quality'].to_numpy(dtype=object), type=pa.string()))
+        names = names + ['quality']
+    return pa.Table.from_arrays(arrays, names=names)
+
+
+def indicator_table(analyzer):
+    """Series completas de indicadores calculadas por el analizador (tras full_analysis)"""
+    ctx = analyzer.indicators
+    columns = _flatten_indicators(ctx)
+    arrays = [_column(analyzer.df['timestamp'].to_numpy())] + [_column(v) for v in columns.values()]
+    return pa.Table.from_arrays(arrays, names=['timestamp'] + list(columns))
+
+
+def scan_table(results):
+    return pa.Table.from_pandas(results, preserve_index=False)
+
+
+# --- Arrow IPC ---
+
+def to_ipc_stream(table):
+    sink = io.BytesIO()
+    with ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+
+def from_ipc_stream(data):
+    """Tabla sobre los bytes del stream IPC, sin copiar los buffers"""
+    return ipc.open_stream(pa.py_buffer(data)).read_all()
+
+
+def write_ipc_file(table, path):
+    """Formato de fichero IPC: se puede abrir con pa.memory_map sin copiar"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp, path)
+
+
+def read_ipc_file(path):
+    with pa.memory_map(path, 'r') as source:
+        return ipc.open_file(source).read_all()
+
+
+# --- Parquet particionado (hive: symbol=.../timeframe=.../date=...) ---
+
+def _partition_value(value):
+    return str(value).replace('/', '_')
+
+
+def _write_parquet(table, path):
+    # El temporal empieza por '.' para que los lectores del dataset lo ignoren
+    directory, name = os.path.split(path)
+    tmp = os.path.join(directory, f".{name}.{os.getpid()}.tmp")
+    pq.write_table(table, tmp)
+    os.replace(tmp, path)
+
+
+def _date_slices(table):
+    """Cortes por día UTC sobre una tabla ordenada por timestamp (slices sin copia)"""
+    days = table.column('timestamp').to_numpy().astype('datetime64[D]')
+    if len(days) == 0:
+        return []
+    bounds = np.flatnonzero(days[1:] != days[:-1]) + 1
+    starts = np.concatenate([[0], bounds])
+    ends = np.concatenate([bounds, [len(days)]])
+    return [(str(days[s]), table.slice(s, e - s)) for s, e in zip(starts, ends)]
+
+
+# Clave de los metadatos del Parquet: timestamp (ms) hasta el que las velas del fichero
+# estaban cerradas al escribirlo. La vela en formación cambia hasta que cierra
+CLOSED_UNTIL = b'closed_until'
+
+
+def _last_ts(table, offset=1):
+    return table.column('timestamp').cast(pa.int64())[-offset].as_py()
+
+
+def _partition_closed(path, part):
+    """El fichero ya tiene todas estas velas, y cerradas: lo dice el pie del Parquet sin leer datos"""
+    if not os.path.exists(path):
+        return False
+    try:
+        metadata = pq.read_metadata(path)
+        closed_until = int((metadata.metadata or {}).get(CLOSED_UNTIL, b'-1'))
+    except Exception:
+        return False
+    return metadata.num_rows >= part.num_rows and closed_until >= _last_ts(part)
+
+
+def _merge_partition(path, table):
+    # Re-exportar un día ya guardado sustituye las velas repetidas por las nuevas
+    if not os.path.exists(path):
+        return table
+    existing = pq.read_table(path)
+    if existing.schema != table.schema:
+        return table
+    new_ts = table.column('timestamp').to_numpy()
+    keep = ~np.isin(existing.column('timestamp').to_numpy(), new_ts)
+    merged = pa.concat_tables([existing.filter(pa.array(keep)), table])
+    order = np.argsort(merged.column('timestamp').to_numpy(), kind='stable')
+    return merged.take(pa.array(order))
+
+
+def write_partitioned(table, dataset, symbol, timeframe, base_dir=None):
+    """Escribe la tabla en base_dir/dataset/symbol=.../timeframe=.../date=.../part-0.parquet.
+    La última vela de la tabla es la que se está formando: su día se reescribe siempre, y un
+    día anterior solo si el fichero no tiene ya todas sus velas cerradas"""
+    base_dir = base_dir or EXPORT_DIR
+    closed_until = _last_ts(table, 2) if table.num_rows > 1 else -1
+    written = []
+    for day, part in _date_slices(table):
+        directory = os.path.join(base_dir, dataset, f"symbol={_partition_value(symbol)}",
+                                 f"timeframe={timeframe}", f"date={day}")
+        path = os.path.join(directory, 'part-0.parquet')
+        if _partition_closed(path, part):
+            continue
+        os.makedirs(directory, exist_ok=True)
+        merged = _merge_partition(path, part)
+        metadata = dict(merged.schema.metadata or {})
+        metadata[CLOSED_UNTIL] = str(min(_last_ts(part), closed_until)).encode('ascii')
+        _write_parquet(merged.replace_schema_metadata(metadata), path)
+        written.append(path)
+    return written
+
+
+def write_scan(table, timeframe, base_dir=None):
+    """Cada escaneo es un fichero nuevo en base_dir/scans/timeframe=.../date=..."""
+    base_dir = base_dir or EXPORT_DIR
+    now = time.time()
+    directory = os.path.join(base_dir, 'scans', f"timeframe={timeframe}",
+                             f"date={time.strftime('%Y-%m-%d', time.gmtime(now))}")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"scan-{int(now * 1000)}.parquet")
+    _write_parquet(table, path)
+    return path
+
+
+def write_analysis(candles, indicators, symbol, timeframe, base_dir=None):
+    """Velas e indicadores a Parquet particionado más una instantánea IPC para memory-map"""
+    base_dir = base_dir or EXPORT_DIR
+    write_partitioned(candles, 'ohlcv', symbol, timeframe, base_dir)
+    write_partitioned(indicators, 'indicators', symbol, timeframe, base_dir)
+    snapshot = os.path.join(base_dir, 'latest', f"symbol={_partition_value(symbol)}",
+                            f"timeframe={timeframe}", 'indicators.arrow')
+    write_ipc_file(indicators, snapshot)
+    return snapshot
+
+
+class ExportWriter:
+    """Escritura de los datasets en un hilo propio, como el diario de señales: la página no
+    espera al disco. Varias exportaciones pendientes del mismo par se quedan en la última"""
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name='arrow-export', daemon=True)
+        self._writer.start()
+
+    def submit(self, candles, indicators, symbol, timeframe):
+        key = (symbol, timeframe)
+        with self._lock:
+            queued = key in self._pending
+            self._pending[key] = (candles, indicators)
+        if not queued:
+            self._queue.put(key)
+
+    def flush(self):
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            key = self._queue.get()
+            try:
+                with self._lock:
+                    candles, indicators = self._pending.pop(key)
+                write_analysis(candles, indicators, *key, self.base_dir)
+            except Exception as e:
+                print(f"❌ Error exportando {key[0]} a Arrow/Parquet: {e}")
+            finally:
+                self._queue.task_done()
+
+
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+
+def get_exporter(base_dir=None):
+    base_dir = base_dir or EXPORT_DIR
+    with _exporters_lock:
+        if base_dir not in _exporters:
+            _exporters[base_dir] = ExportWriter(base_dir)
+        return _exporters[base_dir]
+
+
+def export_analysis(candles, indicators, symbol, timeframe, base_dir=None):
+    """Encola la exportación a disco (tablas Arrow ya construidas); False si no hay destino"""
+    base_dir = base_dir or EXPORT_DIR
+    if not ARROW_AVAILABLE or not base_dir:
+        return False
+    get_exporter(base_dir).submit(candles, indicators, symbol, timeframe)
+    return True
+
+
+def read_dataset(dataset, base_dir=None, columns=None, **partitions):
+    """Lee un dataset particionado filtrando por symbol/timeframe/date; columns proyecta
+    en la lectura (solo se leen del disco esas columnas). Las columnas que el dataset no
+    tiene se omiten: los ficheros escritos antes de añadirlas siguen siendo legibles"""
+    base_dir = base_dir or EXPORT_DIR
+    path = os.path.join(base_dir, dataset)
+    if not os.path.isdir(path):
+        return None
+    data = ds.dataset(path, format='parquet', partitioning='hive')
+    expression = None
+    for field, value in partitions.items():
+        if value:
+            condition = ds.field(field) == _partition_value(value)
+            expression = condition if expression is None else expression & condition
+    if columns is not None:
+        columns = [c for c in columns if c in data.schema.names]
+    return data.to_table(columns=columns, filter=expression)
+
+
+# --- Servicio HTTP (rutas del servidor de métricas) ---
+
+def serve_dataset(dataset):
+    def handler(query):
+        if dataset not in DATASETS:
+            return 404, b'', 'text/plain'
+        keys = ('timeframe', 'date') if dataset == 'scans' else ('symbol', 'timeframe', 'date')
+        partitions = {k: query.get(k) for k in keys}
+        table = read_dataset(dataset, **partitions)
+        if table is None or table.num_rows == 0:
+            return 404, b'', 'text/plain'
+        return 200, to_ipc_stream(table), IPC_CONTENT_TYPE
+    return handler
+
+
+def register_arrow_routes(register_route):
+    """GET /arrow/<dataset>?symbol=BTC/USDT&timeframe=1h&date=2024-01-01 -> IPC stream"""
+    if not ARROW_AVAILABLE or not EXPORT_DIR:
+        return False
+    for dataset in DATASETS:
+        register_route(f'/arrow/{dataset}', serve_dataset(dataset))
+    return True
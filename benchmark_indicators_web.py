@@ -0,0 +1,163 @@
+"""Paridad y velocidad del backend Numba frente a TA-Lib.
+
+Uso: python benchmark_indicators_web.py [n_velas ...]
+
+Los kernels siguen el orden de operaciones del código C de TA-Lib, pero los
+resultados no son idénticos bit a bit: según cómo se compiló TA-Lib (FMA,
+optimizaciones del compilador) EMA, STDDEV, RSI, LINEARREG y ATR difieren en
+errores de redondeo; el de STDDEV crece con la longitud de la serie por la
+resta de medias (~2e-9 con 50k velas). La paridad se comprueba con tolerancia
+RTOL/ATOL y exigiendo NaN en las mismas posiciones.
+
+En velocidad, las series núcleo son algo más rápidas con Numba a partir de ~1k
+velas, pero full_analysis completo queda a la par (dentro del ruido): el resto
+del analizador domina. Numba es la alternativa sin TA-Lib, no una aceleración.
+Necesita TA-Lib instalado (requirements_talib_web.txt) como referencia.
+"""
+import sys
+import math
+import time
+import numpy as np
+import pandas as pd
+from indicator_backend_web import TalibBackend, NumbaBackend, FUSED_PERIODS, talib
+from indicator_registry_web import IndicatorContext
+from technical_analyzer_web import TechnicalAnalyzer
+
+RTOL = 1e-8
+ATOL = 1e-9
+
+
+def make_ohlcv(n, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    spread = close * rng.uniform(0.001, 0.02, n)
+    high = close + spread * rng.uniform(0, 1, n)
+    low = close - spread * rng.uniform(0, 1, n)
+    # Velas planas para cubrir los casos de TR y DM nulos
+    high[10:13] = low[10:13] = close[10:13] = close[9]
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=n, freq='15min'),
+        'open': close, 'high': high, 'low': low, 'close': close,
+        'volume': rng.uniform(10, 1000, n)
+    })
+
+
+def same_series(expected, got):
+    # equal_nan exige NaN en las mismas posiciones (NaN frente a número es diferencia)
+    return expected.shape == got.shape and np.allclose(expected, got, rtol=RTOL, atol=ATOL, equal_nan=True)
+
+
+def same_result(expected, got):
+    """Compara recursivamente la salida de full_analysis con tolerancia en los floats"""
+    if isinstance(expected, dict):
+        return isinstance(got, dict) and expected.keys() == got.keys() and \
+            all(same_result(expected[k], got[k]) for k in expected)
+    if isinstance(expected, (list, tuple)):
+        return len(expected) == len(got) and all(same_result(a, b) for a, b in zip(expected, got))
+    if isinstance(expected, np.ndarray):
+        return same_series(expected, got)
+    if isinstance(expected, (float, np.floating)) and isinstance(got, (float, np.floating, int)):
+        if math.isnan(expected):
+            return math.isnan(got)
+        return math.isclose(expected, got, rel_tol=RTOL, abs_tol=ATOL)
+    return expected == got
+
+
+def parity(df):
+    talib_be, numba_be = TalibBackend(), NumbaBackend()
+    c, h, l = (df[col].to_numpy(dtype=float) for col in ('close', 'high', 'low'))
+    tr = talib_be.TRANGE(h, l, c)
+    checks = {
+        'SMA': lambda be: be.SMA(c, 20),
+        'EMA': lambda be: be.EMA(c, 55),
+        'STDDEV': lambda be: be.STDDEV(c, 20),
+        'RSI': lambda be: be.RSI(c, 14),
+        'TRANGE': lambda be: be.TRANGE(h, l, c),
+        'SMA(TR)': lambda be: be.SMA(tr, 20),
+        'MAX': lambda be: be.MAX(h, 20),
+        'MIN': lambda be: be.MIN(l, 20),
+        'LINEARREG': lambda be: be.LINEARREG(c - be.SMA(c, 20), 20),
+        'ATR': lambda be: be.ATR(h, l, c, tr, 14),
+        'ADX': lambda be: be.DMI(h, l, c, tr, 14)['adx'],
+        'PLUS_DI': lambda be: be.DMI(h, l, c, tr, 14)['plus_di'],
+        'MINUS_DI': lambda be: be.DMI(h, l, c, tr, 14)['minus_di'],
+    }
+    ok = True
+    for name, func in checks.items():
+        expected, got = func(talib_be), func(numba_be)
+        same = same_series(expected, got)
+        ok &= same
+        diff = np.nanmax(np.abs(expected - got)) if np.isfinite(expected - got).any() else 0.0
+        print(f"  {name:<10} {'OK' if same else 'DIFERENTE'} (max dif. {diff:.1e})")
+
+    # Las pasadas fusionadas deben sembrar las mismas series que las llamadas sueltas
+    fused_ctx = IndicatorContext(df, numba_be)
+    ref_ctx = IndicatorContext(df, talib_be)
+    for key in fused_ctx.computed():
+        expected, got = ref_ctx.get(*key), fused_ctx.get(*key)
+        same = same_result(expected, got)
+        ok &= same
+        print(f"  fusionado {key}: {'OK' if same else 'DIFERENTE'}")
+    return ok
+
+
+def core_series(df, backend):
+    # Series que usa full_analysis: llamadas sueltas en TA-Lib, dos pasadas en Numba
+    ctx = IndicatorContext(df, backend)
+    for period in FUSED_PERIODS['ema']:
+        ctx.get('ema', period)
+    ctx.get('sma', FUSED_PERIODS['sma'])
+    ctx.get('stddev', FUSED_PERIODS['sma'])
+    ctx.get('rsi', FUSED_PERIODS['rsi'])
+    ctx.get('tr_sma', FUSED_PERIODS['window'])
+    ctx.get('highest', FUSED_PERIODS['window'])
+    ctx.get('lowest', FUSED_PERIODS['window'])
+    ctx.get('dmi', FUSED_PERIODS['dmi'])
+    return ctx
+
+
+def analyze(df, backend):
+    analyzer = TechnicalAnalyzer(df)
+    analyzer._indicators = IndicatorContext(analyzer.df, backend)
+    return analyzer.full_analysis()
+
+
+def timeit(func, repeat=50, rounds=5):
+    """Mejor media de varias rondas (ms): menos sensible al ruido del sistema que una sola"""
+    func()
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        best = min(best, (time.perf_counter() - start) / repeat * 1000)
+    return best
+
+
+def main(sizes):
+    if talib is None:
+        print("❌ TA-Lib no está instalado: no hay referencia con la que comparar")
+        return 1
+    all_ok = True
+    for n in sizes:
+        df = make_ohlcv(n)
+        print(f"\n=== {n} velas ===")
+        all_ok &= parity(df)
+
+        results = {}
+        for name, backend in (('talib', TalibBackend()), ('numba', NumbaBackend())):
+            results[name] = analyze(df, backend)
+            print(f"  series núcleo [{name}]: {timeit(lambda: core_series(df, backend)):.3f} ms")
+            print(f"  full_analysis [{name}]: {timeit(lambda: analyze(df, backend)):.3f} ms")
+
+        same = same_result(results['talib'], results['numba'])
+        all_ok &= same
+        print(f"  full_analysis igual entre backends (rtol={RTOL}): {same}")
+
+    print("\n✅ Paridad OK" if all_ok else "\n❌ Hay diferencias")
+    return 0 if all_ok else 1
+
+
+if __name__ == "__main__":
+    sizes = [int(arg) for arg in sys.argv[1:]] or [100, 1000, 5000]
+    sys.exit(main(sizes))
@@ -1,9 +1,22 @@
-import ccxt
+import os
+import time
 import pandas as pd
+from metrics_web import METRICS
+from order_book_web import OrderBook
+from market_universe_web import load_usdt_universe
+from shared_cache_web import get_shared_cache, candle_close_expiry
+from candle_integrity_web import repair_candles, finer_timeframes
+from multi_exchange_web import get_aggregator
+
+# Exchanges ccxt consultados; el primero es el preferido mientras no haya latencias medidas
+EXCHANGES = [e.strip() for e in os.environ.get('EXCHANGES', 'binance,okx,bybit').split(',') if e.strip()]
+
+# Sin conexión no se bloquea para siempre: se vuelve a probar cada RETRY_INTERVAL segundos
+RETRY_INTERVAL = 30.0
 
 class BinanceClient:
-    def __init__(self):
-        self.exchange = ccxt.binance({
+    def __init__(self, exchange=None):
+        self.exchange = exchange or get_aggregator(EXCHANGES, {
             'apiKey': '',
             'secret': '',
             'enableRateLimit': True,
@@ -11,32 +24,137 @@ class BinanceClient:
         })
         self.connection_ok = self.test_connection()
 
+    def _connected(self):
+        if not self.connection_ok and time.time() - self._last_check >= RETRY_INTERVAL:
+            self.connection_ok = self.test_connection()
+        return self.connection_ok
+
     def test_connection(self):
+        self._last_check = time.time()
         try:
-            ticker = self.exchange.fetch_ticker('BTC/USDT')
+            with METRICS.timer('exchange_fetch_seconds', method='fetch_ticker'):
+                ticker = self.exchange.fetch_ticker('BTC/USDT')
             print("✅ Conexión a Binance exitosa")
             return True
         except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_ticker', error=type(e).__name__)
             print(f"❌ Error de conexión a Binance: {e}")
             return False
 
-    def get_ohlcv_data(self, symbol, timeframe, limit=5000):
-        if not self.connection_ok:
+    def get_ohlcv_data(self, symbol, timeframe, limit=5000, refresh=False):
+        if not self._connected():
             print("❌ No hay conexión a Binance")
             return None
+        # Compartido entre réplicas: solo una descarga cada símbolo/timeframe por vela
+        # (refresh=True descarga de nuevo y actualiza la copia compartida)
+        return get_shared_cache().get_or_compute(
+            self._ohlcv_key(symbol, timeframe, limit),
+            lambda: self._fetch_ohlcv(symbol, timeframe, limit),
+            candle_close_expiry(timeframe),
+            cache='ohlcv',
+            refresh=refresh
+        )
+
+    def _ohlcv_key(self, symbol, timeframe, limit):
+        return f"ohlcv:{symbol}:{timeframe}:{limit}"
+
+    def _fetch_ohlcv(self, symbol, timeframe, limit):
         try:
             adjusted_limit = self._get_adjusted_limit(timeframe, limit)
-            ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=adjusted_limit)
+            with METRICS.timer('exchange_fetch_seconds', method='fetch_ohlcv', timeframe=timeframe):
+                ohlcv = self.exchange.fetch_ohlcv(symbol, timeframe, limit=adjusted_limit)
             df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
             df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
             df = df.dropna()
             df = df.drop_duplicates()
+            # Huecos de la rejilla: primero desde timeframes menores cacheados, luego solo los rangos ausentes
+            cache = get_shared_cache()
+            finer_sources = [lambda tf=tf: cache.get(self._ohlcv_key(symbol, tf, limit))
+                             for tf in finer_timeframes(timeframe)]
+            df = repair_candles(df, timeframe, finer_sources,
+                                lambda start, end: self._fetch_missing_range(symbol, timeframe, start, end))
             print(f"✅ Datos obtenidos para {symbol} - {len(df)} registros")
             return df
         except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_ohlcv', error=type(e).__name__)
             print(f"❌ Error obteniendo datos para {symbol}: {e}")
             return None
 
+    def _fetch_missing_range(self, symbol, timeframe, start_ms, end_ms):
+        """Rango ausente pedido una sola vez por vela: lo que devuelva el exchange (aunque sea
+        nada, p. ej. durante una caída) se recuerda hasta el cierre y no se vuelve a pedir"""
+        cache = get_shared_cache()
+        key = f"ohlcv_range:{symbol}:{timeframe}:{start_ms}:{end_ms}"
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+        fetched = self._fetch_ohlcv_range(symbol, timeframe, start_ms, end_ms)
+        if fetched is None:
+            fetched = pd.DataFrame(columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        cache.set(key, fetched, candle_close_expiry(timeframe))
+        return fetched
+
+    def _fetch_ohlcv_range(self, symbol, timeframe, start_ms, end_ms, page_size=1000):
+        """Velas entre start_ms y end_ms (incluidos), paginando desde start_ms"""
+        rows, since = [], start_ms
+        try:
+            while since <= end_ms:
+                with METRICS.timer('exchange_fetch_seconds', method='fetch_ohlcv_range', timeframe=timeframe):
+                    page = self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=page_size)
+                page = [row for row in page if row[0] >= since]
+                if not page:
+                    break
+                rows.extend(row for row in page if row[0] <= end_ms)
+                since = page[-1][0] + 1
+        except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_ohlcv_range', error=type(e).__name__)
+            print(f"❌ Error recuperando velas ausentes de {symbol}: {e}")
+        if not rows:
+            return None
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume']).dropna()
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+        return df
+
+    def get_order_book(self, symbol, limit=1000):
+        if not self._connected():
+            print("❌ No hay conexión a Binance")
+            return None
+        try:
+            with METRICS.timer('exchange_fetch_seconds', method='fetch_order_book'):
+                book = self.exchange.fetch_order_book(symbol, limit=limit)
+            return OrderBook.from_ccxt(book, symbol)
+        except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_order_book', error=type(e).__name__)
+            print(f"❌ Error obteniendo libro de órdenes para {symbol}: {e}")
+            return None
+
+    def get_usdt_symbols(self):
+        if not self._connected():
+            print("❌ No hay conexión a Binance")
+            return None
+        try:
+            with METRICS.timer('exchange_fetch_seconds', method='load_markets'):
+                markets = self.exchange.load_markets()
+            symbols = load_usdt_universe(markets)
+            print(f"✅ Universo cargado - {len(symbols)} pares USDT")
+            return symbols
+        except Exception as e:
+            METRICS.inc('exchange_errors_total', method='load_markets', error=type(e).__name__)
+            print(f"❌ Error cargando mercados: {e}")
+            return None
+
+    def get_tickers(self, symbols=None):
+        if not self._connected():
+            print("❌ No hay conexión a Binance")
+            return None
+        try:
+            with METRICS.timer('exchange_fetch_seconds', method='fetch_tickers'):
+                return self.exchange.fetch_tickers(symbols)
+        except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_tickers', error=type(e).__name__)
+            print(f"❌ Error obteniendo tickers: {e}")
+            return None
+
     def _get_adjusted_limit(self, timeframe, original_limit):
         long_timeframes = ['1M', '1w', '3d']
         if timeframe in long_timeframes:
@@ -46,9 +164,10 @@ class BinanceClient:
 
     def get_current_price(self, symbol):
         try:
-            binance_symbol = symbol.replace("/", "")
-            ticker = self.exchange.fetch_ticker(binance_symbol)
+            with METRICS.timer('exchange_fetch_seconds', method='fetch_ticker'):
+                ticker = self.exchange.fetch_ticker(symbol)
             return ticker['last']
         except Exception as e:
+            METRICS.inc('exchange_errors_total', method='fetch_ticker', error=type(e).__name__)
             print(f"Error obteniendo precio de {symbol}: {e}")
             return None
\ No newline at end of file
@@ -0,0 +1,268 @@
+import threading
+import numpy as np
+import pandas as pd
+from metrics_web import METRICS
+from shared_cache_web import TIMEFRAME_SECONDS, WEEK_OFFSET
+
+# Calidad de cada vela tras la reparación
+OK, RESAMPLED, REFETCHED, MISSING = 'ok', 'resampled', 'refetched', 'missing'
+
+PRICE_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+
+
+# --- Índice de vela: posición de cada timestamp en la rejilla del timeframe ---
+
+def _to_index(ts_ms, timeframe):
+    """Timestamps en ms -> número de vela desde la época (meses naturales para '1M')"""
+    if timeframe == '1M':
+        return ts_ms.astype('datetime64[ms]').astype('datetime64[M]').astype(np.int64)
+    step = TIMEFRAME_SECONDS[timeframe] * 1000
+    offset = WEEK_OFFSET * 1000 if timeframe == '1w' else 0
+    return (ts_ms - offset) // step
+
+
+def _from_index(index, timeframe):
+    if timeframe == '1M':
+        return index.astype('datetime64[M]').astype('datetime64[ms]').astype(np.int64)
+    step = TIMEFRAME_SECONDS[timeframe] * 1000
+    offset = WEEK_OFFSET * 1000 if timeframe == '1w' else 0
+    return index * step + offset
+
+
+def supported(timeframe):
+    return timeframe == '1M' or timeframe in TIMEFRAME_SECONDS
+
+
+def finer_timeframes(timeframe):
+    """Timeframes menores que encajan exactamente en una vela de `timeframe`, de mayor a menor"""
+    span = 86400 if timeframe == '1M' else TIMEFRAME_SECONDS.get(timeframe)
+    if span is None:
+        return []
+    finer = [tf for tf, seconds in TIMEFRAME_SECONDS.items()
+             if span % seconds == 0 and (seconds < span or timeframe == '1M')]
+    return sorted(finer, key=TIMEFRAME_SECONDS.get, reverse=True)
+
+
+def find_gaps(index):
+    """Huecos en una serie ordenada de índices de vela: (primer índice ausente, velas ausentes)"""
+    jumps = np.diff(index)
+    holes = np.flatnonzero(jumps > 1)
+    return index[holes] + 1, jumps[holes] - 1
+
+
+def _expand(starts, counts):
+    # [5, 20], [2, 3] -> [5, 6, 20, 21, 22] sin bucles de Python
+    total = int(counts.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.repeat(starts, counts) + offsets
+
+
+def _timestamps_ms(df):
+    return df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+
+
+def _frame(index, timeframe, values, quality):
+    frame = pd.DataFrame(values, columns=PRICE_COLUMNS)
+    frame.insert(0, 'timestamp', pd.to_datetime(_from_index(index, timeframe), unit='ms'))
+    frame['quality'] = quality
+    return frame
+
+
+# --- Fuentes de reparación ---
+
+def resample(finer, timeframe, wanted):
+    """Reconstruye las velas `wanted` (índices) agregando un timeframe menor.
+    Solo devuelve los buckets completos; los incompletos siguen sin reparar"""
+    if finer is None or finer.empty or len(wanted) == 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 5))
+    if 'quality' in finer.columns:
+        finer = finer[finer['quality'] != MISSING]
+    finer = finer.sort_values('timestamp')
+    ts = _timestamps_ms(finer)
+    if len(ts) < 2:
+        return np.empty(0, dtype=np.int64), np.empty((0, 5))
+    finer_step = int(np.min(np.diff(ts)))
+    bucket = _to_index(ts, timeframe)
+    keep = np.isin(bucket, wanted)
+    if not keep.any() or finer_step <= 0:
+        return np.empty(0, dtype=np.int64), np.empty((0, 5))
+    bucket, ts = bucket[keep], ts[keep]
+    values = finer[PRICE_COLUMNS].to_numpy(dtype=float)[keep]
+
+    starts = np.flatnonzero(np.concatenate([[True], bucket[1:] != bucket[:-1]]))
+    ends = np.concatenate([starts[1:], [len(bucket)]])
+    buckets = bucket[starts]
+    expected = (_from_index(buckets + 1, timeframe) - _from_index(buckets, timeframe)) // finer_step
+    complete = (ends - starts) == expected
+
+    bars = np.column_stack([
+        values[starts, 0],
+        np.maximum.reduceat(values[:, 1], starts),
+        np.minimum.reduceat(values[:, 2], starts),
+        values[ends - 1, 3],
+        np.add.reduceat(values[:, 4], starts)
+    ])
+    return buckets[complete], bars[complete]
+
+
+def repair_candles(df, timeframe, finer_sources=(), fetch_range=None):
+    """Ordena, elimina timestamps repetidos y rellena los huecos de la rejilla del timeframe:
+    primero con timeframes menores ya cacheados, después pidiendo solo los rangos ausentes.
+    Lo que no se puede reparar se marca como MISSING (vela plana al cierre anterior, volumen 0)"""
+    if df is None or df.empty or not supported(timeframe):
+        return df
+    df = df.sort_values('timestamp').drop_duplicates('timestamp', keep='last').reset_index(drop=True)
+    if 'quality' not in df.columns:
+        df['quality'] = OK
+    index = _to_index(_timestamps_ms(df), timeframe)
+    starts, counts = find_gaps(index)
+    if len(starts) == 0:
+        return df
+
+    wanted = _expand(starts, counts)
+    repaired = []
+
+    for source in finer_sources:
+        if len(wanted) == 0:
+            break
+        found, bars = resample(source(), timeframe, wanted)
+        if len(found):
+            repaired.append(_frame(found, timeframe, bars, RESAMPLED))
+            wanted = wanted[~np.isin(wanted, found)]
+
+    if fetch_range is not None and len(wanted):
+        # Un rango por hueco restante: primer y último índice consecutivos
+        breaks = np.flatnonzero(np.diff(wanted) > 1) + 1
+        for chunk in np.split(wanted, breaks):
+            fetched = fetch_range(int(_from_index(chunk[:1], timeframe)[0]),
+                                  int(_from_index(chunk[-1:], timeframe)[0]))
+            if fetched is None or fetched.empty:
+                continue
+            found = _to_index(_timestamps_ms(fetched), timeframe)
+            keep = np.isin(found, chunk)
+            if keep.any():
+                repaired.append(_frame(found[keep], timeframe,
+                                       fetched[PRICE_COLUMNS].to_numpy(dtype=float)[keep], REFETCHED))
+                wanted = wanted[~np.isin(wanted, found[keep])]
+
+    counts_by_result = {RESAMPLED: 0, REFETCHED: 0}
+    for frame in repaired:
+        counts_by_result[frame['quality'].iloc[0]] += len(frame)
+
+    if len(wanted):
+        # Precios a NaN por ahora: se rellenan con el cierre anterior ya reparado
+        flat = np.column_stack([np.full((len(wanted), 4), np.nan), np.zeros(len(wanted))])
+        repaired.append(_frame(wanted, timeframe, flat, MISSING))
+
+    for result, count in ((RESAMPLED, counts_by_result[RESAMPLED]), (REFETCHED, counts_by_result[REFETCHED]),
+                          (MISSING, len(wanted))):
+        if count:
+            METRICS.inc('candle_gaps_total', count, timeframe=timeframe, result=result)
+
+    merged = pd.concat([df] + repaired, ignore_index=True).sort_values('timestamp').reset_index(drop=True)
+    missing = (merged['quality'] == MISSING).to_numpy()
+    if missing.any():
+        # Vela plana al último cierre conocido para no desplazar los indicadores en el tiempo
+        previous_close = merged['close'].ffill().to_numpy()
+        for column in ('open', 'high', 'low', 'close'):
+            merged.loc[missing, column] = previous_close[missing]
+    return merged
+
+
+# --- Auditoría de datasets completos ---
+
+def audit_candles(groups, timeframes, ts_ms, quality=None):
+    """Huecos por serie en una sola pasada sobre millones de velas.
+    groups: id de serie por vela; timeframes: timeframe de cada serie (indexado por id);
+    quality: calidad de cada vela si el dataset la guarda (None = todas originales)"""
+    index = np.empty(len(ts_ms), dtype=np.int64)
+    for group_tf in np.unique(timeframes):
+        rows = np.isin(groups, np.flatnonzero(timeframes == group_tf))
+        index[rows] = _to_index(ts_ms[rows], group_tf)
+    same = groups[1:] == groups[:-1]
+    jumps = np.diff(index)
+    # Los datasets particionados suelen venir ya ordenados: solo se ordena si hace falta
+    if not np.all((groups[1:] > groups[:-1]) | (same & (jumps >= 0))):
+        order = np.lexsort((index, groups))
+        groups, index = groups[order], index[order]
+        same = groups[1:] == groups[:-1]
+        jumps = np.diff(index)
+        if quality is not None:
+            quality = quality[order]
+    holes = same & (jumps > 1)
+    duplicates = same & (jumps == 0)
+    n_groups = len(timeframes)
+    report = {
+        'candles': np.bincount(groups, minlength=n_groups),
+        'gaps': np.bincount(groups[1:][holes], minlength=n_groups),
+        'missing': np.bincount(groups[1:][holes], weights=jumps[holes] - 1, minlength=n_groups).astype(np.int64),
+        'duplicates': np.bincount(groups[1:][duplicates], minlength=n_groups)
+    }
+    # Velas que ya se guardaron reparadas: no son huecos, pero tampoco datos originales
+    quality = np.full(len(groups), OK, dtype=object) if quality is None else quality
+    report['filled'] = np.bincount(groups[(quality == RESAMPLED) | (quality == REFETCHED)], minlength=n_groups)
+    report['synthetic'] = np.bincount(groups[quality == MISSING], minlength=n_groups)
+    return report
+
+
+def audit_dataset(base_dir):
+    """Revisa el dataset Parquet 'ohlcv' exportado (symbol/timeframe/date) leyendo solo timestamps y calidad"""
+    from arrow_export_web import ARROW_AVAILABLE, read_dataset
+    if not ARROW_AVAILABLE:
+        return None
+    table = read_dataset('ohlcv', base_dir, columns=['timestamp', 'symbol', 'timeframe', 'quality'])
+    if table is None or table.num_rows == 0:
+        return None
+    keys = (table.column('symbol').to_pandas().astype(str) + '|' + table.column('timeframe').to_pandas().astype(str))
+    groups, uniques = pd.factorize(keys)
+    series = pd.Series(uniques).str.split('|', expand=True)
+    series.columns = ['symbol', 'timeframe']
+    series = series[series['timeframe'].map(supported)]
+    valid = np.isin(groups, series.index.to_numpy())
+    ts_ms = table.column('timestamp').to_numpy().astype('datetime64[ms]').astype(np.int64)
+    remap = np.full(len(uniques), -1)
+    remap[series.index.to_numpy()] = np.arange(len(series))
+    quality = None
+    if 'quality' in table.column_names:
+        quality = table.column('quality').to_numpy(zero_copy_only=False)[valid]
+    result = audit_candles(remap[groups[valid]], series['timeframe'].to_numpy(), ts_ms[valid], quality)
+    report = series.reset_index(drop=True)
+    for column, values in result.items():
+        report[column] = values
+    return report
+
+
+_audit_started = False
+_audit_lock = threading.Lock()
+
+
+def start_integrity_audit(base_dir):
+    """Audita en segundo plano (una vez por proceso) las velas guardadas al arrancar"""
+    global _audit_started
+    with _audit_lock:
+        if _audit_started or not base_dir:
+            return
+        _audit_started = True
+
+    def run():
+        try:
+            report = audit_dataset(base_dir)
+        except Exception as e:
+            print(f"❌ Error auditando velas guardadas: {e}")
+            return
+        if report is None:
+            return
+        damaged = report[(report['gaps'] > 0) | (report['duplicates'] > 0) |
+                         (report['filled'] > 0) | (report['synthetic'] > 0)]
+        print(f"✅ Auditoría de velas: {int(report['candles'].sum())} velas en {len(report)} series, "
+              f"{len(damaged)} con huecos, duplicados o velas reparadas")
+        for row in damaged.itertuples():
+            print(f"   {row.symbol} {row.timeframe}: {row.gaps} huecos ({row.missing} velas), "
+                  f"{row.duplicates} duplicadas, {row.filled} rellenadas, {row.synthetic} sintéticas")
+
+    threading.Thread(target=run, name='candle-audit', daemon=True).start()
+
+
+METRICS.describe('candle_gaps_total', 'Velas ausentes detectadas por resultado de la reparación')
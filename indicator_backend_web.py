@@ -0,0 +1,607 @@
+import os
+import math
+import numpy as np
+
+try:
+    import talib
+except ImportError:
+    talib = None
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+def _jit(func):
+    # Sin Numba los kernels funcionan igual (en Python puro), solo que más lentos
+    return njit(cache=True, nogil=True)(func) if njit is not None else func
+
+
+# Periodos que usa full_analysis: el backend Numba los calcula en dos pasadas fusionadas
+FUSED_PERIODS = {
+    'ema': (10, 12, 26, 55),
+    'sma': 20,
+    'rsi': 14,
+    'window': 20,
+    'dmi': 14,
+}
+
+
+# ---------------------------------------------------------------------------
+# Kernels (mismo orden de operaciones que TA-Lib para obtener resultados idénticos)
+# ---------------------------------------------------------------------------
+
+@_jit
+def _sma_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    total = 0.0
+    for i in range(n):
+        total += x[i]
+        if i >= period - 1:
+            out[i] = total / period
+            total -= x[i - period + 1]
+    return out
+
+
+@_jit
+def _ema_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    k = 2.0 / (period + 1)
+    seed = 0.0
+    prev = 0.0
+    for i in range(n):
+        if i < period - 1:
+            seed += x[i]
+        elif i == period - 1:
+            seed += x[i]
+            prev = seed / period
+            out[i] = prev
+        else:
+            prev = ((x[i] - prev) * k) + prev
+            out[i] = prev
+    return out
+
+
+@_jit
+def _stddev_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    total1 = 0.0
+    total2 = 0.0
+    for i in range(n):
+        value = x[i]
+        total1 += value
+        total2 += value * value
+        if i >= period - 1:
+            mean1 = total1 / period
+            mean2 = total2 / period
+            trailing = x[i - period + 1]
+            total1 -= trailing
+            total2 -= trailing * trailing
+            variance = mean2 - mean1 * mean1
+            out[i] = math.sqrt(variance) if variance >= 0.00000001 else 0.0
+    return out
+
+
+@_jit
+def _rsi_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    if n <= period:
+        return out
+    gain = 0.0
+    loss = 0.0
+    for i in range(1, period + 1):
+        diff = x[i] - x[i - 1]
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+    loss /= period
+    gain /= period
+    total = gain + loss
+    out[period] = 100.0 * (gain / total) if not -0.00000001 < total < 0.00000001 else 0.0
+    for i in range(period + 1, n):
+        diff = x[i] - x[i - 1]
+        loss *= (period - 1)
+        gain *= (period - 1)
+        if diff < 0:
+            loss -= diff
+        else:
+            gain += diff
+        loss /= period
+        gain /= period
+        total = gain + loss
+        out[i] = 100.0 * (gain / total) if not -0.00000001 < total < 0.00000001 else 0.0
+    return out
+
+
+@_jit
+def _trange_kernel(high, low, close):
+    n = len(close)
+    out = np.full(n, np.nan)
+    for i in range(1, n):
+        prev_close = close[i - 1]
+        greatest = high[i] if high[i] > prev_close else prev_close
+        lowest = low[i] if low[i] < prev_close else prev_close
+        out[i] = greatest - lowest
+    return out
+
+
+@_jit
+def _max_kernel(x, period):
+    # Se guarda el índice del máximo y solo se reescanea la ventana cuando sale de ella
+    n = len(x)
+    out = np.full(n, np.nan)
+    best_idx = -1
+    best = 0.0
+    for i in range(period - 1, n):
+        trailing = i - period + 1
+        if best_idx < trailing:
+            best_idx = trailing
+            best = x[trailing]
+            for j in range(trailing + 1, i + 1):
+                if x[j] > best:
+                    best_idx = j
+                    best = x[j]
+        elif x[i] >= best:
+            best_idx = i
+            best = x[i]
+        out[i] = best
+    return out
+
+
+@_jit
+def _min_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    best_idx = -1
+    best = 0.0
+    for i in range(period - 1, n):
+        trailing = i - period + 1
+        if best_idx < trailing:
+            best_idx = trailing
+            best = x[trailing]
+            for j in range(trailing + 1, i + 1):
+                if x[j] < best:
+                    best_idx = j
+                    best = x[j]
+        elif x[i] <= best:
+            best_idx = i
+            best = x[i]
+        out[i] = best
+    return out
+
+
+@_jit
+def _atr_kernel(tr, period):
+    # tr[0] es NaN: la semilla es la SMA de tr[1..period], luego suavizado de Wilder
+    n = len(tr)
+    out = np.full(n, np.nan)
+    if n <= period:
+        return out
+    prev = 0.0
+    for i in range(1, period + 1):
+        prev += tr[i]
+    prev = prev / period
+    out[period] = prev
+    for i in range(period + 1, n):
+        prev *= period - 1
+        prev += tr[i]
+        prev /= period
+        out[i] = prev
+    return out
+
+
+@_jit
+def _linearreg_kernel(x, period):
+    n = len(x)
+    out = np.full(n, np.nan)
+    sum_x = period * (period - 1) * 0.5
+    sum_x_sqr = float(period * (period - 1) * (2 * period - 1) // 6)
+    divisor = sum_x * sum_x - period * sum_x_sqr
+    for today in range(period - 1, n):
+        sum_xy = 0.0
+        sum_y = 0.0
+        for i in range(period - 1, -1, -1):
+            value = x[today - i]
+            sum_y += value
+            sum_xy += float(i) * value
+        m = (period * sum_xy - sum_x * sum_y) / divisor
+        b = (sum_y - m * sum_x) / period
+        out[today] = b + m * float(period - 1)
+    return out
+
+
+@_jit
+def _dmi_kernel(high, low, tr, period):
+    n = len(high)
+    plus_di = np.full(n, np.nan)
+    minus_di = np.full(n, np.nan)
+    adx = np.full(n, np.nan)
+    if n <= period:
+        return plus_di, minus_di, adx
+    sum_plus = 0.0
+    sum_minus = 0.0
+    sum_tr = 0.0
+    sum_dx = 0.0
+    prev_adx = 0.0
+    for i in range(1, n):
+        up = high[i] - high[i - 1]
+        down = low[i - 1] - low[i]
+        plus_dm = 0.0
+        minus_dm = 0.0
+        if down > 0 and up < down:
+            minus_dm = down
+        elif up > 0 and up > down:
+            plus_dm = up
+        if i < period:
+            sum_plus += plus_dm
+            sum_minus += minus_dm
+            sum_tr += tr[i]
+            continue
+        sum_plus = sum_plus - sum_plus / period + plus_dm
+        sum_minus = sum_minus - sum_minus / period + minus_dm
+        sum_tr = sum_tr - sum_tr / period + tr[i]
+        has_dx = False
+        dx = 0.0
+        if -0.00000001 < sum_tr < 0.00000001:
+            plus_di[i] = 0.0
+            minus_di[i] = 0.0
+        else:
+            pdi = 100.0 * (sum_plus / sum_tr)
+            mdi = 100.0 * (sum_minus / sum_tr)
+            plus_di[i] = pdi
+            minus_di[i] = mdi
+            total = mdi + pdi
+            if not -0.00000001 < total < 0.00000001:
+                dx = 100.0 * (abs(mdi - pdi) / total)
+                has_dx = True
+        if i < 2 * period:
+            if has_dx:
+                sum_dx += dx
+            if i == 2 * period - 1:
+                prev_adx = sum_dx / period
+                adx[i] = prev_adx
+        else:
+            if has_dx:
+                prev_adx = ((prev_adx * (period - 1)) + dx) / period
+            adx[i] = prev_adx
+    return plus_di, minus_di, adx
+
+
+@_jit
+def _close_pass(close, ema_periods, sma_period, rsi_period):
+    """Una pasada sobre close: varias EMA, SMA, STDDEV (mismo periodo que la SMA) y RSI"""
+    n = len(close)
+    n_ema = len(ema_periods)
+    emas = np.full((n_ema, n), np.nan)
+    sma = np.full(n, np.nan)
+    std = np.full(n, np.nan)
+    rsi = np.full(n, np.nan)
+
+    ema_seed = np.zeros(n_ema)
+    ema_prev = np.zeros(n_ema)
+    ema_k = np.empty(n_ema)
+    for e in range(n_ema):
+        ema_k[e] = 2.0 / (ema_periods[e] + 1)
+    total1 = 0.0
+    total2 = 0.0
+    gain = 0.0
+    loss = 0.0
+
+    for i in range(n):
+        value = close[i]
+
+        for e in range(n_ema):
+            period = ema_periods[e]
+            if i < period - 1:
+                ema_seed[e] += value
+            elif i == period - 1:
+                ema_seed[e] += value
+                ema_prev[e] = ema_seed[e] / period
+                emas[e, i] = ema_prev[e]
+            else:
+                ema_prev[e] = ((value - ema_prev[e]) * ema_k[e]) + ema_prev[e]
+                emas[e, i] = ema_prev[e]
+
+        total1 += value
+        total2 += value * value
+        if i >= sma_period - 1:
+            trailing = close[i - sma_period + 1]
+            sma[i] = total1 / sma_period
+            mean1 = total1 / sma_period
+            mean2 = total2 / sma_period
+            total1 -= trailing
+            total2 -= trailing * trailing
+            variance = mean2 - mean1 * mean1
+            std[i] = math.sqrt(variance) if variance >= 0.00000001 else 0.0
+
+        if i >= 1 and n > rsi_period:
+            diff = value - close[i - 1]
+            if i <= rsi_period:
+                if diff < 0:
+                    loss -= diff
+                else:
+                    gain += diff
+                if i == rsi_period:
+                    loss /= rsi_period
+                    gain /= rsi_period
+            else:
+                loss *= (rsi_period - 1)
+                gain *= (rsi_period - 1)
+                if diff < 0:
+                    loss -= diff
+                else:
+                    gain += diff
+                loss /= rsi_period
+                gain /= rsi_period
+            if i >= rsi_period:
+                total = gain + loss
+                rsi[i] = 100.0 * (gain / total) if not -0.00000001 < total < 0.00000001 else 0.0
+
+    return emas, sma, std, rsi
+
+
+@_jit
+def _hlc_pass(high, low, close, window, dmi_period):
+    """Una pasada sobre high/low/close: TR, SMA(TR), MAX, MIN y +DI/-DI/ADX"""
+    n = len(close)
+    tr = np.full(n, np.nan)
+    tr_sma = np.full(n, np.nan)
+    highest = np.full(n, np.nan)
+    lowest = np.full(n, np.nan)
+    plus_di = np.full(n, np.nan)
+    minus_di = np.full(n, np.nan)
+    adx = np.full(n, np.nan)
+
+    tr_total = 0.0
+    sum_plus = 0.0
+    sum_minus = 0.0
+    sum_tr = 0.0
+    sum_dx = 0.0
+    prev_adx = 0.0
+    period = dmi_period
+
+    hi_idx = -1
+    lo_idx = -1
+    hi = 0.0
+    lo = 0.0
+
+    for i in range(n):
+        if i >= window - 1:
+            trailing = i - window + 1
+            if hi_idx < trailing:
+                hi_idx = trailing
+                hi = high[trailing]
+                for j in range(trailing + 1, i + 1):
+                    if high[j] > hi:
+                        hi_idx = j
+                        hi = high[j]
+            elif high[i] >= hi:
+                hi_idx = i
+                hi = high[i]
+            if lo_idx < trailing:
+                lo_idx = trailing
+                lo = low[trailing]
+                for j in range(trailing + 1, i + 1):
+                    if low[j] < lo:
+                        lo_idx = j
+                        lo = low[j]
+            elif low[i] <= lo:
+                lo_idx = i
+                lo = low[i]
+            highest[i] = hi
+            lowest[i] = lo
+
+        if i == 0:
+            continue
+
+        prev_close = close[i - 1]
+        greatest = high[i] if high[i] > prev_close else prev_close
+        least = low[i] if low[i] < prev_close else prev_close
+        tr_i = greatest - least
+        tr[i] = tr_i
+
+        # SMA del TR: TA-Lib empieza en el primer valor no NaN (índice 1)
+        tr_total += tr_i
+        if i >= window:
+            tr_sma[i] = tr_total / window
+            tr_total -= tr[i - window + 1]
+
+        if n <= period:
+            continue
+        up = high[i] - high[i - 1]
+        down = low[i - 1] - low[i]
+        plus_dm = 0.0
+        minus_dm = 0.0
+        if down > 0 and up < down:
+            minus_dm = down
+        elif up > 0 and up > down:
+            plus_dm = up
+        if i < period:
+            sum_plus += plus_dm
+            sum_minus += minus_dm
+            sum_tr += tr_i
+            continue
+        sum_plus = sum_plus - sum_plus / period + plus_dm
+        sum_minus = sum_minus - sum_minus / period + minus_dm
+        sum_tr = sum_tr - sum_tr / period + tr_i
+        has_dx = False
+        dx = 0.0
+        if -0.00000001 < sum_tr < 0.00000001:
+            plus_di[i] = 0.0
+            minus_di[i] = 0.0
+        else:
+            pdi = 100.0 * (sum_plus / sum_tr)
+            mdi = 100.0 * (sum_minus / sum_tr)
+            plus_di[i] = pdi
+            minus_di[i] = mdi
+            total = mdi + pdi
+            if not -0.00000001 < total < 0.00000001:
+                dx = 100.0 * (abs(mdi - pdi) / total)
+                has_dx = True
+        if i < 2 * period:
+            if has_dx:
+                sum_dx += dx
+            if i == 2 * period - 1:
+                prev_adx = sum_dx / period
+                adx[i] = prev_adx
+        else:
+            if has_dx:
+                prev_adx = ((prev_adx * (period - 1)) + dx) / period
+            adx[i] = prev_adx
+
+    return tr, tr_sma, highest, lowest, plus_di, minus_di, adx
+
+
+# ---------------------------------------------------------------------------
+# Backends
+# ---------------------------------------------------------------------------
+
+def _first_valid(*arrays):
+    # Igual que el wrapper de TA-Lib: se ignoran los NaN iniciales de las entradas
+    valid = ~np.isnan(arrays[0])
+    for arr in arrays[1:]:
+        valid &= ~np.isnan(arr)
+    idx = np.flatnonzero(valid)
+    return int(idx[0]) if len(idx) else len(arrays[0])
+
+
+def _pad(result, start, n):
+    out = np.full(n, np.nan)
+    out[start:] = result
+    return out
+
+
+class TalibBackend:
+    name = 'talib'
+
+    def SMA(self, x, timeperiod=30):
+        return talib.SMA(x, timeperiod=timeperiod)
+
+    def EMA(self, x, timeperiod=30):
+        return talib.EMA(x, timeperiod=timeperiod)
+
+    def STDDEV(self, x, timeperiod=5):
+        return talib.STDDEV(x, timeperiod=timeperiod)
+
+    def RSI(self, x, timeperiod=14):
+        return talib.RSI(x, timeperiod=timeperiod)
+
+    def TRANGE(self, high, low, close):
+        return talib.TRANGE(high, low, close)
+
+    def MAX(self, x, timeperiod=30):
+        return talib.MAX(x, timeperiod=timeperiod)
+
+    def MIN(self, x, timeperiod=30):
+        return talib.MIN(x, timeperiod=timeperiod)
+
+    def LINEARREG(self, x, timeperiod=14):
+        return talib.LINEARREG(x, timeperiod=timeperiod)
+
+    def ATR(self, high, low, close, tr, timeperiod=14):
+        return talib.ATR(high, low, close, timeperiod=timeperiod)
+
+    def DMI(self, high, low, close, tr, timeperiod=14):
+        # TA-Lib recalcula el TR internamente; el TR compartido solo lo aprovecha Numba
+        return {
+            'plus_di': talib.PLUS_DI(high, low, close, timeperiod=timeperiod),
+            'minus_di': talib.MINUS_DI(high, low, close, timeperiod=timeperiod),
+            'adx': talib.ADX(high, low, close, timeperiod=timeperiod)
+        }
+
+    def prefetch(self, ctx):
+        pass
+
+
+class NumbaBackend:
+    name = 'numba'
+
+    def _single(self, kernel, x, *args):
+        x = np.asarray(x, dtype=float)
+        if len(x) == 0 or not np.isnan(x[0]):
+            return kernel(x, *args)
+        start = _first_valid(x)
+        return _pad(kernel(x[start:], *args), start, len(x))
+
+    def SMA(self, x, timeperiod=30):
+        return self._single(_sma_kernel, x, timeperiod)
+
+    def EMA(self, x, timeperiod=30):
+        return self._single(_ema_kernel, x, timeperiod)
+
+    def STDDEV(self, x, timeperiod=5):
+        return self._single(_stddev_kernel, x, timeperiod)
+
+    def RSI(self, x, timeperiod=14):
+        return self._single(_rsi_kernel, x, timeperiod)
+
+    def MAX(self, x, timeperiod=30):
+        return self._single(_max_kernel, x, timeperiod)
+
+    def MIN(self, x, timeperiod=30):
+        return self._single(_min_kernel, x, timeperiod)
+
+    def LINEARREG(self, x, timeperiod=14):
+        return self._single(_linearreg_kernel, x, timeperiod)
+
+    def TRANGE(self, high, low, close):
+        high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+        start = _first_valid(high, low, close)
+        return _pad(_trange_kernel(high[start:], low[start:], close[start:]), start, len(close))
+
+    def ATR(self, high, low, close, tr, timeperiod=14):
+        tr = np.asarray(tr, dtype=float)
+        start = _first_valid(high, low, close)
+        return _pad(_atr_kernel(tr[start:], timeperiod), start, len(tr))
+
+    def DMI(self, high, low, close, tr, timeperiod=14):
+        high, low, close = (np.asarray(a, dtype=float) for a in (high, low, close))
+        start = _first_valid(high, low, close)
+        n = len(close)
+        plus_di, minus_di, adx = _dmi_kernel(high[start:], low[start:], np.asarray(tr, dtype=float)[start:], timeperiod)
+        return {'plus_di': _pad(plus_di, start, n), 'minus_di': _pad(minus_di, start, n), 'adx': _pad(adx, start, n)}
+
+    def prefetch(self, ctx):
+        """Siembra la caché del contexto con las series de full_analysis en dos pasadas"""
+        if len(ctx.close) == 0 or np.isnan(ctx.close).any() or np.isnan(ctx.high).any() or np.isnan(ctx.low).any():
+            return
+        ema_periods = np.array(FUSED_PERIODS['ema'], dtype=np.int64)
+        sma_period = FUSED_PERIODS['sma']
+        rsi_period = FUSED_PERIODS['rsi']
+        window = FUSED_PERIODS['window']
+        dmi_period = FUSED_PERIODS['dmi']
+
+        emas, sma, std, rsi = _close_pass(ctx.close, ema_periods, sma_period, rsi_period)
+        for period, values in zip(FUSED_PERIODS['ema'], emas):
+            ctx.seed(values, 'ema', period)
+        ctx.seed(sma, 'sma', sma_period)
+        ctx.seed(std, 'stddev', sma_period)
+        ctx.seed(rsi, 'rsi', rsi_period)
+
+        tr, tr_sma, highest, lowest, plus_di, minus_di, adx = _hlc_pass(ctx.high, ctx.low, ctx.close, window, dmi_period)
+        ctx.seed(tr, 'tr')
+        ctx.seed(tr_sma, 'tr_sma', window)
+        ctx.seed(highest, 'highest', window)
+        ctx.seed(lowest, 'lowest', window)
+        ctx.seed({'plus_di': plus_di, 'minus_di': minus_di, 'adx': adx}, 'dmi', dmi_period)
+
+
+BACKENDS = {'talib': TalibBackend, 'numba': NumbaBackend}
+_backends = {}
+
+
+def get_backend(name=None):
+    """Backend de indicadores: INDICATOR_BACKEND=talib|numba; por defecto TA-Lib si está instalado"""
+    name = name or os.environ.get('INDICATOR_BACKEND') or ('talib' if talib is not None else 'numba')
+    if name == 'talib' and talib is None:
+        print("❌ TA-Lib no está instalado, se usa el backend Numba")
+        name = 'numba'
+    if name not in _backends:
+        _backends[name] = BACKENDS[name]()
+    return _backends[name]
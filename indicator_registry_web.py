@@ -0,0 +1,199 @@
+import numpy as np
+from indicator_backend_web import get_backend
+
+# Registro declarativo: nombre -> (función, dependencias)
+# Las dependencias son tuplas (nombre, *parámetros) que IndicatorContext
+# resuelve una sola vez y pasa a la función como argumentos posicionales.
+INDICATORS = {}
+
+
+def indicator(name, deps=()):
+    def decorator(func):
+        INDICATORS[name] = (func, deps)
+        return func
+    return decorator
+
+
+def _resolve_deps(deps, params):
+    return deps(*params) if callable(deps) else deps
+
+
+class IndicatorContext:
+    """Series OHLCV de un DataFrame más una caché de indicadores ya calculados"""
+
+    def __init__(self, df, backend=None):
+        self.backend = backend or get_backend()
+        self.close = df['close'].to_numpy(dtype=float)
+        self.high = df['high'].to_numpy(dtype=float)
+        self.low = df['low'].to_numpy(dtype=float)
+        self.volume = df['volume'].to_numpy(dtype=float)
+        self.timestamp = df['timestamp'].to_numpy() if 'timestamp' in df.columns else None
+        self._cache = {}
+        self.backend.prefetch(self)
+
+    def seed(self, value, name, *params):
+        self._cache[(name,) + params] = value
+
+    def get(self, name, *params):
+        key = (name,) + params
+        if key not in self._cache:
+            func, deps = INDICATORS[name]
+            resolved = [self.get(*dep) for dep in _resolve_deps(deps, params)]
+            self._cache[key] = func(self, *params, *resolved)
+        return self._cache[key]
+
+    def computed(self):
+        return list(self._cache)
+
+
+# --- Series base ---
+
+@indicator('sma')
+def _sma(ctx, period):
+    return ctx.backend.SMA(ctx.close, timeperiod=period)
+
+
+@indicator('ema')
+def _ema(ctx, period):
+    return ctx.backend.EMA(ctx.close, timeperiod=period)
+
+
+@indicator('stddev')
+def _stddev(ctx, period):
+    return ctx.backend.STDDEV(ctx.close, timeperiod=period)
+
+
+@indicator('rsi')
+def _rsi(ctx, period):
+    return ctx.backend.RSI(ctx.close, timeperiod=period)
+
+
+@indicator('volume_sma')
+def _volume_sma(ctx, period):
+    return ctx.backend.SMA(ctx.volume, timeperiod=period)
+
+
+@indicator('highest')
+def _highest(ctx, period):
+    return ctx.backend.MAX(ctx.high, timeperiod=period)
+
+
+@indicator('lowest')
+def _lowest(ctx, period):
+    return ctx.backend.MIN(ctx.low, timeperiod=period)
+
+
+@indicator('tr')
+def _tr(ctx):
+    return ctx.backend.TRANGE(ctx.high, ctx.low, ctx.close)
+
+
+@indicator('tr_sma', deps=lambda period: [('tr',)])
+def _tr_sma(ctx, period, tr):
+    return ctx.backend.SMA(tr, timeperiod=period)
+
+
+@indicator('atr', deps=lambda period: [('tr',)])
+def _atr(ctx, period, tr):
+    return ctx.backend.ATR(ctx.high, ctx.low, ctx.close, tr, timeperiod=period)
+
+
+@indicator('dmi', deps=lambda period: [('tr',)])
+def _dmi(ctx, period, tr):
+    """+DI, -DI y ADX; el backend Numba reutiliza el TR compartido"""
+    return ctx.backend.DMI(ctx.high, ctx.low, ctx.close, tr, timeperiod=period)
+
+
+# --- Indicadores compuestos ---
+
+@indicator('macd', deps=lambda fast, slow, signal: [('ema', fast), ('ema', slow)])
+def _macd(ctx, fast, slow, signal, ema_fast, ema_slow):
+    line = ema_fast - ema_slow
+    signal_line = ctx.backend.EMA(line, timeperiod=signal)
+    return {'macd': line, 'signal': signal_line, 'histogram': line - signal_line}
+
+
+@indicator('bollinger', deps=lambda period, mult: [('sma', period), ('stddev', period)])
+def _bollinger(ctx, period, mult, basis, stddev):
+    upper = basis + mult * stddev
+    lower = basis - mult * stddev
+    width = upper - lower
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent_b = np.where(width > 0, (ctx.close - lower) / width, 0.5)
+        bandwidth = np.where(basis > 0, width / basis * 100, 0.0)
+    return {'upper': upper, 'lower': lower, 'percent_b': percent_b, 'bandwidth': bandwidth}
+
+
+@indicator('keltner', deps=lambda period, mult: [('sma', period), ('tr_sma', period)])
+def _keltner(ctx, period, mult, basis, range_ma):
+    return {'upper': basis + range_ma * mult, 'lower': basis - range_ma * mult}
+
+
+@indicator('atr_stops', deps=lambda period, mult: [('atr', period)])
+def _atr_stops(ctx, period, mult, atr):
+    return {'atr': atr, 'long_stop': ctx.close - mult * atr, 'short_stop': ctx.close + mult * atr}
+
+
+def session_starts(timestamp, n):
+    """(inicio de cada sesión UTC, anclado a la ventana). Con velas de un día o más cada vela
+    sería su propia sesión y el VWAP sería el precio típico: se ancla al inicio de la ventana"""
+    starts = np.zeros(n, dtype=bool)
+    starts[:1] = True
+    if timestamp is None or n < 2:
+        return starts, False
+    day = timestamp.astype('datetime64[D]')
+    daily = np.concatenate([[True], day[1:] != day[:-1]])
+    if daily[1:].all():
+        return starts, True
+    return daily, False
+
+
+@indicator('vwap')
+def _vwap(ctx):
+    """VWAP de sesión: se reinicia cada día UTC (anclado a la ventana en timeframes de 1d o más)"""
+    typical = (ctx.high + ctx.low + ctx.close) / 3
+    pv = typical * ctx.volume
+    n = len(typical)
+    starts, _ = session_starts(ctx.timestamp, n)
+    # Suma acumulada por sesión sin groupby: se resta lo acumulado antes de cada inicio
+    session_start = np.maximum.accumulate(np.where(starts, np.arange(n), 0))
+    cum_pv = np.cumsum(pv)
+    cum_v = np.cumsum(ctx.volume)
+    session_pv = cum_pv - (cum_pv - pv)[session_start]
+    session_v = cum_v - (cum_v - ctx.volume)[session_start]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(session_v > 0, session_pv / session_v, typical)
+
+
+@indicator('ichimoku', deps=lambda tenkan, kijun, senkou: [
+    ('highest', tenkan), ('lowest', tenkan),
+    ('highest', kijun), ('lowest', kijun),
+    ('highest', senkou), ('lowest', senkou)])
+def _ichimoku(ctx, tenkan, kijun, senkou, h_tenkan, l_tenkan, h_kijun, l_kijun, h_senkou, l_senkou):
+    tenkan_sen = (h_tenkan + l_tenkan) / 2
+    kijun_sen = (h_kijun + l_kijun) / 2
+    if len(tenkan_sen) <= kijun:
+        empty = np.full(len(tenkan_sen), np.nan)
+        return {'tenkan': tenkan_sen, 'kijun': kijun_sen, 'senkou_a': empty, 'senkou_b': empty}
+    # Las nubes se proyectan kijun velas hacia delante: la nube "actual" es la de hace kijun velas
+    senkou_a = np.concatenate([np.full(kijun, np.nan), ((tenkan_sen + kijun_sen) / 2)[:-kijun]])
+    senkou_b = np.concatenate([np.full(kijun, np.nan), ((h_senkou + l_senkou) / 2)[:-kijun]])
+    return {'tenkan': tenkan_sen, 'kijun': kijun_sen, 'senkou_a': senkou_a, 'senkou_b': senkou_b}
+
+
+@indicator('obv')
+def _obv(ctx):
+    direction = np.sign(np.diff(ctx.close, prepend=ctx.close[0]))
+    return np.cumsum(direction * ctx.volume) + ctx.volume[0]
+
+
+@indicator('stoch_rsi', deps=lambda rsi_period, stoch_period, k, d: [('rsi', rsi_period)])
+def _stoch_rsi(ctx, rsi_period, stoch_period, k, d, rsi):
+    highest = ctx.backend.MAX(rsi, timeperiod=stoch_period)
+    lowest = ctx.backend.MIN(rsi, timeperiod=stoch_period)
+    span = highest - lowest
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stoch = np.where(span > 0, (rsi - lowest) / span * 100, 50.0)
+    stoch[np.isnan(highest)] = np.nan
+    k_line = ctx.backend.SMA(stoch, timeperiod=k)
+    return {'k': k_line, 'd': ctx.backend.SMA(k_line, timeperiod=d)}
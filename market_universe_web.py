@@ -0,0 +1,73 @@
+import re
+import numpy as np
+import pandas as pd
+
+QUOTE_CURRENCY = 'USDT'
+
+# Tokens apalancados y stablecoins: no tiene sentido aplicarles la estrategia EMA.
+# BTCUP/BTCDOWN solo cuentan como apalancados si BTC también cotiza contra USDT (JUP no es "J"+UP)
+LEVERAGED_PATTERN = re.compile(r'^(.+)(UP|DOWN|BULL|BEAR)$')
+STABLECOINS = {'USDC', 'BUSD', 'TUSD', 'FDUSD', 'USDP', 'DAI', 'EUR', 'AEUR', 'USDE'}
+
+
+def _flagged_leveraged(market):
+    # Binance marca los tokens apalancados en los permisos del símbolo (exchangeInfo)
+    info = market.get('info') or {}
+    permissions = list(info.get('permissions') or [])
+    for permission_set in info.get('permissionSets') or []:
+        permissions.extend(permission_set)
+    return 'LEVERAGED' in permissions
+
+
+def is_leveraged(base, market, bases):
+    if _flagged_leveraged(market):
+        return True
+    match = LEVERAGED_PATTERN.match(base)
+    return match is not None and match.group(1) in bases
+
+
+def load_usdt_universe(markets):
+    """Pares spot activos contra USDT a partir de exchange.load_markets()"""
+    candidates = {}
+    for symbol, market in markets.items():
+        if not market.get('spot') or market.get('quote') != QUOTE_CURRENCY:
+            continue
+        if market.get('active') is False:
+            continue
+        base = market.get('base', '')
+        if base in STABLECOINS:
+            continue
+        candidates[symbol] = (base, market)
+    bases = {base for base, _ in candidates.values()}
+    return sorted(symbol for symbol, (base, market) in candidates.items()
+                  if not is_leveraged(base, market, bases))
+
+
+def tickers_to_frame(tickers):
+    rows = [
+        (symbol, t.get('last'), t.get('high'), t.get('low'), t.get('quoteVolume'), t.get('percentage'))
+        for symbol, t in tickers.items()
+    ]
+    df = pd.DataFrame(rows, columns=['symbol', 'last', 'high', 'low', 'quote_volume', 'change_percent'])
+    numeric = ['last', 'high', 'low', 'quote_volume', 'change_percent']
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+def screen_tickers(tickers, top_n=20, min_quote_volume=1_000_000, volume_weight=0.6):
+    """Primera etapa del escáner: ranking barato sobre los tickers de 24h.
+
+    Puntúa cada par por volumen en USDT (escala logarítmica) y rango intradía
+    relativo, y devuelve los top_n candidatos para el análisis completo.
+    """
+    df = tickers_to_frame(tickers)
+    df = df.dropna(subset=['last', 'high', 'low', 'quote_volume'])
+    df = df[(df['last'] > 0) & (df['quote_volume'] >= min_quote_volume)]
+    if df.empty:
+        return df
+
+    df = df.assign(volatility_percent=(df['high'] - df['low']) / df['last'] * 100)
+    volume_rank = np.log10(df['quote_volume']).rank(pct=True)
+    volatility_rank = df['volatility_percent'].rank(pct=True)
+    df = df.assign(screen_score=volume_weight * volume_rank + (1 - volume_weight) * volatility_rank)
+    return df.nlargest(top_n, 'screen_score').reset_index(drop=True)
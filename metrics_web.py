@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Buckets en segundos, pensados para llamadas de red (fetch) y cálculos locales
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def _label_key(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key, extra=None):
+    items = list(key)
+    if extra:
+        items.append(extra)
+    if not items:
+        return ''
+    escaped = [f'{k}="{_escape(v)}"' for k, v in items]
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsRegistry:
+    def __init__(self, buckets=DEFAULT_BUCKETS, max_traces=50):
+        self._lock = threading.Lock()
+        self.buckets = tuple(buckets)
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+        self.tracing_enabled = os.environ.get('METRICS_TRACE', '0') == '1'
+        self.traces = deque(maxlen=max_traces)
+
+    def describe(self, name, text):
+        self.help[name] = text
+
+    def inc(self, name, value=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    hist['counts'][i] += 1
+                    break
+            hist['sum'] += seconds
+            hist['count'] += 1
+        self._record_span(name, seconds, labels)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name, **labels):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    # --- Tracing por petición ---
+
+    @contextmanager
+    def trace(self, name, **attrs):
+        """Traza de una petición con los spans de los timers que se ejecutan dentro.
+        Dentro de otra traza (p. ej. un fragment en una ejecución completa de la página)
+        no abre una nueva: queda como un span más de la traza en curso"""
+        if not self.tracing_enabled:
+            yield None
+            return
+        outer = _current_trace.get()
+        if outer is not None:
+            start = time.perf_counter()
+            try:
+                yield outer
+            finally:
+                self._record_span(name, time.perf_counter() - start, attrs)
+            return
+        trace = {'name': name, 'attrs': attrs, 'started_at': time.time(), 'spans': []}
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            trace['duration'] = time.perf_counter() - start
+            _current_trace.reset(token)
+            with self._lock:
+                self.traces.append(trace)
+
+    def _record_span(self, name, seconds, labels):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace['spans'].append({'metric': name, 'labels': labels, 'duration': seconds})
+
+    # --- Exposición ---
+
+    def render_prometheus(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self.counters):
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} counter')
+                for key, value in sorted(self.counters[name].items()):
+                    lines.append(f'{name}{_format_labels(key)} {value}')
+            for name in sorted(self.histograms):
+                if name in self.help:
+                    lines.append(f'# HELP {name} {self.help[name]}')
+                lines.append(f'# TYPE {name} histogram')
+                for key, hist in sorted(self.histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, hist['counts']):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_format_labels(key, ("le", bound))} {cumulative}')
+                    lines.append(f'{name}_bucket{_format_labels(key, ("le", "+Inf"))} {hist["count"]}')
+                    lines.append(f'{name}_sum{_format_labels(key)} {hist["sum"]}')
+                    lines.append(f'{name}_count{_format_labels(key)} {hist["count"]}')
+        return '\n'.join(lines) + '\n'
+
+    def render_traces(self):
+        with self._lock:
+            return json.dumps(list(self.traces), default=str)
+
+
+METRICS = MetricsRegistry()
+METRICS.describe('exchange_fetch_seconds', 'Duración de las llamadas al exchange')
+METRICS.describe('exchange_errors_total', 'Errores devueltos por el exchange')
+METRICS.describe('analyzer_seconds', 'Duración de los cálculos de TechnicalAnalyzer')
+METRICS.describe('analyzer_fallback_total', 'Resultados por defecto devueltos por TechnicalAnalyzer')
+METRICS.describe('cache_hits_total', 'Aciertos de caché')
+METRICS.describe('cache_misses_total', 'Fallos de caché')
+METRICS.describe('page_render_seconds', 'Duración del renderizado de páginas')
+
+
+def record_fallback(method, reason):
+    METRICS.inc('analyzer_fallback_total', method=method, reason=reason)
+
+
+def record_cache(cache, hit):
+    METRICS.inc('cache_hits_total' if hit else 'cache_misses_total', cache=cache)
+
+
+# Rutas adicionales: path -> handler(query) que devuelve (status, body, content_type)
+_routes = {}
+
+
+def register_route(path, handler):
+    _routes[path] = handler
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = METRICS
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        # /metrics, /metrics/ y /metrics?... son la misma ruta
+        path = url.path.rstrip('/') or '/'
+        if path in _routes:
+            query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+            try:
+                status, body, content_type = _routes[path](query)
+            except Exception as e:
+                status, body, content_type = 500, str(e).encode('utf-8'), 'text/plain'
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == '/metrics':
+            body = self.registry.render_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif path == '/traces':
+            body = self.registry.render_traces().encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_response(404)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_failed = False
+_server_lock = threading.Lock()
+
+
+def start_metrics_server(port=None, address='127.0.0.1', span=None):
+    """Arranca (una sola vez por proceso) el endpoint /metrics en un hilo daemon.
+    Con varios workers cada proceso toma el primer puerto libre de METRICS_PORT a
+    METRICS_PORT + METRICS_PORT_SPAN - 1; si no queda ninguno no se reintenta en cada rerun"""
+    global _server, _server_failed
+    port = int(port or os.environ.get('METRICS_PORT', 9108))
+    span = int(span or os.environ.get('METRICS_PORT_SPAN', 16))
+    with _server_lock:
+        if _server is not None or _server_failed:
+            return _server
+        error = None
+        for candidate in range(port, port + max(1, span)):
+            try:
+                _server = ThreadingHTTPServer((address, candidate), _MetricsHandler)
+                break
+            except OSError as e:
+                error = e
+        if _server is None:
+            _server_failed = True
+            print(f"❌ No se pudo iniciar el servidor de métricas en {address}:{port}-{port + span - 1}: {error}")
+            return None
+        thread = threading.Thread(target=_server.serve_forever, name='metrics-server', daemon=True)
+        thread.start()
+        print(f"✅ Métricas disponibles en http://{address}:{_server.server_port}/metrics (pid {os.getpid()})")
+        return _server
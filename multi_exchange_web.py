@@ -0,0 +1,290 @@
+import time
+import threading
+import warnings
+import contextvars
+import numpy as np
+import ccxt
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metrics_web import METRICS
+
+# Una cotización que se aleja más de esto de la mediana de las demás se descarta (mala impresión)
+MAX_DEVIATION = 0.02
+# Tiempo máximo de una petición compuesta y espera extra a los exchanges lentos tras el primero
+COMPOSITE_TIMEOUT = 3.0
+STRAGGLER_WAIT = 0.3
+# Un exchange con errores de red queda fuera de la rotación durante este tiempo
+COOLDOWN = 30.0
+LATENCY_ALPHA = 0.3
+# Suavizado de la cuota de volumen de cada exchange por símbolo (para reescalar velas parciales)
+SHARE_ALPHA = 0.2
+
+# Errores del exchange que no indican caída (par o timeframe no soportado, parámetros...)
+NETWORK_ERRORS = (ccxt.NetworkError, ccxt.ExchangeNotAvailable)
+
+
+def _ohlcv_cube(results, max_deviation):
+    """(exchanges, timestamps, velas [exchange, vela, ohlcv], válidas) alineadas por timestamp.
+    Una vela es válida si su cierre está cerca de la mediana de los exchanges en esa vela"""
+    names = [name for name, rows in results.items() if len(rows)]
+    series = [np.asarray(results[name], dtype=float).reshape(-1, 6) for name in names]
+    if not series:
+        return names, None, None, None
+    timestamps = np.unique(np.concatenate([rows[:, 0] for rows in series]))
+    cube = np.full((len(series), len(timestamps), 5), np.nan)
+    for venue, rows in enumerate(series):
+        cube[venue, np.searchsorted(timestamps, rows[:, 0])] = rows[:, 1:]
+
+    close = cube[:, :, 3]
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        median = np.nanmedian(close, axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        valid = np.abs(close / median - 1) <= max_deviation
+    return names, timestamps, cube, valid
+
+
+def volume_shares(results, max_deviation=MAX_DEVIATION):
+    """Cuota de volumen de cada exchange medida en las velas en las que todos son válidos"""
+    names, _, cube, valid = _ohlcv_cube(results, max_deviation)
+    if cube is None:
+        return {}
+    complete = valid.all(axis=0)
+    volume = np.nan_to_num(cube[:, complete, 4]).sum(axis=1)
+    if volume.sum() <= 0:
+        return {}
+    return dict(zip(names, (volume / volume.sum()).tolist()))
+
+
+def composite_ohlcv(results, max_deviation=MAX_DEVIATION, limit=None, shares=None):
+    """Velas compuestas ponderadas por volumen a partir de {exchange: [[ts, o, h, l, c, v], ...]}.
+    Cada vela usa solo los exchanges válidos. El volumen de una vela parcial (exchanges que no
+    respondieron a tiempo, sin esa vela o descartados) se reescala por la cuota de volumen
+    habitual de los que sí contribuyen (shares: {exchange: cuota}; por defecto cuotas iguales
+    entre los que respondieron), para que el volumen no salte al cambiar los exchanges"""
+    names, timestamps, cube, valid = _ohlcv_cube(results, max_deviation)
+    if cube is None:
+        return []
+
+    volume = np.where(valid, np.nan_to_num(cube[:, :, 4]), 0.0)
+    # Sin volumen en ninguna vela válida se usa la media simple de los exchanges válidos
+    weights = np.where(volume.sum(axis=0) > 0, volume, valid.astype(float))
+    total = weights.sum(axis=0)
+    prices = np.where(valid[:, :, None], cube[:, :, :4], 0.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        composite = (prices * weights[:, :, None]).sum(axis=0) / total[:, None]
+
+    shares = dict(shares or {})
+    for name in names:
+        shares.setdefault(name, 1.0 / len(names))
+    share = np.array([shares[name] for name in names])
+    coverage = (share[:, None] * valid).sum(axis=0) / sum(shares.values())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        composite_volume = np.where(coverage > 0, volume.sum(axis=0) / coverage, 0.0)
+
+    rows = np.column_stack([timestamps, composite, composite_volume])
+    rows = rows[total > 0]
+    return rows[-limit:].tolist() if limit else rows.tolist()
+
+
+def composite_ticker(results, max_deviation=MAX_DEVIATION):
+    """Ticker compuesto: último precio ponderado por volumen, mejor bid/ask y volumen total"""
+    tickers = [(name, t) for name, t in results.items() if t and t.get('last')]
+    if not tickers:
+        return None
+    last = np.array([t['last'] for _, t in tickers], dtype=float)
+    volume = np.array([t.get('quoteVolume') or 0.0 for _, t in tickers], dtype=float)
+    valid = np.abs(last / np.median(last) - 1) <= max_deviation
+    weights = np.where(valid, volume, 0.0)
+    if weights.sum() <= 0:
+        weights = valid.astype(float)
+    price = float((last * weights).sum() / weights.sum())
+
+    used = [t for (_, t), ok in zip(tickers, valid) if ok]
+    bids = [t['bid'] for t in used if t.get('bid')]
+    asks = [t['ask'] for t in used if t.get('ask')]
+    highs = [t['high'] for t in used if t.get('high')]
+    lows = [t['low'] for t in used if t.get('low')]
+    return {
+        'symbol': tickers[0][1].get('symbol'),
+        'timestamp': max((t.get('timestamp') or 0) for t in used),
+        'last': price,
+        'close': price,
+        'bid': max(bids) if bids else None,
+        'ask': min(asks) if asks else None,
+        'high': max(highs) if highs else None,
+        'low': min(lows) if lows else None,
+        'baseVolume': sum(t.get('baseVolume') or 0.0 for t in used),
+        'quoteVolume': sum(t.get('quoteVolume') or 0.0 for t in used),
+        'info': {'venues': [name for (name, _), ok in zip(tickers, valid) if ok]}
+    }
+
+
+class ExchangeAggregator:
+    """Varios exchanges ccxt detrás de la interfaz de uno solo.
+    fetch_ohlcv y fetch_ticker consultan en paralelo y combinan; fetch_order_book prueba los
+    exchanges por orden de preferencia (sanos y más rápidos primero) hasta que uno responde.
+    load_markets y fetch_tickers van siempre al exchange principal (el primero): el universo
+    y su ranking de volumen son los de ese exchange, no los del que haya respondido"""
+
+    id = 'aggregate'
+
+    def __init__(self, exchanges, max_deviation=MAX_DEVIATION, timeout=COMPOSITE_TIMEOUT,
+                 straggler_wait=STRAGGLER_WAIT, cooldown=COOLDOWN):
+        if not exchanges:
+            raise ValueError("Se necesita al menos un exchange")
+        self.exchanges = dict(exchanges)
+        self.primary = next(iter(self.exchanges))
+        self.max_deviation = max_deviation
+        self.timeout = timeout
+        self.straggler_wait = straggler_wait
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        # Las instancias ccxt síncronas no son seguras entre hilos y su enableRateLimit solo
+        # espaciaría bien las peticiones de un hilo: una llamada a la vez por exchange
+        self._venue_locks = {name: threading.Lock() for name in self.exchanges}
+        self._health = {name: {'latency': None, 'down_until': 0.0} for name in self.exchanges}
+        self._shares = {}
+        # Compartido por todas las sesiones del proceso (ver get_aggregator)
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.exchanges), thread_name_prefix='exchange')
+
+    @classmethod
+    def from_ids(cls, ids, config=None, **kwargs):
+        exchanges = {}
+        for exchange_id in ids:
+            exchange_class = getattr(ccxt, exchange_id, None)
+            if exchange_class is None:
+                print(f"❌ Exchange desconocido en ccxt: {exchange_id}")
+                continue
+            exchanges[exchange_id] = exchange_class(dict(config or {}))
+        return cls(exchanges, **kwargs)
+
+    def close(self):
+        """Detiene el pool de hilos; las peticiones en curso terminan, las nuevas fallan"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- Salud y preferencia ---
+
+    def ranked(self):
+        """Sanos por latencia media (los aún no medidos en su orden original); caídos al final"""
+        now = time.time()
+        order = list(self.exchanges)
+        with self._lock:
+            health = {name: dict(state) for name, state in self._health.items()}
+        healthy = [n for n in order if health[n]['down_until'] <= now]
+        down = [n for n in order if health[n]['down_until'] > now]
+        healthy.sort(key=lambda n: (health[n]['latency'] is not None, health[n]['latency'] or 0.0))
+        return healthy + down
+
+    def _healthy(self):
+        now = time.time()
+        with self._lock:
+            return [n for n in self.exchanges if self._health[n]['down_until'] <= now]
+
+    def _call(self, name, method, *args, **kwargs):
+        try:
+            with self._venue_locks[name]:
+                # La latencia se mide sin la espera por el lock
+                start = time.perf_counter()
+                with METRICS.timer('exchange_venue_seconds', exchange=name, method=method):
+                    result = getattr(self.exchanges[name], method)(*args, **kwargs)
+                elapsed = time.perf_counter() - start
+        except NETWORK_ERRORS as e:
+            with self._lock:
+                self._health[name]['down_until'] = time.time() + self.cooldown
+            METRICS.inc('exchange_venue_errors_total', exchange=name, method=method, error=type(e).__name__)
+            raise
+        except Exception as e:
+            METRICS.inc('exchange_venue_errors_total', exchange=name, method=method, error=type(e).__name__)
+            raise
+        with self._lock:
+            state = self._health[name]
+            state['latency'] = elapsed if state['latency'] is None else \
+                LATENCY_ALPHA * elapsed + (1 - LATENCY_ALPHA) * state['latency']
+            state['down_until'] = 0.0
+        return result
+
+    def _failover(self, method, *args, **kwargs):
+        error = None
+        for name in self.ranked():
+            try:
+                return self._call(name, method, *args, **kwargs)
+            except Exception as e:
+                error = e
+                METRICS.inc('exchange_failover_total', exchange=name, method=method)
+        raise error
+
+    def _fan_out(self, method, *args, **kwargs):
+        """Consulta todos los exchanges sanos a la vez. Espera al primero que responde y como mucho
+        straggler_wait más a los demás, para que un exchange lento no marque la latencia"""
+        names = self._healthy() or list(self.exchanges)
+        # Cada llamada lleva una copia del contexto: los timers por exchange van a la traza de la petición
+        futures = {self._executor.submit(contextvars.copy_context().run, self._call, name, method,
+                                         *args, **kwargs): name for name in names}
+        deadline = time.monotonic() + self.timeout
+        results, errors, pending = {}, [], set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    errors.append(e)
+            if results:
+                deadline = min(deadline, time.monotonic() + self.straggler_wait)
+        if not results:
+            raise errors[0] if errors else ccxt.RequestTimeout(f"{method}: sin respuesta de ningún exchange")
+        METRICS.inc('exchange_composite_total', method=method, venues=len(results))
+        return results
+
+    # --- Interfaz ccxt ---
+
+    def _learn_shares(self, symbol, results):
+        observed = volume_shares(results, self.max_deviation)
+        with self._lock:
+            shares = self._shares.setdefault(symbol, {})
+            for name, share in observed.items():
+                shares[name] = share if name not in shares else \
+                    SHARE_ALPHA * share + (1 - SHARE_ALPHA) * shares[name]
+            return dict(shares)
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=None, params=None):
+        results = self._fan_out('fetch_ohlcv', symbol, timeframe, since=since, limit=limit)
+        return composite_ohlcv(results, self.max_deviation, limit, self._learn_shares(symbol, results))
+
+    def fetch_ticker(self, symbol, params=None):
+        ticker = composite_ticker(self._fan_out('fetch_ticker', symbol), self.max_deviation)
+        if ticker is None:
+            raise ccxt.BadResponse(f"Ningún exchange devolvió precio para {symbol}")
+        return ticker
+
+    def fetch_order_book(self, symbol, limit=None, params=None):
+        return self._failover('fetch_order_book', symbol, limit=limit)
+
+    def fetch_tickers(self, symbols=None, params=None):
+        return self._call(self.primary, 'fetch_tickers', symbols)
+
+    def load_markets(self, reload=False, params=None):
+        return self._call(self.primary, 'load_markets', reload)
+
+
+_aggregators = {}
+_aggregators_lock = threading.Lock()
+
+
+def get_aggregator(ids, config=None):
+    """Agregador único por proceso para esos exchanges: cada sesión de Streamlit lo reutiliza
+    en lugar de crear sus propias instancias ccxt y su propio pool de hilos"""
+    key = tuple(ids)
+    with _aggregators_lock:
+        if key not in _aggregators:
+            _aggregators[key] = ExchangeAggregator.from_ids(ids, config)
+        return _aggregators[key]
+
+
+METRICS.describe('exchange_venue_seconds', 'Duración de las llamadas a cada exchange del agregador')
+METRICS.describe('exchange_venue_errors_total', 'Errores por exchange del agregador')
+METRICS.describe('exchange_failover_total', 'Peticiones que pasaron al siguiente exchange')
+METRICS.describe('exchange_composite_total', 'Peticiones compuestas por número de exchanges que respondieron')
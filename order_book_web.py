@@ -0,0 +1,261 @@
+import numpy as np
+
+
+class BookSide:
+    """Un lado del libro: precios ascendentes en un buffer con hueco libre a ambos extremos.
+
+    Los niveles existentes se actualizan en sitio y los borrados quedan con tamaño 0
+    (se lleva la cuenta sin recorrer el lado). Una inserción desplaza solo el tramo entre
+    ella y el extremo más cercano, que para los niveles cerca del mejor precio es pequeño
+    en los dos lados; los huecos se compactan de forma amortizada.
+    """
+
+    COMPACT_RATIO = 0.25
+    MIN_CAPACITY = 64
+
+    def __init__(self, levels):
+        arr = np.asarray([level[:2] for level in levels], dtype=float).reshape(-1, 2)
+        arr = arr[arr[:, 1] > 0]
+        order = np.argsort(arr[:, 0], kind='stable')
+        self._reset(arr[order, 0], arr[order, 1])
+
+    def _reset(self, prices, sizes, extra=0):
+        n = len(prices)
+        capacity = max(self.MIN_CAPACITY, 2 * (n + extra))
+        self._start = (capacity - n) // 2
+        self._end = self._start + n
+        self._prices = np.empty(capacity)
+        self._sizes = np.empty(capacity)
+        self._prices[self._start:self._end] = prices
+        self._sizes[self._start:self._end] = sizes
+        self.empty = int(n - np.count_nonzero(sizes))
+
+    @property
+    def prices(self):
+        return self._prices[self._start:self._end]
+
+    @property
+    def sizes(self):
+        return self._sizes[self._start:self._end]
+
+    def __len__(self):
+        return self._end - self._start
+
+    def apply(self, updates):
+        upd = np.asarray([level[:2] for level in updates], dtype=float).reshape(-1, 2)
+        if len(upd) == 0:
+            return
+
+        # Si un precio aparece varias veces en el mismo diff, gana la última
+        rev_prices = upd[::-1, 0]
+        _, first = np.unique(rev_prices, return_index=True)
+        upd = upd[::-1][first]
+        upd_prices, upd_sizes = upd[:, 0], upd[:, 1]
+
+        prices, sizes = self.prices, self.sizes
+        idx = np.searchsorted(prices, upd_prices)
+        in_bounds = idx < len(prices)
+        exists = np.zeros(len(upd_prices), dtype=bool)
+        exists[in_bounds] = prices[idx[in_bounds]] == upd_prices[in_bounds]
+
+        # Niveles existentes: cambio de tamaño o borrado (tamaño 0) en sitio
+        at = idx[exists]
+        self.empty += int(np.count_nonzero(upd_sizes[exists] == 0) - np.count_nonzero(sizes[at] == 0))
+        sizes[at] = upd_sizes[exists]
+
+        new = ~exists & (upd_sizes > 0)
+        if new.any():
+            self._insert(idx[new], upd_prices[new], upd_sizes[new])
+
+        if self.empty and self.empty > self.COMPACT_RATIO * len(self):
+            keep = self.sizes > 0
+            self._reset(self.prices[keep], self.sizes[keep])
+
+    def _insert(self, positions, prices, sizes):
+        """positions: índices (ordenados) del tramo actual delante de los que va cada nivel nuevo"""
+        k, n = len(positions), len(self)
+        if self._start < k and len(self._prices) - self._end < k:
+            self._reset(np.insert(self.prices, positions, prices), np.insert(self.sizes, positions, sizes), k)
+            return
+        # Se mueve el tramo más corto: [inicio, última inserción) hacia la izquierda
+        # o [primera inserción, final) hacia la derecha
+        left = self._start >= k and (positions[-1] <= n - positions[0] or len(self._prices) - self._end < k)
+        if left:
+            lo, hi = self._start, self._start + int(positions[-1])
+            segment = slice(lo - k, hi)
+            offsets = positions
+        else:
+            lo, hi = self._start + int(positions[0]), self._end
+            segment = slice(lo, hi + k)
+            offsets = positions - positions[0]
+        self._prices[segment] = np.insert(self._prices[lo:hi], offsets, prices)
+        self._sizes[segment] = np.insert(self._sizes[lo:hi], offsets, sizes)
+        if left:
+            self._start -= k
+        else:
+            self._end += k
+
+
+class OrderBook:
+    """Libro de órdenes con cada lado ordenado de forma ascendente por precio (ver BookSide).
+    bid_prices/bid_sizes/ask_prices/ask_sizes son vistas NumPy sin copia de los niveles"""
+
+    def __init__(self, bids, asks, last_update_id=None, symbol=None):
+        self.symbol = symbol
+        self.bids = BookSide(bids)
+        self.asks = BookSide(asks)
+        self.last_update_id = last_update_id
+        self.needs_resync = False
+
+    @classmethod
+    def from_ccxt(cls, book, symbol=None):
+        return cls(book.get('bids', []), book.get('asks', []), book.get('nonce'), symbol)
+
+    @property
+    def bid_prices(self):
+        return self.bids.prices
+
+    @property
+    def bid_sizes(self):
+        return self.bids.sizes
+
+    @property
+    def ask_prices(self):
+        return self.asks.prices
+
+    @property
+    def ask_sizes(self):
+        return self.asks.sizes
+
+    # --- Actualizaciones ---
+
+    def apply_diff(self, bids, asks, first_update_id=None, final_update_id=None):
+        """Aplica un diff estilo Binance (U/u). Devuelve False si hay que pedir un snapshot nuevo"""
+        if final_update_id is not None and self.last_update_id is not None:
+            if final_update_id <= self.last_update_id:
+                return True
+            if first_update_id is not None and first_update_id > self.last_update_id + 1:
+                self.needs_resync = True
+                return False
+
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        if final_update_id is not None:
+            self.last_update_id = final_update_id
+        return True
+
+    # --- Consultas ---
+
+    def best_bid(self):
+        for i in range(len(self.bid_sizes) - 1, -1, -1):
+            if self.bid_sizes[i] > 0:
+                return float(self.bid_prices[i])
+        return None
+
+    def best_ask(self):
+        for i in range(len(self.ask_sizes)):
+            if self.ask_sizes[i] > 0:
+                return float(self.ask_prices[i])
+        return None
+
+    def mid_price(self):
+        bid, ask = self.best_bid(), self.best_ask()
+        if bid is None or ask is None:
+            return bid or ask
+        return (bid + ask) / 2
+
+
+class DepthAnalyzer:
+    def __init__(self, book):
+        self.book = book
+
+    def spread_percent(self):
+        bid, ask = self.book.best_bid(), self.book.best_ask()
+        if bid is None or ask is None:
+            return None
+        return (ask - bid) / ((ask + bid) / 2) * 100
+
+    def _band(self, prices, sizes, low, high):
+        lo = np.searchsorted(prices, low, side='left')
+        hi = np.searchsorted(prices, high, side='right')
+        return prices[lo:hi], sizes[lo:hi]
+
+    def liquidity_in_band(self, price, band_percent=0.5):
+        low, high = price * (1 - band_percent / 100), price * (1 + band_percent / 100)
+        bp, bs = self._band(self.book.bid_prices, self.book.bid_sizes, low, high)
+        ap, as_ = self._band(self.book.ask_prices, self.book.ask_sizes, low, high)
+        return float(np.dot(bp, bs)), float(np.dot(ap, as_))
+
+    def imbalance(self, price, band_percent=0.5):
+        bid_notional, ask_notional = self.liquidity_in_band(price, band_percent)
+        total = bid_notional + ask_notional
+        if total <= 0:
+            return 0.0
+        return (bid_notional - ask_notional) / total
+
+    def liquidity_walls(self, side, window_percent=5.0, z_score=3.0, max_walls=3):
+        mid = self.book.mid_price()
+        if mid is None:
+            return []
+        if side == 'bid':
+            prices, sizes = self._band(self.book.bid_prices, self.book.bid_sizes, mid * (1 - window_percent / 100), mid)
+        else:
+            prices, sizes = self._band(self.book.ask_prices, self.book.ask_sizes, mid, mid * (1 + window_percent / 100))
+        live = sizes > 0
+        prices, sizes = prices[live], sizes[live]
+        if len(sizes) < 3:
+            return []
+        notional = prices * sizes
+        threshold = notional.mean() + z_score * notional.std()
+        walls = np.flatnonzero(notional > threshold)
+        walls = walls[np.argsort(notional[walls])[::-1]][:max_walls]
+        return [{'price': float(prices[i]), 'size': float(sizes[i]), 'notional': float(notional[i])} for i in walls]
+
+    def slippage(self, side, amount, in_quote=False):
+        """Precio medio y deslizamiento de una orden a mercado. side='buy' consume asks, 'sell' consume bids"""
+        if side == 'buy':
+            prices, sizes = self.book.ask_prices, self.book.ask_sizes
+        else:
+            prices, sizes = self.book.bid_prices[::-1], self.book.bid_sizes[::-1]
+        live = sizes > 0
+        prices, sizes = prices[live], sizes[live]
+        if len(prices) == 0 or amount <= 0:
+            return {'avg_price': None, 'slippage_percent': 0.0, 'filled_percent': 0.0, 'complete': False}
+
+        consumed = prices * sizes if in_quote else sizes
+        cumulative = np.cumsum(consumed)
+        last = int(np.searchsorted(cumulative, amount, side='left'))
+        complete = last < len(cumulative)
+        last = min(last, len(cumulative) - 1)
+
+        filled_before = cumulative[last - 1] if last > 0 else 0.0
+        remaining = min(amount, cumulative[last]) - filled_before
+        if in_quote:
+            base = sizes[:last].sum() + remaining / prices[last]
+            quote = filled_before + remaining
+        else:
+            base = filled_before + remaining
+            quote = np.dot(prices[:last], sizes[:last]) + remaining * prices[last]
+
+        avg_price = quote / base
+        best = prices[0]
+        slippage = abs(avg_price - best) / best * 100
+        filled = (quote if in_quote else base) / amount * 100
+        return {'avg_price': float(avg_price), 'slippage_percent': float(slippage),
+                'filled_percent': float(min(filled, 100.0)), 'complete': bool(complete)}
+
+    def level_report(self, levels, band_percent=0.5):
+        """Liquidez e imbalance alrededor de cada nivel (entrada, stop, targets)"""
+        report = {}
+        for name, price in levels.items():
+            if price is None or price <= 0:
+                continue
+            bid_notional, ask_notional = self.liquidity_in_band(price, band_percent)
+            total = bid_notional + ask_notional
+            report[name] = {
+                'price': price,
+                'bid_notional': bid_notional,
+                'ask_notional': ask_notional,
+                'imbalance': (bid_notional - ask_notional) / total if total > 0 else 0.0
+            }
+        return report
@@ -0,0 +1,208 @@
+import math
+import time
+from collections import deque
+import numpy as np
+from metrics_web import METRICS
+from shared_cache_web import get_shared_cache, next_candle_close, CLOSE_GRACE
+from candle_integrity_web import MISSING
+
+TRENDING, RANGING, VOLATILE, UNKNOWN = 'TENDENCIA', 'LATERAL', 'VOLATIL', 'INDETERMINADO'
+
+# Orden del escáner: la estrategia de cruce de EMAs solo tiene sentido con tendencia
+PRIORITY = {TRENDING: 0, UNKNOWN: 1, VOLATILE: 2, RANGING: 3}
+
+ADX_TREND = 25.0
+EFFICIENCY_TREND = 0.3
+VOLATILITY_SPIKE = 1.5
+
+# El estado incremental sobrevive a varias velas; la etiqueta solo hasta el cierre de la actual
+STATE_TTL = 7 * 86400
+
+
+class RegimeTracker:
+    """Volatilidad, ADX y efficiency ratio actualizados vela a vela (O(1) por vela cerrada)"""
+
+    def __init__(self, vol_period=20, long_vol_period=100, er_period=20, adx_period=14):
+        self.vol_period = vol_period
+        self.er_period = er_period
+        self.adx_period = adx_period
+        self.long_alpha = 2.0 / (long_vol_period + 1)
+        self.last_ts = None
+        self.bars = 0
+        self.prev = None
+        # Volatilidad: ventana de retornos con sumas acumuladas y varianza EWMA de largo plazo
+        self.returns = deque()
+        self.ret_sum = 0.0
+        self.ret_sq = 0.0
+        self.long_var = None
+        # Efficiency ratio: cierres de la ventana y suma de movimientos absolutos
+        self.closes = deque()
+        self.moves = deque()
+        self.path = 0.0
+        # ADX de Wilder
+        self.tr_s = self.plus_s = self.minus_s = 0.0
+        self.dx_seed = []
+        self.adx = None
+
+    # --- Estado serializable (la caché compartida solo guarda JSON) ---
+
+    def to_state(self):
+        state = dict(vars(self))
+        for name in ('returns', 'closes', 'moves'):
+            state[name] = list(state[name])
+        return state
+
+    @classmethod
+    def from_state(cls, state):
+        tracker = cls.__new__(cls)
+        vars(tracker).update(state)
+        for name in ('returns', 'closes', 'moves'):
+            setattr(tracker, name, deque(state[name]))
+        return tracker
+
+    def update(self, ts, high, low, close):
+        if self.prev is not None:
+            prev_high, prev_low, prev_close = self.prev
+            self._update_volatility(math.log(close / prev_close))
+            self._update_adx(high, low, prev_high, prev_low, prev_close)
+        self._update_efficiency(close)
+        self.prev = (high, low, close)
+        self.last_ts = ts
+        self.bars += 1
+
+    def _update_volatility(self, ret):
+        self.returns.append(ret)
+        self.ret_sum += ret
+        self.ret_sq += ret * ret
+        if len(self.returns) > self.vol_period:
+            old = self.returns.popleft()
+            self.ret_sum -= old
+            self.ret_sq -= old * old
+        sq = ret * ret
+        self.long_var = sq if self.long_var is None else self.long_alpha * sq + (1 - self.long_alpha) * self.long_var
+
+    def _update_efficiency(self, close):
+        if self.closes:
+            move = abs(close - self.closes[-1])
+            self.moves.append(move)
+            self.path += move
+        self.closes.append(close)
+        if len(self.closes) > self.er_period + 1:
+            self.closes.popleft()
+            self.path -= self.moves.popleft()
+
+    def _update_adx(self, high, low, prev_high, prev_low, prev_close):
+        period = self.adx_period
+        tr = max(high - low, abs(high - prev_close), abs(low - prev_close))
+        up, down = high - prev_high, prev_low - low
+        plus_dm = up if up > down and up > 0 else 0.0
+        minus_dm = down if down > up and down > 0 else 0.0
+        steps = self.bars  # velas con movimiento, contando esta
+        if steps <= period:
+            self.tr_s += tr
+            self.plus_s += plus_dm
+            self.minus_s += minus_dm
+            if steps < period:
+                return
+        else:
+            self.tr_s += tr - self.tr_s / period
+            self.plus_s += plus_dm - self.plus_s / period
+            self.minus_s += minus_dm - self.minus_s / period
+        if self.tr_s <= 0:
+            dx = 0.0
+        else:
+            plus_di, minus_di = self.plus_s / self.tr_s, self.minus_s / self.tr_s
+            total = plus_di + minus_di
+            dx = 100 * abs(plus_di - minus_di) / total if total > 0 else 0.0
+        if self.adx is None:
+            self.dx_seed.append(dx)
+            if len(self.dx_seed) == period:
+                self.adx = sum(self.dx_seed) / period
+                self.dx_seed = []
+        else:
+            self.adx = (self.adx * (period - 1) + dx) / period
+
+    # --- Lectura ---
+
+    def features(self):
+        n = len(self.returns)
+        volatility = math.sqrt(max(self.ret_sq / n - (self.ret_sum / n) ** 2, 0.0)) if n > 1 else None
+        long_vol = math.sqrt(self.long_var) if self.long_var else None
+        efficiency = None
+        if len(self.closes) == self.er_period + 1:
+            efficiency = abs(self.closes[-1] - self.closes[0]) / self.path if self.path > 0 else 0.0
+        return {
+            'adx': self.adx,
+            'efficiency': efficiency,
+            'volatility': volatility,
+            'volatility_ratio': volatility / long_vol if volatility is not None and long_vol else None,
+            'bars': self.bars
+        }
+
+    def label(self):
+        f = self.features()
+        if f['adx'] is None or f['efficiency'] is None or f['volatility_ratio'] is None:
+            return UNKNOWN
+        if f['volatility_ratio'] >= VOLATILITY_SPIKE:
+            return VOLATILE
+        if f['adx'] >= ADX_TREND and f['efficiency'] >= EFFICIENCY_TREND:
+            return TRENDING
+        return RANGING
+
+
+def _closed_bars(df):
+    # La última vela de ccxt es la que se está formando: no entra en el estado incremental
+    closed = df.iloc[:-1]
+    if 'quality' in closed.columns:
+        closed = closed[closed['quality'] != MISSING]
+    ts = closed['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+    return ts, closed['high'].to_numpy(dtype=float), closed['low'].to_numpy(dtype=float), \
+        closed['close'].to_numpy(dtype=float)
+
+
+def detect_regime(symbol, timeframe, df, cache=None):
+    """Actualiza el estado del símbolo/timeframe con las velas cerradas nuevas y publica
+    la etiqueta en la caché compartida hasta el cierre de la vela en curso"""
+    cache = cache or get_shared_cache()
+    if df is None or len(df) < 2:
+        return None
+    ts, high, low, close = _closed_bars(df)
+    if len(ts) == 0:
+        return None
+
+    state = cache.get(f"regime_state:{symbol}:{timeframe}")
+    tracker = RegimeTracker.from_state(state) if state else None
+    # Un estado que no enlaza con estas velas (hueco largo, caché vacía) se reconstruye
+    if tracker is None or tracker.last_ts is None or tracker.last_ts < ts[0]:
+        tracker = RegimeTracker()
+    start = np.searchsorted(ts, tracker.last_ts, side='right') if tracker.last_ts is not None else 0
+    for i in range(start, len(ts)):
+        tracker.update(int(ts[i]), float(high[i]), float(low[i]), float(close[i]))
+
+    regime = {'regime': tracker.label(), **tracker.features(), 'updated_at': time.time()}
+    cache.set(f"regime_state:{symbol}:{timeframe}", tracker.to_state(), time.time() + STATE_TTL)
+    cache.set(f"regime:{symbol}:{timeframe}", regime, next_candle_close(timeframe) + CLOSE_GRACE)
+    METRICS.inc('regime_labels_total', timeframe=timeframe, regime=regime['regime'])
+    return regime
+
+
+def cached_regime(symbol, timeframe, cache=None):
+    """Etiqueta publicada para la vela en curso, sin descargar velas (None si no hay)"""
+    return (cache or get_shared_cache()).get(f"regime:{symbol}:{timeframe}")
+
+
+def describe_regime(regime):
+    if not regime:
+        return UNKNOWN
+    parts = [regime['regime']]
+    if regime.get('adx') is not None:
+        parts.append(f"ADX {regime['adx']:.1f}")
+    if regime.get('efficiency') is not None:
+        parts.append(f"eficiencia {regime['efficiency']:.2f}")
+    if regime.get('volatility_ratio') is not None:
+        parts.append(f"volatilidad x{regime['volatility_ratio']:.2f}")
+    return ' · '.join(parts)
+
+
+METRICS.describe('regime_labels_total', 'Etiquetas de régimen calculadas')
+METRICS.describe('regime_skipped_total', 'Candidatos del escáner omitidos por su régimen')
@@ -0,0 +1,242 @@
+import os
+import time
+import threading
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, wait
+from metrics_web import METRICS
+
+# Velas simuladas por operación: el "MÁXIMO" de la gestión de tiempo de cada timeframe
+HORIZON_BARS = {'15m': 8, '1h': 12, '4h': 30, '1d': 15, '1w': 8, '1M': 6}
+
+DEFAULT_PATHS = 20000
+CHUNKS = 4
+TRAIN_BARS = 500
+WALK_FORWARD_WINDOWS = 12
+WALK_FORWARD_PATHS = 2000
+# Trayectorias por tanda dentro de cada trozo: entre tandas se comprueba si se agotó el tiempo
+BATCH_PATHS = 1000
+# Bloques de velas consecutivas para conservar la autocorrelación de los retornos
+BLOCK = 4
+LATENCY_BUDGET = float(os.environ.get('RISK_LATENCY_BUDGET', 2.0))
+
+
+# --- Núcleo vectorizado (se ejecuta en los procesos del pool) ---
+
+def _bar_moves(close, high, low):
+    """Retorno logarítmico de cada vela y sus extremos, relativos al cierre anterior"""
+    prev = close[:-1]
+    return np.log(close[1:] / prev), np.log(high[1:] / prev), np.log(low[1:] / prev)
+
+
+def _first_hit(hit, horizon):
+    return np.where(hit.any(axis=1), hit.argmax(axis=1), horizon)
+
+
+def _outcomes(high_path, low_path, side, entry, stop, target_1, target_2, horizon):
+    """Vela de ejecución de la entrada y primera vela que toca cada nivel después (horizon = nunca).
+    Trayectorias y niveles en log relativo al precio actual. Una entrada límite por debajo (LONG)
+    o por encima (SHORT) del precio solo se ejecuta si el precio llega a ella; en esa misma vela
+    cuenta el stop pero no los targets, porque no se sabe si se tocaron antes de la ejecución.
+    Si stop y target caen en la misma vela se asume el stop, como en el diario de señales"""
+    bars = np.arange(high_path.shape[1])[None, :]
+    if side == 'LONG':
+        immediate = entry >= 0
+        fill_bar = np.zeros(len(low_path), dtype=np.int64) if immediate else _first_hit(low_path <= entry, horizon)
+        stop_hit, t1_hit = low_path <= stop, high_path >= target_1
+        t2_hit = high_path >= target_2 if target_2 is not None else None
+    else:
+        immediate = entry <= 0
+        fill_bar = np.zeros(len(high_path), dtype=np.int64) if immediate else _first_hit(high_path >= entry, horizon)
+        stop_hit, t1_hit = high_path >= stop, low_path <= target_1
+        t2_hit = low_path <= target_2 if target_2 is not None else None
+    filled = bars >= fill_bar[:, None]
+    after_fill = filled if immediate else bars > fill_bar[:, None]
+    stop_bar = _first_hit(stop_hit & filled, horizon)
+    t1_bar = _first_hit(t1_hit & after_fill, horizon)
+    t2_bar = _first_hit(t2_hit & after_fill, horizon) if t2_hit is not None else None
+    return fill_bar, stop_bar, t1_bar, t2_bar
+
+
+def _summarize(fill_bar, stop_bar, t1_bar, t2_bar, horizon):
+    target_first = t1_bar < stop_bar
+    stop_first = (stop_bar <= t1_bar) & (stop_bar < horizon)
+    exit_bar = np.minimum(stop_bar, t1_bar)
+    resolved = exit_bar < horizon
+    filled = fill_bar < horizon
+    return {
+        'paths': len(stop_bar),
+        'filled': int(filled.sum()),
+        'target_1': int(target_first.sum()),
+        'target_2': int((t2_bar < stop_bar).sum()) if t2_bar is not None else 0,
+        'stop': int(stop_first.sum()),
+        'open': int((filled & ~resolved).sum()),
+        'exits': int(resolved.sum()),
+        'exit_bars': float((exit_bar[resolved] + 1).sum()),
+        'target_bars': float((t1_bar[target_first] + 1).sum())
+    }
+
+
+def simulate_chunk(ret, up, down, side, entry, stop, target_1, target_2, horizon, n_paths, seed, block=BLOCK,
+                   deadline=None):
+    """Bootstrap por bloques de las velas históricas: n_paths trayectorias de horizon velas
+    desde el precio actual. Se simula por tandas de BATCH_PATHS; pasado `deadline` (epoch) el
+    trozo ya no sirve y se para entre tandas para liberar el proceso ('paths' dice cuántas
+    se completaron). None si ni siquiera empezó a tiempo"""
+    rng = np.random.default_rng(seed)
+    block = max(1, min(block, len(ret)))
+    n_blocks = -(-horizon // block)
+    results = []
+    for offset in range(0, n_paths, BATCH_PATHS):
+        if deadline is not None and time.time() > deadline:
+            break
+        batch = min(BATCH_PATHS, n_paths - offset)
+        starts = rng.integers(0, len(ret) - block + 1, size=(batch, n_blocks))
+        index = (starts[:, :, None] + np.arange(block)).reshape(batch, -1)[:, :horizon]
+        returns = ret[index]
+        path = np.cumsum(returns, axis=1)
+        previous = path - returns
+        outcomes = _outcomes(previous + up[index], previous + down[index],
+                             side, entry, stop, target_1, target_2, horizon)
+        results.append(_summarize(*outcomes, horizon))
+    return _merge(results) if results else None
+
+
+def walk_forward_window(close, high, low, end, train, side, entry, stop, target_1, target_2, horizon,
+                        n_paths, seed, deadline=None):
+    """Entrena con las train velas previas a `end` y compara la probabilidad simulada
+    con lo que ocurrió realmente en las horizon velas siguientes (None si se agotó el tiempo)"""
+    if deadline is not None and time.time() > deadline:
+        return None
+    ret, up, down = _bar_moves(close[end - train:end], high[end - train:end], low[end - train:end])
+    predicted = simulate_chunk(ret, up, down, side, entry, stop, target_1, target_2, horizon, n_paths, seed)
+    if predicted is None:
+        return None
+    price = close[end - 1]
+    future_high = np.log(high[end:end + horizon] / price)[None, :]
+    future_low = np.log(low[end:end + horizon] / price)[None, :]
+    outcomes = _outcomes(future_high, future_low, side, entry, stop, target_1, target_2, horizon)
+    realized = _summarize(*outcomes, horizon)
+    return predicted['target_1'] / predicted['paths'], realized['target_1'], realized['stop']
+
+
+# --- Pool de procesos ---
+
+_pool = None
+_pool_lock = threading.Lock()
+WORKERS = int(os.environ.get('RISK_WORKERS', min(4, os.cpu_count() or 1)))
+
+
+def get_pool():
+    """Pool compartido por las sesiones del proceso; 'spawn' evita heredar hilos de Streamlit"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def warm_up():
+    """Arranca los procesos del pool sin esperar, para que la primera simulación no pague el spawn"""
+    pool = get_pool()
+    for _ in range(WORKERS):
+        pool.submit(os.getpid)
+
+
+def _merge(results):
+    total = {}
+    for result in results:
+        for key, value in result.items():
+            total[key] = total.get(key, 0) + value
+    return total
+
+
+def _relative_levels(levels, price):
+    entry = np.log(levels['entry'] / price)
+    stop = np.log(levels['stop'] / price)
+    target_1 = np.log(levels['target_1'] / price)
+    target_2 = np.log(levels['target_2'] / price) if levels.get('target_2') else None
+    return entry, stop, target_1, target_2
+
+
+def simulate_levels(df, levels, timeframe, n_paths=DEFAULT_PATHS, budget=LATENCY_BUDGET, seed=None, price=None):
+    """Probabilidad de que se ejecute la entrada y de tocar después cada nivel antes que el stop,
+    y duración esperada de la operación. Las trayectorias salen del precio actual (price, por
+    defecto el último cierre), no de la entrada sugerida. Monte Carlo sobre las últimas
+    TRAIN_BARS velas más validación walk-forward en el pool; lo que no termina dentro de
+    `budget` segundos se descarta"""
+    if not levels or levels.get('action') not in ('LONG', 'SHORT') or not levels.get('entry'):
+        return None
+    close = df['close'].to_numpy(dtype=float)
+    high = df['high'].to_numpy(dtype=float)
+    low = df['low'].to_numpy(dtype=float)
+    horizon = HORIZON_BARS.get(timeframe, 12)
+    if len(close) < 2 * BLOCK + 1:
+        return None
+
+    side = levels['action']
+    price = close[-1] if not price else price
+    entry, stop, target_1, target_2 = _relative_levels(levels, price)
+    seed = int(time.time()) if seed is None else seed
+    train = min(TRAIN_BARS, len(close) - 1)
+    ret, up, down = _bar_moves(close[-train - 1:], high[-train - 1:], low[-train - 1:])
+
+    start = time.perf_counter()
+    with METRICS.timer('risk_simulation_seconds', timeframe=timeframe):
+        try:
+            pool = get_pool()
+            # Los trozos que siguen en marcha al agotarse el presupuesto paran solos en la siguiente
+            # tanda (cancel() solo quita los que no han empezado) y no retienen el pool
+            deadline = time.time() + budget
+            chunk = -(-n_paths // CHUNKS)
+            futures = [pool.submit(simulate_chunk, ret, up, down, side, entry, stop, target_1, target_2,
+                                   horizon, chunk, seed + i, deadline=deadline) for i in range(CHUNKS)]
+            # Ventanas walk-forward: entrenamiento de train velas y resultado real en las horizon siguientes
+            wf_train = min(TRAIN_BARS, len(close) // 2)
+            ends = np.unique(np.linspace(wf_train, len(close) - horizon, WALK_FORWARD_WINDOWS).astype(int))
+            wf_futures = [pool.submit(walk_forward_window, close, high, low, int(end), wf_train, side, entry,
+                                      stop, target_1, target_2, horizon, WALK_FORWARD_PATHS, seed + 100 + i,
+                                      deadline)
+                          for i, end in enumerate(ends)] if len(close) - horizon > wf_train else []
+            done, pending = wait(futures + wf_futures, timeout=budget)
+            for future in pending:
+                future.cancel()
+            results = [f.result() for f in futures if f in done and f.result() is not None]
+            windows = [f.result() for f in wf_futures if f in done and f.result() is not None]
+        except Exception as e:
+            # Pool roto o no disponible: todas las trayectorias en el proceso actual, sin walk-forward
+            print(f"❌ Error en el pool de simulación, se calcula en local: {e}")
+            results = [simulate_chunk(ret, up, down, side, entry, stop, target_1, target_2, horizon,
+                                      n_paths, seed)]
+            windows = []
+
+    if not results:
+        return None
+    total = _merge(results)
+    paths = total['paths']
+    resolved = total['exits']
+    summary = {
+        'paths': paths,
+        'horizon': horizon,
+        'p_fill': total['filled'] / paths,
+        'p_target_1': total['target_1'] / paths,
+        'p_target_2': total['target_2'] / paths if target_2 is not None else None,
+        'p_stop': total['stop'] / paths,
+        'p_open': total['open'] / paths,
+        'mean_exit_bars': total['exit_bars'] / resolved if resolved else None,
+        'mean_target_bars': total['target_bars'] / total['target_1'] if total['target_1'] else None,
+        'walk_forward': None,
+        'elapsed': time.perf_counter() - start
+    }
+    if windows:
+        predicted = np.array([w[0] for w in windows])
+        summary['walk_forward'] = {
+            'windows': len(windows),
+            'predicted': float(predicted.mean()),
+            'realized': sum(w[1] for w in windows) / len(windows),
+            'stopped': sum(w[2] for w in windows) / len(windows)
+        }
+    return summary
+
+
+METRICS.describe('risk_simulation_seconds', 'Duración de la simulación Monte Carlo de niveles')
@@ -0,0 +1,453 @@
+import io
+import os
+import json
+import time
+import uuid
+import mmap
+import struct
+import hashlib
+import calendar
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from metrics_web import METRICS, record_cache
+from arrow_export_web import ARROW_AVAILABLE, pa, ipc
+
+# Duración de cada vela en segundos ('1M' se trata aparte: meses naturales)
+TIMEFRAME_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+    '1h': 3600, '2h': 7200, '4h': 14400, '6h': 21600, '8h': 28800, '12h': 43200,
+    '1d': 86400, '3d': 259200, '1w': 604800
+}
+
+# Las velas semanales de Binance empiezan en lunes; la época Unix cayó en jueves
+WEEK_OFFSET = 4 * 86400
+
+# Margen tras el cierre para que Binance publique la vela cerrada
+CLOSE_GRACE = 2.0
+
+DEFAULT_MAX_AGE = float(os.environ.get('SHARED_CACHE_MAX_AGE', 60))
+DEFAULT_LEASE = 30.0
+
+# Cada cuánto repasa un proceso el directorio de la caché en fichero borrando lo caducado,
+# y edad a partir de la cual un temporal huérfano (proceso caído a mitad de escritura) se borra
+SWEEP_INTERVAL = 60.0
+ORPHAN_AGE = 60.0
+
+# Caducidad (epoch, float64) al principio de cada entrada serializada y de cada fichero
+_EXPIRY = struct.Struct('<d')
+
+
+def next_candle_close(timeframe, now=None):
+    """Instante (epoch en segundos) en que cierra la vela en curso"""
+    now = time.time() if now is None else now
+    if timeframe == '1M':
+        year, month = time.gmtime(now)[:2]
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return float(calendar.timegm((year, month, 1, 0, 0, 0)))
+    seconds = TIMEFRAME_SECONDS.get(timeframe)
+    if seconds is None:
+        return now + DEFAULT_MAX_AGE
+    offset = WEEK_OFFSET if timeframe == '1w' else 0
+    return ((now - offset) // seconds + 1) * seconds + offset
+
+
+def candle_close_expiry(timeframe, max_age=None, now=None):
+    """Caduca al cerrar la vela en curso, y como mucho a los max_age segundos
+    para que la vela que se está formando no quede congelada en timeframes largos"""
+    now = time.time() if now is None else now
+    max_age = DEFAULT_MAX_AGE if max_age is None else max_age
+    return min(next_candle_close(timeframe, now) + CLOSE_GRACE, now + max_age)
+
+
+# --- Backends: get/set/add/delete sobre bytes ---
+
+def _expired(raw, now=None):
+    return _EXPIRY.unpack_from(raw)[0] < (time.time() if now is None else now)
+
+
+class FileBackend:
+    """Almacén compartido por los procesos del mismo host: un fichero por clave
+    en /dev/shm (memoria compartida) o en el directorio temporal, leído con mmap.
+    Cada fichero empieza por su caducidad; lo caducado se borra al leerlo y en un
+    barrido periódico, para no acumular entradas en la RAM de /dev/shm"""
+
+    def __init__(self, directory=None, sweep_interval=SWEEP_INTERVAL):
+        if directory is None:
+            base = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            directory = os.path.join(base, 'analizador-cripto-cache')
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    @staticmethod
+    def _read(path):
+        # None si no existe o está vacío (un add() a medio escribir)
+        try:
+            with open(path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    raw = mm[:]
+        except (FileNotFoundError, ValueError):
+            return None
+        return raw if len(raw) >= _EXPIRY.size else None
+
+    def _remove_if(self, path, condition):
+        """Borra el fichero solo si su contenido cumple condition. Se aparta con un rename
+        atómico y se comprueba ya apartado: si otro proceso lo había reescrito se devuelve
+        a su sitio (salvo que ya haya uno más nuevo), en lugar de borrar el valor ajeno"""
+        stale = f"{path}.{uuid.uuid4().hex}.stale"
+        try:
+            os.rename(path, stale)
+        except FileNotFoundError:
+            return False
+        try:
+            if condition(self._read(stale)):
+                return True
+            try:
+                os.link(stale, path)
+            except OSError:
+                # Ya hay un valor más nuevo (o el sistema de ficheros no admite enlaces): fallo de caché
+                pass
+            return False
+        finally:
+            os.remove(stale)
+
+    def get(self, key):
+        path = self._path(key)
+        raw = self._read(path)
+        if raw is None:
+            return None
+        if _expired(raw):
+            self._remove_if(path, lambda current: current is not None and _expired(current))
+            return None
+        return raw[_EXPIRY.size:]
+
+    def set(self, key, value, ttl):
+        # Escritura atómica: los lectores ven el valor anterior o el nuevo, nunca uno a medias
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(_EXPIRY.pack(time.time() + ttl))
+            f.write(value)
+        os.replace(tmp, path)
+        self._maybe_sweep()
+
+    def add(self, key, value, ttl):
+        """Crea la clave solo si no existe (o si su lease ha caducado)"""
+        path = self._path(key)
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                raw = self._read(path)
+                if raw is None or not _expired(raw):
+                    return False
+                # Lease abandonado (proceso caído): lo retira un único proceso
+                self._remove_if(path, lambda current: current is not None and _expired(current))
+                continue
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_EXPIRY.pack(time.time() + ttl) + value)
+            return True
+        return False
+
+    def delete(self, key, expected=None):
+        path = self._path(key)
+        if expected is None:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return
+        self._remove_if(path, lambda current: current is not None and current[_EXPIRY.size:] == expected)
+
+    def _maybe_sweep(self):
+        now = time.time()
+        if now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        try:
+            self.sweep(now)
+        except OSError as e:
+            print(f"❌ Error limpiando la caché en fichero: {e}")
+
+    def sweep(self, now=None):
+        """Borra las entradas caducadas y los temporales huérfanos; devuelve cuántos ficheros borró"""
+        now = time.time() if now is None else now
+        removed = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                try:
+                    old = entry.stat().st_mtime + ORPHAN_AGE < now
+                except FileNotFoundError:
+                    continue
+                if entry.name.endswith(('.tmp', '.stale')):
+                    if old:
+                        try:
+                            os.remove(entry.path)
+                            removed += 1
+                        except FileNotFoundError:
+                            pass
+                    continue
+                raw = self._read(entry.path)
+                if (raw is None and old) or (raw is not None and _expired(raw, now)):
+                    removed += self._remove_if(entry.path, lambda current: current is None or _expired(current, now))
+        if removed:
+            METRICS.inc('cache_file_swept_total', removed)
+        return removed
+
+
+class RedisBackend:
+    """Backend de red opcional (varios hosts); requiere el paquete redis"""
+
+    # Borrado condicional: solo quien tiene el lease puede liberarlo
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.client.ping()
+
+    def get(self, key):
+        return self.client.get(key)
+
+    def set(self, key, value, ttl):
+        self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    def add(self, key, value, ttl):
+        return bool(self.client.set(key, value, px=max(1, int(ttl * 1000)), nx=True))
+
+    def delete(self, key, expected=None):
+        if expected is None:
+            self.client.delete(key)
+        else:
+            self.client.eval(self._RELEASE, 1, key, expected)
+
+
+class MemoryBackend:
+    """Sustituto local del backend de red con la misma interfaz (un solo proceso)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _alive(self, key):
+        item = self._data.get(key)
+        if item is not None and item[1] < time.time():
+            del self._data[key]
+            return None
+        return item
+
+    def get(self, key):
+        with self._lock:
+            item = self._alive(key)
+            return item[0] if item else None
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+
+    def add(self, key, value, ttl):
+        with self._lock:
+            if self._alive(key) is not None:
+                return False
+            self._data[key] = (value, time.time() + ttl)
+            return True
+
+    def delete(self, key, expected=None):
+        with self._lock:
+            item = self._alive(key)
+            if item is not None and (expected is None or item[0] == expected):
+                del self._data[key]
+
+
+# --- Serialización: JSON para valores simples, Arrow IPC para DataFrames y bytes tal cual
+# (nunca pickle: cualquiera que pueda escribir en /dev/shm o en Redis podría ejecutar código al leer) ---
+
+def _json_default(value):
+    if isinstance(value, pd.Timestamp):
+        return {'__timestamp__': value.value}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Tipo no admitido en la caché compartida: {type(value).__name__}")
+
+
+def _json_hook(obj):
+    if len(obj) == 1 and '__timestamp__' in obj:
+        return pd.Timestamp(obj['__timestamp__'])
+    return obj
+
+
+def _frame_bytes(df):
+    if ARROW_AVAILABLE:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = io.BytesIO()
+        with ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return b'A' + sink.getvalue()
+    return b'T' + df.to_json(orient='table', index=False).encode('utf-8')
+
+
+def dumps(expires_at, value):
+    if isinstance(value, bytes):
+        body = b'B' + value
+    elif isinstance(value, pd.DataFrame):
+        body = _frame_bytes(value)
+    else:
+        body = b'J' + json.dumps(value, default=_json_default, separators=(',', ':')).encode('utf-8')
+    return _EXPIRY.pack(expires_at) + body
+
+
+def loads(raw):
+    """(expires_at, valor) o None si el contenido no tiene un formato conocido"""
+    if not raw or len(raw) <= _EXPIRY.size:
+        return None
+    expires_at = _EXPIRY.unpack_from(raw)[0]
+    kind, body = raw[_EXPIRY.size:_EXPIRY.size + 1], raw[_EXPIRY.size + 1:]
+    if kind == b'B':
+        return expires_at, bytes(body)
+    if kind == b'J':
+        return expires_at, json.loads(body, object_hook=_json_hook)
+    if kind == b'A' and ARROW_AVAILABLE:
+        return expires_at, ipc.open_stream(body).read_all().to_pandas()
+    if kind == b'T':
+        return expires_at, pd.read_json(io.StringIO(body.decode('utf-8')), orient='table')
+    return None
+
+
+class SharedCache:
+    """Caché entre procesos con caducidad alineada al cierre de vela y single-flight:
+    solo un proceso recalcula una clave; el resto espera su resultado o sirve el anterior"""
+
+    def __init__(self, backend, namespace='analizador', lease=DEFAULT_LEASE, poll_interval=0.05):
+        self.backend = backend
+        self.namespace = namespace
+        self.lease = lease
+        self.poll_interval = poll_interval
+
+    def _key(self, key):
+        return f"{self.namespace}:{key}"
+
+    def _load(self, key):
+        try:
+            raw = self.backend.get(self._key(key))
+            return loads(raw)
+        except Exception as e:
+            print(f"❌ Error leyendo la caché compartida ({key}): {e}")
+            return None
+
+    def get(self, key):
+        entry = self._load(key)
+        if entry is None or entry[0] < time.time():
+            return None
+        return entry[1]
+
+    def set(self, key, value, expires_at):
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return
+        try:
+            # Se guarda más allá de la caducidad para poder servir el valor anterior
+            # mientras otro proceso lo refresca
+            self.backend.set(self._key(key), dumps(expires_at, value), ttl + self.lease)
+        except Exception as e:
+            print(f"❌ Error escribiendo en la caché compartida ({key}): {e}")
+
+    def get_or_compute(self, key, compute, expires_at, cache='shared', refresh=False):
+        """Devuelve el valor cacheado o lo calcula con compute() una sola vez entre procesos.
+        Los resultados None no se guardan (errores del exchange). refresh=True ignora el valor
+        guardado, aunque no haya caducado, y lo sustituye por uno recién calculado"""
+        entry = None if refresh else self._load(key)
+        if entry is not None and entry[0] >= time.time():
+            record_cache(cache, True)
+            return entry[1]
+        record_cache(cache, False)
+
+        lock_key = self._key(f"lock:{key}")
+        token = uuid.uuid4().hex.encode('ascii')
+        try:
+            acquired = self.backend.add(lock_key, token, self.lease)
+        except Exception as e:
+            print(f"❌ Error en el lock de la caché compartida ({key}): {e}")
+            return compute()
+
+        if not acquired and not refresh:
+            METRICS.inc('cache_singleflight_waits_total', cache=cache)
+            if entry is not None:
+                return entry[1]
+            value = self._wait(key, lock_key)
+            if value is not None:
+                return value
+            # El proceso que refrescaba falló, no dejó valor o no terminó a tiempo: calculamos nosotros
+            return compute()
+
+        try:
+            # Otro proceso pudo terminar entre nuestra lectura y el lock
+            fresh = None if refresh else self.get(key)
+            if fresh is not None:
+                return fresh
+            value = compute()
+            if value is not None:
+                self.set(key, value, expires_at)
+            return value
+        finally:
+            if acquired:
+                try:
+                    self.backend.delete(lock_key, expected=token)
+                except Exception:
+                    pass
+
+    def _wait(self, key, lock_key):
+        """Espera el valor mientras el otro proceso tenga el lock; si lo suelta sin dejar
+        valor (error o resultado None) no tiene sentido seguir esperando hasta el final del lease"""
+        deadline = time.monotonic() + self.lease
+        delay = self.poll_interval
+        while time.monotonic() < deadline:
+            time.sleep(delay)
+            value = self.get(key)
+            if value is not None:
+                return value
+            try:
+                if self.backend.get(lock_key) is None:
+                    # Pudo guardar el valor justo antes de soltar el lock
+                    return self.get(key)
+            except Exception:
+                return None
+            delay = min(delay * 2, 0.5)
+        return None
+
+
+METRICS.describe('cache_singleflight_waits_total', 'Peticiones que esperaron a que otro proceso refrescara la caché')
+METRICS.describe('cache_file_swept_total', 'Ficheros caducados o huérfanos borrados de la caché en fichero')
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_shared_cache():
+    """Caché compartida del proceso; SHARED_CACHE_URL=redis://... usa el backend de red"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            backend = None
+            url = os.environ.get('SHARED_CACHE_URL', '')
+            if url.startswith(('redis://', 'rediss://')):
+                try:
+                    backend = RedisBackend(url)
+                    print("✅ Caché compartida en red conectada")
+                except Exception as e:
+                    print(f"❌ No se pudo usar la caché en red ({e}), se usa la caché local")
+            if url == 'memory://':
+                backend = MemoryBackend()
+            if backend is None:
+                backend = FileBackend(os.environ.get('SHARED_CACHE_DIR') or None)
+            _cache = SharedCache(backend)
+        return _cache
@@ -0,0 +1,234 @@
+import os
+import time
+import queue
+import sqlite3
+import threading
+from contextlib import closing
+import numpy as np
+import pandas as pd
+
+DEFAULT_PATH = os.environ.get('SIGNAL_JOURNAL_PATH', 'signal_journal.db')
+
+COLUMNS = [
+    'symbol', 'timeframe', 'ts', 'created_at', 'signal', 'buy_score', 'sell_score',
+    'price', 'rsi', 'adx', 'ema_cross', 'trend', 'action', 'entry', 'stop', 'target_1', 'target_2'
+]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    timeframe TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    created_at INTEGER NOT NULL,
+    signal TEXT NOT NULL,
+    buy_score REAL,
+    sell_score REAL,
+    price REAL,
+    rsi REAL,
+    adx REAL,
+    ema_cross TEXT,
+    trend TEXT,
+    action TEXT,
+    entry REAL,
+    stop REAL,
+    target_1 REAL,
+    target_2 REAL,
+    outcome TEXT,
+    outcome_ts INTEGER
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_signals_symbol_tf_ts ON signals (symbol, timeframe, ts);
+CREATE INDEX IF NOT EXISTS idx_signals_signal_tf_ts ON signals (signal, timeframe, ts);
+CREATE INDEX IF NOT EXISTS idx_signals_open ON signals (symbol, timeframe, outcome) WHERE action IS NOT NULL;
+"""
+
+LEVEL_COLUMNS = ['action', 'entry', 'stop', 'target_1', 'target_2']
+
+# Niveles nuevos distintos de los guardados (en el SET, las columnas sin prefijo son la fila anterior)
+_LEVELS_CHANGED = (
+    "excluded.action IS NOT NULL AND ("
+    + ' OR '.join(f'excluded.{c} IS NOT {c}' for c in LEVEL_COLUMNS) + ")"
+)
+
+# Misma vela analizada varias veces: nos quedamos con el último cálculo. Una fila sin niveles
+# (el escáner) no borra los de la página de análisis, y el resultado ya resuelto solo se
+# descarta si cambian los niveles con los que se resolvió
+UPSERT = f"""
+INSERT INTO signals ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})
+ON CONFLICT (symbol, timeframe, ts) DO UPDATE SET
+    {', '.join(f'{c} = excluded.{c}' for c in COLUMNS[3:] if c not in LEVEL_COLUMNS)},
+    {', '.join(f'{c} = COALESCE(excluded.{c}, {c})' if c == 'action' else
+               f'{c} = CASE WHEN excluded.action IS NULL THEN {c} ELSE excluded.{c} END'
+               for c in LEVEL_COLUMNS)},
+    outcome = CASE WHEN {_LEVELS_CHANGED} THEN NULL ELSE outcome END,
+    outcome_ts = CASE WHEN {_LEVELS_CHANGED} THEN NULL ELSE outcome_ts END
+"""
+
+
+def build_entry(analysis, symbol, timeframe, candle_ts, signal, buy_score, sell_score, levels=None):
+    """Fila del diario a partir de full_analysis y de los niveles de la recomendación"""
+    levels = levels or {}
+    return {
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'ts': int(pd.Timestamp(candle_ts).value // 1_000_000),
+        'created_at': int(time.time() * 1000),
+        'signal': signal,
+        'buy_score': buy_score,
+        'sell_score': sell_score,
+        'price': analysis['current_price'],
+        'rsi': analysis['rsi'],
+        'adx': analysis['adx']['adx'],
+        'ema_cross': analysis['moving_averages']['ema_cross_status'],
+        'trend': analysis['trend'],
+        'action': levels.get('action'),
+        'entry': levels.get('entry'),
+        'stop': levels.get('stop'),
+        'target_1': levels.get('target_1'),
+        'target_2': levels.get('target_2')
+    }
+
+
+class SignalJournal:
+    """Diario de señales en SQLite con escritura asíncrona por lotes"""
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=100, flush_interval=1.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        # El context manager de sqlite3 solo hace commit/rollback: closing() cierra la conexión
+        with closing(self._connect()) as conn, conn:
+            conn.executescript(SCHEMA)
+        self._writer = threading.Thread(target=self._run, name='signal-journal', daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    # --- Escritura (nunca bloquea el hilo de Streamlit) ---
+
+    def record(self, entry):
+        self._queue.put(('insert', entry))
+
+    def resolve_outcomes(self, symbol, timeframe, df):
+        """Encola la resolución de señales abiertas con las velas de df (stop o target 1 primero)"""
+        if df is None or df.empty:
+            return
+        ts = (df['timestamp'].astype('datetime64[ms]').astype('int64')).to_numpy()
+        self._queue.put(('resolve', (symbol, timeframe, ts,
+                                     df['high'].to_numpy(dtype=float), df['low'].to_numpy(dtype=float))))
+
+    def flush(self):
+        self._queue.join()
+
+    def _run(self):
+        conn = self._connect()
+        while True:
+            batch, tasks = [], []
+            try:
+                kind, payload = self._queue.get()
+            except Exception:
+                continue
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                (batch if kind == 'insert' else tasks).append(payload)
+                if len(batch) >= self.batch_size:
+                    break
+                try:
+                    kind, payload = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+            try:
+                if batch:
+                    conn.executemany(UPSERT, [tuple(row.get(c) for c in COLUMNS) for row in batch])
+                for task in tasks:
+                    self._resolve(conn, *task)
+                conn.commit()
+            except Exception as e:
+                conn.rollback()
+                print(f"❌ Error escribiendo en el diario de señales: {e}")
+            finally:
+                for _ in range(len(batch) + len(tasks)):
+                    self._queue.task_done()
+
+    def _resolve(self, conn, symbol, timeframe, ts, highs, lows):
+        rows = conn.execute(
+            "SELECT id, ts, price, action, entry, stop, target_1 FROM signals "
+            "WHERE symbol = ? AND timeframe = ? AND action IS NOT NULL AND outcome IS NULL AND ts < ?",
+            (symbol, timeframe, int(ts[-1]))
+        ).fetchall()
+        updates = []
+        for signal_id, signal_ts, price, action, entry, stop, target in rows:
+            if stop is None or target is None:
+                continue
+            start = np.searchsorted(ts, signal_ts, side='right')
+            h, l = highs[start:], lows[start:]
+            bars = np.arange(len(h))
+            # La entrada límite tiene que ejecutarse antes: en la vela de ejecución cuenta el stop
+            # pero no el target (no se sabe si se tocó antes), como en la simulación de niveles
+            if action == 'LONG':
+                immediate = entry is None or price is None or entry >= price
+                fill_hit = l <= entry if not immediate else None
+                stop_hit, target_hit = l <= stop, h >= target
+            else:
+                immediate = entry is None or price is None or entry <= price
+                fill_hit = h >= entry if not immediate else None
+                stop_hit, target_hit = h >= stop, l <= target
+            if not immediate:
+                if not fill_hit.any():
+                    continue
+                fill_bar = int(np.argmax(fill_hit))
+                stop_hit, target_hit = stop_hit & (bars >= fill_bar), target_hit & (bars > fill_bar)
+            first_stop = int(np.argmax(stop_hit)) if stop_hit.any() else None
+            first_target = int(np.argmax(target_hit)) if target_hit.any() else None
+            if first_stop is None and first_target is None:
+                continue
+            # Si ambos se tocan en la misma vela asumimos lo peor
+            if first_target is None or (first_stop is not None and first_stop <= first_target):
+                updates.append(('STOP', int(ts[start + first_stop]), signal_id))
+            else:
+                updates.append(('TARGET_1', int(ts[start + first_target]), signal_id))
+        if updates:
+            conn.executemany("UPDATE signals SET outcome = ?, outcome_ts = ? WHERE id = ?", updates)
+
+    # --- Consultas ---
+
+    def query(self, symbol=None, timeframe=None, signal=None, since_days=None, limit=1000):
+        clauses, params = [], []
+        if symbol:
+            clauses.append('symbol = ?')
+            params.append(symbol)
+        if timeframe:
+            clauses.append('timeframe = ?')
+            params.append(timeframe)
+        if signal:
+            clauses.append('signal = ?')
+            params.append(signal)
+        if since_days:
+            clauses.append('ts >= ?')
+            params.append(int((time.time() - since_days * 86400) * 1000))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        sql = f"SELECT * FROM signals {where} ORDER BY ts DESC LIMIT ?"
+        params.append(limit)
+        with closing(sqlite3.connect(self.path, timeout=30)) as conn:
+            df = pd.read_sql_query(sql, conn, params=params)
+        for column in ('ts', 'created_at', 'outcome_ts'):
+            df[column] = pd.to_datetime(df[column], unit='ms')
+        return df
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Diario compartido por todas las sesiones del proceso"""
+    global _journal
+    with _journal_lock:
+        if _journal is None:
+            _journal = SignalJournal()
+        return _journal
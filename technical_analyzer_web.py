@@ -1,12 +1,21 @@
 import pandas as pd
 import numpy as np
-import talib
 from binance_client_web import BinanceClient
+from indicator_registry_web import IndicatorContext, session_starts
+from metrics_web import METRICS, record_fallback
 
 class TechnicalAnalyzer:
     def __init__(self, df, symbol=None):
         self.df = self._clean_data(df)
         self.symbol = symbol
+        self._indicators = None
+
+    @property
+    def indicators(self):
+        # Caché de series compartida por todos los calculate_* de este análisis
+        if self._indicators is None:
+            self._indicators = IndicatorContext(self.df)
+        return self._indicators
 
     def _clean_data(self, df):
         if df is None or df.empty:
@@ -28,6 +37,7 @@ class TechnicalAnalyzer:
     def _get_default_analysis(self):
         current_price = float(self.df['close'].iloc[-1]) if not self.df.empty else 0
         return {
+            **self._get_default_indicators(),
             'current_price': current_price,
             'rsi': 50.0,
             'moving_averages': {
@@ -48,22 +58,27 @@ class TechnicalAnalyzer:
             'data_quality': f'INSUFICIENTE ({len(self.df)} registros)'
         }
 
+    @METRICS.timed('analyzer_seconds', method='calculate_rsi')
     def calculate_rsi(self, period=14):
         if not self._check_sufficient_data(period + 20):
+            record_fallback('calculate_rsi', 'datos_insuficientes')
             return 50.0
         try:
-            close_prices = self.df['close'].astype(float).values
-            rsi_values = talib.RSI(close_prices, timeperiod=period)
+            rsi_values = self.indicators.get('rsi', period)
             valid_rsi = rsi_values[~np.isnan(rsi_values)]
             if len(valid_rsi) == 0:
+                record_fallback('calculate_rsi', 'sin_valores')
                 return 50.0
             last_rsi = float(valid_rsi[-1])
             return last_rsi
         except Exception as e:
+            record_fallback('calculate_rsi', 'error')
             return 50.0
 
+    @METRICS.timed('analyzer_seconds', method='calculate_moving_averages')
     def calculate_moving_averages(self):
         if not self._check_sufficient_data(55):
+            record_fallback('calculate_moving_averages', 'datos_insuficientes')
             current_price = float(self.df['close'].iloc[-1]) if not self.df.empty else 0
             return {
                 'ema_10': current_price, 'ema_55': current_price, 'sma_20': current_price,
@@ -71,12 +86,11 @@ class TechnicalAnalyzer:
                 'price_vs_ema55': 0, 'price_vs_ema55_percent': 0
             }
         try:
-            close_prices = self.df['close'].astype(float).values
             current_price = float(self.df['close'].iloc[-1])
 
-            ema_10 = talib.EMA(close_prices, timeperiod=10)
-            ema_55 = talib.EMA(close_prices, timeperiod=55)
-            sma_20 = talib.SMA(close_prices, timeperiod=20)
+            ema_10 = self.indicators.get('ema', 10)
+            ema_55 = self.indicators.get('ema', 55)
+            sma_20 = self.indicators.get('sma', 20)
 
             ema_10_valid = ema_10[~np.isnan(ema_10)]
             ema_55_valid = ema_55[~np.isnan(ema_55)]
@@ -105,6 +119,7 @@ class TechnicalAnalyzer:
 
             return mas
         except Exception as e:
+            record_fallback('calculate_moving_averages', 'error')
             current_price = float(self.df['close'].iloc[-1]) if not self.df.empty else 0
             return {
                 'ema_10': current_price, 'ema_55': current_price, 'sma_20': current_price,
@@ -112,15 +127,18 @@ class TechnicalAnalyzer:
                 'price_vs_ema55': 0, 'price_vs_ema55_percent': 0
             }
 
+    @METRICS.timed('analyzer_seconds', method='calculate_volume_analysis')
     def calculate_volume_analysis(self):
         if not self._check_sufficient_data(20):
+            record_fallback('calculate_volume_analysis', 'datos_insuficientes')
             return {'volume_trend': 'NEUTRO', 'volume_ratio': 1.0}
         try:
-            volumes = self.df['volume'].astype(float).values
-            volume_sma = talib.SMA(volumes, timeperiod=20)
+            volumes = self.indicators.volume
+            volume_sma = self.indicators.get('volume_sma', 20)
             volume_sma_valid = volume_sma[~np.isnan(volume_sma)]
 
             if len(volume_sma_valid) == 0:
+                record_fallback('calculate_volume_analysis', 'sin_valores')
                 return {'volume_trend': 'NEUTRO', 'volume_ratio': 1.0}
 
             current_volume = volumes[-1]
@@ -138,10 +156,13 @@ class TechnicalAnalyzer:
 
             return {'volume_trend': volume_trend, 'volume_ratio': volume_ratio}
         except Exception as e:
+            record_fallback('calculate_volume_analysis', 'error')
             return {'volume_trend': 'NEUTRO', 'volume_ratio': 1.0}
 
+    @METRICS.timed('analyzer_seconds', method='analyze_trend')
     def analyze_trend(self):
         if not self._check_sufficient_data(50):
+            record_fallback('analyze_trend', 'datos_insuficientes')
             return "INDETERMINADA", 0.0, "DATOS INSUFICIENTES"
         try:
             closes = self.df['close'].astype(float)
@@ -166,38 +187,37 @@ class TechnicalAnalyzer:
 
             return trend, long_trend, strength
         except Exception as e:
+            record_fallback('analyze_trend', 'error')
             return "ERROR", 0.0, "ERROR"
 
+    @METRICS.timed('analyzer_seconds', method='calculate_squeeze_momentum')
     def calculate_squeeze_momentum(self, bb_length=20, bb_mult=2.0, kc_length=20, kc_mult=1.5):
         if not self._check_sufficient_data(max(bb_length, kc_length) + 20):
+            record_fallback('calculate_squeeze_momentum', 'datos_insuficientes')
             return {'squeeze_value': 0, 'squeeze_status': 'NO_SQUEEZE', 'momentum_trend': 'NEUTRO'}
         try:
-            close_prices = self.df['close'].astype(float).values
-            high_prices = self.df['high'].astype(float).values
-            low_prices = self.df['low'].astype(float).values
+            close_prices = self.indicators.close
 
-            basis = talib.SMA(close_prices, timeperiod=bb_length)
-            dev = bb_mult * talib.STDDEV(close_prices, timeperiod=bb_length)
-            upper_bb = basis + dev
-            lower_bb = basis - dev
+            bollinger = self.indicators.get('bollinger', bb_length, bb_mult)
+            upper_bb = bollinger['upper']
+            lower_bb = bollinger['lower']
 
-            kc_ma = talib.SMA(close_prices, timeperiod=kc_length)
-            tr = talib.TRANGE(high_prices, low_prices, close_prices)
-            range_ma = talib.SMA(tr, timeperiod=kc_length)
-            upper_kc = kc_ma + range_ma * kc_mult
-            lower_kc = kc_ma - range_ma * kc_mult
+            keltner = self.indicators.get('keltner', kc_length, kc_mult)
+            upper_kc = keltner['upper']
+            lower_kc = keltner['lower']
 
             squeeze_on = (lower_bb > lower_kc) & (upper_bb < upper_kc)
             squeeze_off = (lower_bb < lower_kc) & (upper_bb > upper_kc)
 
-            hl_avg = (talib.MAX(high_prices, kc_length) + talib.MIN(low_prices, kc_length)) / 2
+            hl_avg = (self.indicators.get('highest', kc_length) + self.indicators.get('lowest', kc_length)) / 2
             price_avg = (close_prices + hl_avg) / 2
-            momentum = talib.LINEARREG(close_prices - price_avg, timeperiod=kc_length)
+            momentum = self.indicators.backend.LINEARREG(close_prices - price_avg, timeperiod=kc_length)
 
             momentum_valid = momentum[~np.isnan(momentum)]
             squeeze_on_valid = squeeze_on[~np.isnan(squeeze_on)]
 
             if len(momentum_valid) == 0:
+                record_fallback('calculate_squeeze_momentum', 'sin_valores')
                 return {'squeeze_value': 0, 'squeeze_status': 'NO_SQUEEZE', 'momentum_trend': 'NEUTRO'}
 
             current_momentum = float(momentum_valid[-1])
@@ -227,28 +247,28 @@ class TechnicalAnalyzer:
                 'momentum_trend': momentum_trend
             }
         except Exception as e:
+            record_fallback('calculate_squeeze_momentum', 'error')
             return {'squeeze_value': 0, 'squeeze_status': 'ERROR', 'momentum_trend': 'NEUTRO'}
 
+    @METRICS.timed('analyzer_seconds', method='calculate_adx')
     def calculate_adx(self, di_length=14, adx_length=14, key_level=23):
         if not self._check_sufficient_data(max(di_length, adx_length) + 20):
+            record_fallback('calculate_adx', 'datos_insuficientes')
             return {
                 'adx': 0, 'plus_di': 0, 'minus_di': 0, 'trend_strength': 'DEBIL',
                 'above_key_level': False, 'trend_direction': 'NEUTRAL'
             }
         try:
-            high_prices = self.df['high'].astype(float).values
-            low_prices = self.df['low'].astype(float).values
-            close_prices = self.df['close'].astype(float).values
-
-            adx = talib.ADX(high_prices, low_prices, close_prices, timeperiod=adx_length)
-            plus_di = talib.PLUS_DI(high_prices, low_prices, close_prices, timeperiod=di_length)
-            minus_di = talib.MINUS_DI(high_prices, low_prices, close_prices, timeperiod=di_length)
+            adx = self.indicators.get('dmi', adx_length)['adx']
+            plus_di = self.indicators.get('dmi', di_length)['plus_di']
+            minus_di = self.indicators.get('dmi', di_length)['minus_di']
 
             adx_valid = adx[~np.isnan(adx)]
             plus_di_valid = plus_di[~np.isnan(plus_di)]
             minus_di_valid = minus_di[~np.isnan(minus_di)]
 
             if len(adx_valid) == 0:
+                record_fallback('calculate_adx', 'sin_valores')
                 return {
                     'adx': 0, 'plus_di': 0, 'minus_di': 0, 'trend_strength': 'DEBIL',
                     'above_key_level': False, 'trend_direction': 'NEUTRAL'
@@ -283,13 +303,219 @@ class TechnicalAnalyzer:
                 'trend_direction': trend_direction
             }
         except Exception as e:
+            record_fallback('calculate_adx', 'error')
             return {
                 'adx': 0, 'plus_di': 0, 'minus_di': 0, 'trend_strength': 'DEBIL',
                 'above_key_level': False, 'trend_direction': 'NEUTRAL'
             }
 
+    def _last_valid(self, values, default=0.0):
+        valid = values[~np.isnan(values)]
+        return float(valid[-1]) if len(valid) > 0 else default
+
+    def _get_default_indicators(self):
+        current_price = float(self.df['close'].iloc[-1]) if not self.df.empty else 0
+        return {
+            'macd': {'macd': 0, 'signal': 0, 'histogram': 0, 'macd_trend': 'NEUTRO'},
+            'bollinger': {
+                'upper': current_price, 'lower': current_price, 'percent_b': 0.5,
+                'bandwidth': 0, 'position': 'DENTRO'
+            },
+            'atr': {'atr': 0, 'atr_percent': 0, 'long_stop': current_price, 'short_stop': current_price},
+            'vwap': {'vwap': current_price, 'price_vs_vwap_percent': 0, 'position': 'EN_VWAP', 'anchor': 'SESION'},
+            'ichimoku': {
+                'tenkan': current_price, 'kijun': current_price, 'senkou_a': current_price,
+                'senkou_b': current_price, 'cloud_position': 'INDETERMINADO'
+            },
+            'obv': {'obv': 0, 'obv_trend': 'NEUTRO'},
+            'stoch_rsi': {'k': 50.0, 'd': 50.0, 'level': 'NEUTRO'}
+        }
+
+    @METRICS.timed('analyzer_seconds', method='calculate_macd')
+    def calculate_macd(self, fast=12, slow=26, signal=9):
+        if not self._check_sufficient_data(slow + signal):
+            record_fallback('calculate_macd', 'datos_insuficientes')
+            return self._get_default_indicators()['macd']
+        try:
+            macd = self.indicators.get('macd', fast, slow, signal)
+            histogram = macd['histogram'][~np.isnan(macd['histogram'])]
+            if len(histogram) == 0:
+                record_fallback('calculate_macd', 'sin_valores')
+                return self._get_default_indicators()['macd']
+
+            current_hist = float(histogram[-1])
+            prev_hist = float(histogram[-2]) if len(histogram) > 1 else current_hist
+            if current_hist > 0:
+                macd_trend = "CRUCE_ALCISTA" if prev_hist <= 0 else "ALCISTA"
+            elif current_hist < 0:
+                macd_trend = "CRUCE_BAJISTA" if prev_hist >= 0 else "BAJISTA"
+            else:
+                macd_trend = "NEUTRO"
+
+            return {
+                'macd': self._last_valid(macd['macd']),
+                'signal': self._last_valid(macd['signal']),
+                'histogram': current_hist,
+                'macd_trend': macd_trend
+            }
+        except Exception as e:
+            record_fallback('calculate_macd', 'error')
+            return self._get_default_indicators()['macd']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_bollinger')
+    def calculate_bollinger(self, length=20, mult=2.0):
+        if not self._check_sufficient_data(length):
+            record_fallback('calculate_bollinger', 'datos_insuficientes')
+            return self._get_default_indicators()['bollinger']
+        try:
+            bands = self.indicators.get('bollinger', length, mult)
+            percent_b = self._last_valid(bands['percent_b'], 0.5)
+
+            if percent_b > 1:
+                position = "SOBRE_BANDA_SUPERIOR"
+            elif percent_b < 0:
+                position = "BAJO_BANDA_INFERIOR"
+            else:
+                position = "DENTRO"
+
+            return {
+                'upper': self._last_valid(bands['upper']),
+                'lower': self._last_valid(bands['lower']),
+                'percent_b': percent_b,
+                'bandwidth': self._last_valid(bands['bandwidth']),
+                'position': position
+            }
+        except Exception as e:
+            record_fallback('calculate_bollinger', 'error')
+            return self._get_default_indicators()['bollinger']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_atr_stops')
+    def calculate_atr_stops(self, period=14, mult=2.0):
+        if not self._check_sufficient_data(period + 1):
+            record_fallback('calculate_atr_stops', 'datos_insuficientes')
+            return self._get_default_indicators()['atr']
+        try:
+            stops = self.indicators.get('atr_stops', period, mult)
+            atr = self._last_valid(stops['atr'])
+            current_price = float(self.indicators.close[-1])
+            return {
+                'atr': atr,
+                'atr_percent': atr / current_price * 100 if current_price > 0 else 0,
+                'long_stop': self._last_valid(stops['long_stop'], current_price),
+                'short_stop': self._last_valid(stops['short_stop'], current_price)
+            }
+        except Exception as e:
+            record_fallback('calculate_atr_stops', 'error')
+            return self._get_default_indicators()['atr']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_vwap')
+    def calculate_vwap(self):
+        if self.df.empty:
+            record_fallback('calculate_vwap', 'datos_insuficientes')
+            return self._get_default_indicators()['vwap']
+        try:
+            current_price = float(self.indicators.close[-1])
+            vwap = self._last_valid(self.indicators.get('vwap'), current_price)
+            diff_percent = (current_price - vwap) / vwap * 100 if vwap > 0 else 0
+
+            if abs(diff_percent) < 0.1:
+                position = "EN_VWAP"
+            elif diff_percent > 0:
+                position = "SOBRE_VWAP"
+            else:
+                position = "BAJO_VWAP"
+
+            # En 1d/1w/1M no hay sesión intradía: el VWAP es el de toda la ventana analizada
+            _, anchored = session_starts(self.indicators.timestamp, len(self.indicators.close))
+            return {'vwap': vwap, 'price_vs_vwap_percent': diff_percent, 'position': position,
+                    'anchor': 'VENTANA' if anchored else 'SESION'}
+        except Exception as e:
+            record_fallback('calculate_vwap', 'error')
+            return self._get_default_indicators()['vwap']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_ichimoku')
+    def calculate_ichimoku(self, tenkan=9, kijun=26, senkou=52):
+        if not self._check_sufficient_data(senkou + kijun):
+            record_fallback('calculate_ichimoku', 'datos_insuficientes')
+            return self._get_default_indicators()['ichimoku']
+        try:
+            ichimoku = self.indicators.get('ichimoku', tenkan, kijun, senkou)
+            current_price = float(self.indicators.close[-1])
+            senkou_a = ichimoku['senkou_a'][-1]
+            senkou_b = ichimoku['senkou_b'][-1]
+
+            if np.isnan(senkou_a) or np.isnan(senkou_b):
+                cloud_position = "INDETERMINADO"
+            elif current_price > max(senkou_a, senkou_b):
+                cloud_position = "SOBRE_NUBE"
+            elif current_price < min(senkou_a, senkou_b):
+                cloud_position = "BAJO_NUBE"
+            else:
+                cloud_position = "DENTRO_NUBE"
+
+            return {
+                'tenkan': self._last_valid(ichimoku['tenkan'], current_price),
+                'kijun': self._last_valid(ichimoku['kijun'], current_price),
+                'senkou_a': self._last_valid(ichimoku['senkou_a'], current_price),
+                'senkou_b': self._last_valid(ichimoku['senkou_b'], current_price),
+                'cloud_position': cloud_position
+            }
+        except Exception as e:
+            record_fallback('calculate_ichimoku', 'error')
+            return self._get_default_indicators()['ichimoku']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_obv')
+    def calculate_obv(self, lookback=20):
+        if not self._check_sufficient_data(lookback):
+            record_fallback('calculate_obv', 'datos_insuficientes')
+            return self._get_default_indicators()['obv']
+        try:
+            obv = self.indicators.get('obv')
+            window = obv[-lookback:]
+            # Pendiente (mínimos cuadrados) normalizada por el volumen medio del periodo
+            x = np.arange(len(window)) - (len(window) - 1) / 2
+            slope = np.dot(x, window - window.mean()) / np.dot(x, x)
+            avg_volume = self.indicators.volume[-lookback:].mean()
+            relative_slope = slope / avg_volume if avg_volume > 0 else 0
+
+            if relative_slope > 0.1:
+                obv_trend = "ACUMULACION"
+            elif relative_slope < -0.1:
+                obv_trend = "DISTRIBUCION"
+            else:
+                obv_trend = "NEUTRO"
+
+            return {'obv': float(obv[-1]), 'obv_trend': obv_trend}
+        except Exception as e:
+            record_fallback('calculate_obv', 'error')
+            return self._get_default_indicators()['obv']
+
+    @METRICS.timed('analyzer_seconds', method='calculate_stoch_rsi')
+    def calculate_stoch_rsi(self, rsi_period=14, stoch_period=14, k=3, d=3):
+        if not self._check_sufficient_data(rsi_period + stoch_period + k + d):
+            record_fallback('calculate_stoch_rsi', 'datos_insuficientes')
+            return self._get_default_indicators()['stoch_rsi']
+        try:
+            stoch = self.indicators.get('stoch_rsi', rsi_period, stoch_period, k, d)
+            k_value = self._last_valid(stoch['k'], 50.0)
+            d_value = self._last_valid(stoch['d'], 50.0)
+
+            if k_value > 80:
+                level = "SOBRECOMPRA"
+            elif k_value < 20:
+                level = "SOBREVENTA"
+            else:
+                level = "NEUTRO"
+
+            return {'k': k_value, 'd': d_value, 'level': level}
+        except Exception as e:
+            record_fallback('calculate_stoch_rsi', 'error')
+            return self._get_default_indicators()['stoch_rsi']
+
+    @METRICS.timed('analyzer_seconds', method='full_analysis')
     def full_analysis(self):
         if not self._check_sufficient_data(100):
+            record_fallback('full_analysis', 'datos_insuficientes')
             return self._get_default_analysis()
         try:
             current_price = float(self.df['close'].iloc[-1])
@@ -299,6 +525,13 @@ class TechnicalAnalyzer:
             trend, trend_percentage, trend_strength = self.analyze_trend()
             squeeze = self.calculate_squeeze_momentum()
             adx = self.calculate_adx()
+            macd = self.calculate_macd()
+            bollinger = self.calculate_bollinger()
+            atr = self.calculate_atr_stops()
+            vwap = self.calculate_vwap()
+            ichimoku = self.calculate_ichimoku()
+            obv = self.calculate_obv()
+            stoch_rsi = self.calculate_stoch_rsi()
 
             return {
                 'current_price': current_price,
@@ -310,7 +543,15 @@ class TechnicalAnalyzer:
                 'trend_strength': trend_strength,
                 'squeeze_momentum': squeeze,
                 'adx': adx,
+                'macd': macd,
+                'bollinger': bollinger,
+                'atr': atr,
+                'vwap': vwap,
+                'ichimoku': ichimoku,
+                'obv': obv,
+                'stoch_rsi': stoch_rsi,
                 'data_quality': f"EXCELENTE ({len(self.df)} registros)" if len(self.df) >= 100 else f"BUENA ({len(self.df)} registros)"
             }
         except Exception as e:
+            record_fallback('full_analysis', 'error')
             return self._get_default_analysis()
\ No newline at end of file
@@ -0,0 +1,176 @@
+import time
+import threading
+import ccxt
+import pytest
+from metrics_web import METRICS
+from multi_exchange_web import ExchangeAggregator
+
+HOUR = 3_600_000
+
+
+class FakeExchange:
+    """Exchange ccxt de mentira: precios fijos, latencia y errores configurables"""
+
+    def __init__(self, name, price, volume=10.0, delay=0.0, error=None, depth=None):
+        self.name = name
+        self.price = price
+        self.volume = volume
+        self.delay = delay
+        self.error = error
+        self.depth = depth
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _request(self, method):
+        with self._lock:
+            self.calls.append(method)
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(self.delay)
+            if self.error is not None:
+                raise self.error
+        finally:
+            with self._lock:
+                self.active -= 1
+
+    def fetch_ohlcv(self, symbol, timeframe='1h', since=None, limit=None):
+        self._request('fetch_ohlcv')
+        p = self.price
+        return [[i * HOUR, p, p * 1.01, p * 0.99, p, self.volume] for i in range(3)]
+
+    def fetch_ticker(self, symbol):
+        self._request('fetch_ticker')
+        p = self.price
+        return {'symbol': symbol, 'timestamp': 1, 'last': p, 'bid': p - 0.5, 'ask': p + 0.5,
+                'high': p * 1.01, 'low': p * 0.99, 'baseVolume': self.volume, 'quoteVolume': self.volume * p}
+
+    def fetch_order_book(self, symbol, limit=None):
+        self._request('fetch_order_book')
+        return {'bids': self.depth or [[self.price - 1, 1.0]], 'asks': [[self.price + 1, 1.0]], 'venue': self.name}
+
+    def fetch_tickers(self, symbols=None):
+        self._request('fetch_tickers')
+        return {'BTC/USDT': {'last': self.price, 'venue': self.name}}
+
+    def load_markets(self, reload=False):
+        self._request('load_markets')
+        return {'BTC/USDT': {'venue': self.name}}
+
+
+def aggregator(*exchanges, **kwargs):
+    kwargs.setdefault('timeout', 2.0)
+    return ExchangeAggregator({e.name: e for e in exchanges}, **kwargs)
+
+
+def test_composite_ohlcv_weights_by_volume():
+    agg = aggregator(FakeExchange('a', 100.0, volume=30.0), FakeExchange('b', 101.0, volume=10.0),
+                     straggler_wait=1.0)
+    candles = agg.fetch_ohlcv('BTC/USDT', '1h', limit=2)
+    assert len(candles) == 2
+    ts, _, _, _, close, volume = candles[-1]
+    assert ts == 2 * HOUR
+    assert close == pytest.approx((100.0 * 30 + 101.0 * 10) / 40)
+    assert volume == pytest.approx(40.0)
+
+
+def test_bad_print_is_discarded():
+    agg = aggregator(FakeExchange('a', 100.0), FakeExchange('b', 100.5), FakeExchange('c', 150.0),
+                     straggler_wait=1.0)
+    ticker = agg.fetch_ticker('BTC/USDT')
+    # Ponderado por volumen en quote
+    assert ticker['last'] == pytest.approx((100.0 * 1000 + 100.5 * 1005) / 2005)
+    assert ticker['info']['venues'] == ['a', 'b']
+
+
+def test_composite_ticker_merges_top_of_book():
+    agg = aggregator(FakeExchange('a', 100.0, volume=5.0), FakeExchange('b', 100.4, volume=15.0),
+                     straggler_wait=1.0)
+    ticker = agg.fetch_ticker('BTC/USDT')
+    # Mejor bid y mejor ask entre los exchanges; volúmenes sumados
+    assert ticker['bid'] == pytest.approx(99.9)
+    assert ticker['ask'] == pytest.approx(100.5)
+    assert ticker['baseVolume'] == pytest.approx(20.0)
+
+
+def test_fan_out_survives_a_venue_down():
+    down = FakeExchange('a', 100.0, error=ccxt.NetworkError('caído'))
+    agg = aggregator(down, FakeExchange('b', 101.0), straggler_wait=1.0)
+    assert agg.fetch_ticker('BTC/USDT')['last'] == pytest.approx(101.0)
+    # El caído queda fuera de la rotación durante el cooldown
+    assert agg.ranked() == ['b', 'a']
+    agg.fetch_ticker('BTC/USDT')
+    assert down.calls.count('fetch_ticker') == 1
+
+
+def test_straggler_is_not_awaited():
+    slow = FakeExchange('slow', 100.0, delay=1.0)
+    agg = aggregator(FakeExchange('fast', 100.0), slow, straggler_wait=0.05)
+    start = time.monotonic()
+    ticker = agg.fetch_ticker('BTC/USDT')
+    assert time.monotonic() - start < 0.5
+    assert ticker['info']['venues'] == ['fast']
+
+
+def test_order_book_fails_over():
+    agg = aggregator(FakeExchange('a', 100.0, error=ccxt.ExchangeNotAvailable('mantenimiento')),
+                     FakeExchange('b', 100.0))
+    assert agg.fetch_order_book('BTC/USDT')['venue'] == 'b'
+    assert agg.fetch_order_book('BTC/USDT')['venue'] == 'b'
+
+
+def test_failover_raises_when_all_fail():
+    agg = aggregator(FakeExchange('a', 100.0, error=ccxt.NetworkError('a')),
+                     FakeExchange('b', 100.0, error=ccxt.NetworkError('b')))
+    with pytest.raises(ccxt.NetworkError):
+        agg.fetch_order_book('BTC/USDT')
+
+
+def test_latency_ordering():
+    slow, fast = FakeExchange('slow', 100.0, delay=0.05), FakeExchange('fast', 100.0)
+    agg = aggregator(slow, fast)
+    # Sin latencias medidas se respeta el orden de configuración
+    assert agg.ranked() == ['slow', 'fast']
+    agg.fetch_order_book('BTC/USDT')
+    # Los aún no medidos van antes que los medidos, para medirlos
+    assert agg.ranked() == ['fast', 'slow']
+    agg.fetch_order_book('BTC/USDT')
+    assert agg.ranked() == ['fast', 'slow']
+    agg.fetch_order_book('BTC/USDT')
+    assert fast.calls.count('fetch_order_book') == 2
+    assert slow.calls.count('fetch_order_book') == 1
+
+
+def test_markets_and_tickers_pinned_to_primary():
+    primary = FakeExchange('binance', 100.0, error=ccxt.NetworkError('caído'))
+    agg = aggregator(primary, FakeExchange('okx', 100.0))
+    with pytest.raises(ccxt.NetworkError):
+        agg.load_markets()
+    with pytest.raises(ccxt.NetworkError):
+        agg.fetch_tickers()
+    primary.error = None
+    assert agg.load_markets()['BTC/USDT']['venue'] == 'binance'
+    assert agg.fetch_tickers()['BTC/USDT']['venue'] == 'binance'
+
+
+def test_venue_timers_join_the_request_trace(monkeypatch):
+    monkeypatch.setattr(METRICS, 'tracing_enabled', True)
+    agg = aggregator(FakeExchange('a', 100.0), FakeExchange('b', 100.0), straggler_wait=1.0)
+    with METRICS.trace('analysis') as trace:
+        agg.fetch_ticker('BTC/USDT')
+    venues = sorted(s['labels']['exchange'] for s in trace['spans'] if s['metric'] == 'exchange_venue_seconds')
+    assert venues == ['a', 'b']
+
+
+def test_one_call_at_a_time_per_venue():
+    venue = FakeExchange('a', 100.0, delay=0.02)
+    agg = aggregator(venue)
+    threads = [threading.Thread(target=agg.fetch_order_book, args=('BTC/USDT',)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(venue.calls) == 6
+    assert venue.max_active == 1
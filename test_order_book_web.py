@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+from order_book_web import OrderBook, BookSide, DepthAnalyzer
+
+
+def reference(levels, book=None):
+    book = {} if book is None else book
+    for price, size in levels:
+        if size > 0:
+            book[price] = size
+        else:
+            book.pop(price, None)
+    return book
+
+
+def live(prices, sizes):
+    keep = sizes > 0
+    return dict(zip(prices[keep].tolist(), sizes[keep].tolist()))
+
+
+def random_diff(rng, center, n):
+    prices = np.round(center + rng.normal(0, 5, n), 1)
+    sizes = np.where(rng.random(n) < 0.4, 0.0, np.round(rng.random(n) * 10, 3))
+    return np.column_stack([prices, sizes]).tolist()
+
+
+@pytest.mark.parametrize('center', [90.0, 100.0, 110.0])
+def test_side_matches_reference(center):
+    rng = np.random.default_rng(7)
+    snapshot = [[p, 1.0] for p in np.round(np.arange(80, 120, 0.5), 1)]
+    side, expected = BookSide(snapshot), reference(snapshot)
+    for _ in range(500):
+        diff = random_diff(rng, center, int(rng.integers(1, 20)))
+        side.apply(diff)
+        reference(diff, expected)
+        prices, sizes = side.prices, side.sizes
+        assert np.all(np.diff(prices) > 0)
+        assert side.empty == len(sizes) - np.count_nonzero(sizes)
+    assert live(side.prices, side.sizes) == expected
+
+
+def test_last_update_for_a_price_wins():
+    side = BookSide([[100.0, 1.0]])
+    side.apply([[101.0, 2.0], [101.0, 0.0], [100.0, 0.0], [100.0, 3.0]])
+    assert live(side.prices, side.sizes) == {100.0: 3.0}
+
+
+def test_deleted_levels_are_compacted():
+    side = BookSide([[float(p), 1.0] for p in range(100)])
+    side.apply([[float(p), 0.0] for p in range(30)])
+    assert len(side) == 70 and side.empty == 0
+
+
+def test_inserts_grow_the_buffer():
+    side = BookSide([])
+    for p in range(1000):
+        side.apply([[float(p), 1.0], [float(-p - 1), 1.0]])
+    assert len(side) == 2000
+    assert np.all(np.diff(side.prices) > 0)
+
+
+def test_apply_diff_sequence():
+    book = OrderBook([[99.0, 1.0]], [[101.0, 1.0]], last_update_id=10)
+    assert book.apply_diff([[99.5, 2.0]], [], first_update_id=11, final_update_id=12)
+    assert book.best_bid() == 99.5
+    # Diff antiguo: se ignora
+    assert book.apply_diff([[99.5, 0.0]], [], first_update_id=5, final_update_id=9)
+    assert book.best_bid() == 99.5
+    # Salto en la secuencia: hace falta un snapshot nuevo
+    assert not book.apply_diff([], [[100.5, 1.0]], first_update_id=20, final_update_id=21)
+    assert book.needs_resync and book.best_ask() == 101.0
+
+
+def test_depth_on_updated_book():
+    book = OrderBook([[99.0, 1.0], [98.0, 2.0]], [[101.0, 1.0], [102.0, 2.0]])
+    book.apply_diff([[99.0, 0.0]], [[100.5, 1.0]])
+    depth = DepthAnalyzer(book)
+    assert book.best_bid() == 98.0 and book.best_ask() == 100.5
+    result = depth.slippage('buy', 2.0)
+    assert result['avg_price'] == pytest.approx(100.75)
+    assert result['complete']
@@ -0,0 +1,131 @@
+import time
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from shared_cache_web import (SharedCache, MemoryBackend, dumps, loads, next_candle_close,
+                              candle_close_expiry, CLOSE_GRACE)
+
+
+@pytest.fixture
+def cache():
+    return SharedCache(MemoryBackend(), lease=5.0, poll_interval=0.01)
+
+
+def in_threads(target, n=4):
+    results = [None] * n
+
+    def run(i):
+        results[i] = target()
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_single_flight(cache):
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'value': 42}
+
+    results = in_threads(lambda: cache.get_or_compute('k', compute, time.time() + 60))
+    assert len(calls) == 1
+    assert results == [{'value': 42}] * 4
+
+
+def test_waiters_stop_when_holder_fails(cache):
+    started = threading.Event()
+
+    def failing():
+        started.set()
+        time.sleep(0.1)
+        raise RuntimeError('exchange caído')
+
+    def holder():
+        with pytest.raises(RuntimeError):
+            cache.get_or_compute('k', failing, time.time() + 60)
+
+    thread = threading.Thread(target=holder)
+    thread.start()
+    started.wait()
+    start = time.monotonic()
+    # Sin esperar al final del lease (5 s): en cuanto el lock desaparece se calcula aquí
+    assert cache.get_or_compute('k', lambda: 'ok', time.time() + 60) == 'ok'
+    assert time.monotonic() - start < 1.0
+    thread.join()
+
+
+def test_none_is_not_cached(cache):
+    calls = []
+    cache.get_or_compute('k', lambda: calls.append(1), time.time() + 60)
+    assert cache.get_or_compute('k', lambda: 'ok', time.time() + 60) == 'ok'
+    assert len(calls) == 1
+
+
+def test_expiry_serves_stale_while_refreshing(cache):
+    cache.set('k', 'viejo', time.time() + 0.05)
+    assert cache.get('k') == 'viejo'
+    time.sleep(0.1)
+    assert cache.get('k') is None
+    # Otro proceso está refrescando: mientras tanto se sirve el valor anterior
+    cache.backend.add(cache._key('lock:k'), b'otro', 5.0)
+    assert cache.get_or_compute('k', lambda: 'nuevo', time.time() + 60) == 'viejo'
+
+
+def test_memory_backend_ttl():
+    backend = MemoryBackend()
+    backend.set('k', b'v', 0.05)
+    assert not backend.add('k', b'w', 1.0)
+    time.sleep(0.1)
+    assert backend.get('k') is None
+    assert backend.add('k', b'w', 1.0)
+    backend.delete('k', expected=b'otro')
+    assert backend.get('k') == b'w'
+    backend.delete('k', expected=b'w')
+    assert backend.get('k') is None
+
+
+def test_refresh_ignores_cached_value(cache):
+    cache.get_or_compute('k', lambda: 1, time.time() + 60)
+    assert cache.get_or_compute('k', lambda: 2, time.time() + 60) == 1
+    assert cache.get_or_compute('k', lambda: 2, time.time() + 60, refresh=True) == 2
+    assert cache.get('k') == 2
+
+
+def test_json_round_trip():
+    value = [pd.Timestamp('2024-01-01 12:00'), {'rsi': np.float64(55.5), 'levels': np.array([1.0, 2.0])}, None]
+    expires_at, loaded = loads(dumps(123.5, value))
+    assert expires_at == 123.5
+    assert loaded == [pd.Timestamp('2024-01-01 12:00'), {'rsi': 55.5, 'levels': [1.0, 2.0]}, None]
+
+
+def test_arrow_round_trip():
+    df = pd.DataFrame({
+        'timestamp': pd.date_range('2024-01-01', periods=3, freq='1h'),
+        'close': [1.0, np.nan, 3.0],
+        'quality': ['ok', 'missing', 'ok']
+    })
+    _, loaded = loads(dumps(0.0, df))
+    pd.testing.assert_frame_equal(loaded, df, check_dtype=False)
+
+
+def test_bytes_round_trip():
+    assert loads(dumps(0.0, b'\x00arrow'))[1] == b'\x00arrow'
+
+
+def test_unknown_format_is_ignored():
+    assert loads(dumps(0.0, 1)[:8] + b'P\x80') is None
+
+
+def test_candle_close_expiry():
+    now = 1_700_000_100.0
+    close = next_candle_close('1h', now)
+    assert close % 3600 == 0 and 0 < close - now <= 3600
+    assert candle_close_expiry('1h', max_age=10_000, now=now) == close + CLOSE_GRACE
+    assert candle_close_expiry('1d', max_age=60, now=now) == now + 60
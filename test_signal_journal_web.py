@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import pytest
+from signal_journal_web import SignalJournal, build_entry
+
+START = pd.Timestamp('2024-01-01')
+ANALYSIS = {
+    'current_price': 100.0,
+    'rsi': 55.0,
+    'adx': {'adx': 30.0},
+    'moving_averages': {'ema_cross_status': 'ALCISTA'},
+    'trend': 'ALCISTA'
+}
+LONG = {'action': 'LONG', 'entry': 99.0, 'stop': 97.0, 'target_1': 103.0, 'target_2': 105.0}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return SignalJournal(str(tmp_path / 'journal.db'), flush_interval=0.01)
+
+
+def record(journal, levels=None, ts=START, signal='COMPRA'):
+    journal.record(build_entry(ANALYSIS, 'BTC/USDT', '1h', ts, signal, 70.0, 30.0, levels))
+    journal.flush()
+
+
+def candles(highs, lows):
+    """Velas horarias a partir de la siguiente a la señal"""
+    return pd.DataFrame({
+        'timestamp': pd.date_range(START + pd.Timedelta(hours=1), periods=len(highs), freq='1h'),
+        'high': np.asarray(highs, dtype=float),
+        'low': np.asarray(lows, dtype=float)
+    })
+
+
+def resolve(journal, highs, lows):
+    journal.resolve_outcomes('BTC/USDT', '1h', candles(highs, lows))
+    journal.flush()
+    return journal.query().iloc[0]
+
+
+def test_record_and_query(journal):
+    record(journal, LONG)
+    record(journal, ts=START + pd.Timedelta(hours=1), signal='VENTA')
+    df = journal.query()
+    assert len(df) == 2
+    assert df['ts'].iloc[0] == START + pd.Timedelta(hours=1)
+    assert journal.query(signal='COMPRA')['stop'].tolist() == [97.0]
+    assert journal.query(timeframe='4h').empty
+
+
+def test_rerecord_without_levels_keeps_levels(journal):
+    record(journal, LONG)
+    record(journal, None)
+    row = journal.query().iloc[0]
+    assert row['action'] == 'LONG'
+    assert (row['entry'], row['stop'], row['target_1']) == (99.0, 97.0, 103.0)
+
+
+def test_changed_levels_reset_outcome(journal):
+    record(journal, LONG)
+    assert resolve(journal, [101, 104], [98.5, 100])['outcome'] == 'TARGET_1'
+    record(journal, None)
+    assert journal.query().iloc[0]['outcome'] == 'TARGET_1'
+    record(journal, dict(LONG, stop=96.0))
+    row = journal.query().iloc[0]
+    assert row['outcome'] is None and row['stop'] == 96.0
+
+
+def test_target_before_fill_is_ignored(journal):
+    record(journal, LONG)
+    # Toca el target sin haber bajado nunca a la entrada (99)
+    row = resolve(journal, [104, 104], [100, 100])
+    assert row['outcome'] is None
+
+
+def test_target_after_fill(journal):
+    record(journal, LONG)
+    # Vela 0: ejecuta en 99 y llega a 104 (no cuenta); vela 1: target
+    row = resolve(journal, [104, 103.5], [98.5, 100])
+    assert row['outcome'] == 'TARGET_1'
+    assert row['outcome_ts'] == START + pd.Timedelta(hours=2)
+
+
+def test_stop_on_fill_bar(journal):
+    record(journal, LONG)
+    row = resolve(journal, [100, 104], [96.5, 100])
+    assert row['outcome'] == 'STOP'
+    assert row['outcome_ts'] == START + pd.Timedelta(hours=1)
+
+
+def test_marketable_entry_fills_immediately(journal):
+    record(journal, dict(LONG, entry=100.0))
+    row = resolve(journal, [103.5], [99.5])
+    assert row['outcome'] == 'TARGET_1'
+
+
+def test_short_limit_entry(journal):
+    record(journal, {'action': 'SHORT', 'entry': 101.0, 'stop': 103.0, 'target_1': 97.0, 'target_2': None})
+    assert resolve(journal, [100, 100], [96, 96])['outcome'] is None
+    assert resolve(journal, [101.5, 100], [99, 96.5])['outcome'] == 'TARGET_1'